@@ -0,0 +1,197 @@
+import asyncio
+import collections
+import time
+
+from starlette.responses import PlainTextResponse
+from starlette.routing import Match
+
+from metrics import FIRESTORE_OPERATIONS, FIRESTORE_STREAMING_OPERATIONS
+
+# How much the estimate of how long a slot is held moves towards each new measurement
+SERVICE_TIME_WEIGHT = 0.2
+
+
+# Raised by Limiter.acquire when a caller is turned away. reason is 'queue_full' when too many were already waiting
+# and 'deadline' when it waited too long or would have
+class Overloaded(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# Lets at most `limit` callers in at a time and makes the rest wait in line, first come first served. With queue_size
+# set, a caller that finds that many already waiting is turned away at once. With timeout set, a caller is turned away
+# once it has waited that many seconds, or straight away if the time slots have been held for lately says it would.
+# A limiter belongs to one worker, its counters are read for the metrics
+class Limiter:
+    def __init__(self, limit, queue_size=None, timeout=None):
+        self.limit = max(int(limit), 1)
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.admitted = 0
+        self.shed = {'queue_full': 0, 'deadline': 0}
+        self.wait_seconds = 0.0
+        self.service_time = None
+        self._waiters = collections.deque()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    # Wait for a slot. Returns how long it waited
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return 0.0
+        if self.queue_size is not None and len(self._waiters) >= self.queue_size:
+            self.shed['queue_full'] += 1
+            raise Overloaded('queue_full')
+        if self.timeout is not None and self.expected_wait() > self.timeout:
+            self.shed['deadline'] += 1
+            raise Overloaded('deadline')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.shed['deadline'] += 1
+            raise Overloaded('deadline')
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        waited = time.perf_counter() - start
+        self.admitted += 1
+        self.wait_seconds += waited
+        return waited
+
+    # Give the slot back, straight to the next caller in line if there is one. `held` is how long the slot was held,
+    # which is what the expected wait is worked out from
+    def release(self, held=None):
+        if held is not None:
+            self.service_time = held if self.service_time is None else \
+                self.service_time + SERVICE_TIME_WEIGHT * (held - self.service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    # Roughly how long a caller arriving now would wait: slots come free at limit / service_time a second and it has
+    # to wait for everyone already in line
+    def expected_wait(self):
+        if self.service_time is None:
+            return 0.0
+        return (len(self._waiters) + 1) * self.service_time / self.limit
+
+    def _abandon(self, waiter):
+        if waiter.done() and not waiter.cancelled():
+            # the slot was handed over just as we gave up on it, pass it on
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+# ASGI middleware that puts the requests to some routes through an admission queue. `queues` maps a route's path
+# template to its Limiter and `routes` is the app's list of routes, which is read when the first request comes in so
+# routes added after the middleware are found. A request that is turned away gets a 503 with a Retry-After header,
+# from shed_response(scope, reason) if it is given. The request never reaches the route so it costs next to nothing
+class AdmissionMiddleware:
+    def __init__(self, app, routes, queues, retry_after=1, shed_response=None):
+        self.app = app
+        self.routes = routes
+        self.queues = queues
+        self.retry_after = retry_after
+        self.shed_response = shed_response
+        self._queued_routes = None
+
+    async def __call__(self, scope, receive, send):
+        route = self._route(scope) if scope["type"] == "http" and self.queues else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        queue = self.queues[route.path]
+        try:
+            await queue.acquire()
+        except Overloaded as err:
+            # the route is set the way the router would, so the request metrics put the 503 under the right route
+            scope["route"] = route
+            response = self.shed_response(scope, err.reason) if self.shed_response else \
+                PlainTextResponse("The server is busy, try again shortly", status_code=503)
+            response.headers["Retry-After"] = str(self.retry_after)
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            queue.release(time.perf_counter() - start)
+
+    def _route(self, scope):
+        if self._queued_routes is None:
+            self._queued_routes = [route for route in self.routes if getattr(route, "path", None) in self.queues]
+        for route in self._queued_routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+
+# Wraps a stream returned by the firestore API so each read from it waits for a slot of the limiter. The slot is
+# only held while waiting on firestore, not while the caller works through what was read. A caller that writes while
+# reading a stream, as removing a member from a board does, would otherwise hold a slot it needs for the writes
+class _LimitedStream:
+    def __init__(self, stream, limiter):
+        self._stream = stream
+        self._limiter = limiter
+        self._iterator = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iterator is None:
+            self._iterator = self._stream.__aiter__()
+        async with self._limiter:
+            return await self._iterator.__anext__()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+# Make every RPC the async firestore client sends wait for a slot of `limiter`, so a worker never has more than
+# limiter.limit of them waiting on firestore at once however many requests fan out. Like instrument_firestore this
+# changes the generated API client class, so it affects every AsyncClient in the process and should only be done once
+def limit_firestore(limiter):
+    from google.cloud.firestore_v1.services.firestore.async_client import FirestoreAsyncClient
+
+    for operation in FIRESTORE_OPERATIONS:
+        original = getattr(FirestoreAsyncClient, operation)
+        setattr(FirestoreAsyncClient, operation, _limited_operation(original, limiter,
+                                                                    operation in FIRESTORE_STREAMING_OPERATIONS))
+
+
+def _limited_operation(original, limiter, streaming):
+    async def call(client, *args, **kwargs):
+        async with limiter:
+            result = await original(client, *args, **kwargs)
+        return _LimitedStream(result, limiter) if streaming else result
+    return call
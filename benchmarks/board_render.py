@@ -0,0 +1,102 @@
+# Renders the board page for a large synthetic board and reports how long the templates take and how big the page
+# is. Nothing is read from firestore, so this runs without the emulator. Pass --ref to render the templates from an
+# older revision as well and compare the two.
+#
+#     python benchmarks/board_render.py --tasks 2000 --members 200 --ref HEAD~1
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemLoader
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, export_ref
+
+
+# Just enough of a starlette request for the templates
+class FakeRequest:
+    query_params = {}
+
+
+def build_context(tasks, members):
+    member_list = [
+        {'id': f"member-{i}", 'email': f"member-{i}@bench.local", 'is_creator': i == 0} for i in range(members)
+    ]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    task_list = []
+    for i in range(tasks):
+        completed = i % 3 == 0
+        assigned_to = random.choice(member_list)['id'] if i % 5 else None
+        task_list.append({
+            'id': f"task{i:06d}",
+            'title': f"Task number {i}",
+            'due_date': now + datetime.timedelta(days=i % 60),
+            'assigned_to': assigned_to,
+            'completed': completed,
+            'completion_date': now if completed else None,
+            'unassigned': assigned_to is None
+        })
+
+    return {
+        'request': FakeRequest(),
+        'user_token': {'user_id': 'member-0', 'email': 'member-0@bench.local'},
+        'board': {'name': 'Render benchmark', 'creator_email': 'member-0@bench.local', 'created_at': now},
+        'board_id': 'render-board',
+        'tasks': task_list,
+        'next_cursor': None,
+        'task_filter': None,
+        'members': member_list,
+        'members_by_id': {member['id']: member for member in member_list},
+        'is_creator': True,
+        'active_tasks': tasks - len([task for task in task_list if task['completed']]),
+        'completed_tasks': len([task for task in task_list if task['completed']]),
+        'total_tasks': tasks
+    }
+
+
+# Render board.html from a templates directory `runs` times. Returns the render times and the size of the page
+def measure(template_dir, context, runs):
+    env = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
+    env.globals['url_for'] = lambda name, path: f"/{name}/{path}"
+    env.filters['due_date'] = lambda value: value.strftime('%Y-%m-%d')
+    template = env.get_template("board.html")
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        html = template.render(context)
+        times.append(time.perf_counter() - start)
+    return times, len(html.encode())
+
+
+def report(label, times, size):
+    print(f"{label:<12} median {statistics.median(times) * 1000:>8.1f} ms  min {min(times) * 1000:>8.1f} ms  "
+          f"page {size / 1024:>8.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the render time and size of a large board page")
+    parser.add_argument("--tasks", type=int, default=2000, help="tasks on the page")
+    parser.add_argument("--members", type=int, default=200, help="members of the board")
+    parser.add_argument("--runs", type=int, default=10, help="renders to time")
+    parser.add_argument("--ref", help="git revision whose templates to compare against")
+    args = parser.parse_args()
+
+    random.seed(1)
+    context = build_context(args.tasks, args.members)
+    print(f"{args.tasks} tasks, {args.members} members")
+
+    if args.ref:
+        with tempfile.TemporaryDirectory() as directory:
+            export_ref(args.ref, directory)
+            report(args.ref, *measure(os.path.join(directory, "templates"), context, args.runs))
+    report("current", *measure(os.path.join(ROOT, "templates"), context, args.runs))
+
+
+if __name__ == "__main__":
+    main()
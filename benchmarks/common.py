@@ -0,0 +1,242 @@
+# Shared helpers for the benchmark scripts. By default a benchmark runs the app on the in-memory store
+# (STORAGE_BACKEND=memory, see memory_store.py) with a locally generated signing key, so no google credentials,
+# emulator or network access are needed. Most of them import main.py into their own process with import_app or
+# import_memory_app and send requests straight to the ASGI app. concurrency.py measures a real server, it starts
+# uvicorn with start_server serving memory_app.py. With --backend firestore a benchmark runs against the firestore
+# emulator instead, which has to be started first and named in FIRESTORE_EMULATOR_HOST. sse_subscribers.py needs the
+# emulator's listeners, so it only runs that way
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import rsa
+from google.auth import crypt, jwt
+from google.cloud.firestore_v1.services.firestore.async_client import FirestoreAsyncClient
+
+# The root of the repository, this is where main.py, templates and static live
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Project id used for every benchmark run against the emulator
+EMULATOR_PROJECT = "task-management-bench"
+
+
+# The firestore API methods that each cost one round trip to the server
+FIRESTORE_RPCS = [
+    'get_document', 'list_documents', 'update_document', 'delete_document', 'batch_get_documents',
+    'begin_transaction', 'commit', 'rollback', 'run_query', 'run_aggregation_query', 'batch_write'
+]
+
+
+# Counts every firestore RPC made by the app when it runs in the same process as the benchmark. It wraps the
+# methods of the generated API client that AsyncClient sends all of its requests through, or, given the MemoryClient
+# the app runs on, counts the round trips the store reports under the same names
+class RpcCounter:
+    def __init__(self, memory_client=None):
+        self.counts = Counter()
+        if memory_client is not None:
+            self._observe(memory_client)
+            return
+        for name in FIRESTORE_RPCS:
+            self._wrap(name)
+
+    def _observe(self, memory_client):
+        observer = memory_client.observer
+        counts = self.counts
+
+        def counted(operation, seconds):
+            counts[operation] += 1
+            if observer is not None:
+                observer(operation, seconds)
+
+        memory_client.observer = counted
+
+    def _wrap(self, name):
+        original = getattr(FirestoreAsyncClient, name)
+        counts = self.counts
+
+        def counted(client, *args, **kwargs):
+            counts[name] += 1
+            return original(client, *args, **kwargs)
+
+        setattr(FirestoreAsyncClient, name, counted)
+
+    def reset(self):
+        self.counts.clear()
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+# Generates an RSA key, writes the matching certificate file for FIREBASE_CERTS_FILE and signs ID tokens with it
+class TokenSigner:
+    def __init__(self, directory):
+        public_key, private_key = rsa.newkeys(2048)
+        self.certs_file = os.path.join(directory, "certs.json")
+        with open(self.certs_file, "w") as certs_file:
+            json.dump({"bench-key": public_key.save_pkcs1().decode()}, certs_file)
+        self._signer = crypt.RSASigner.from_string(private_key.save_pkcs1().decode(), key_id="bench-key")
+
+    def token(self, user_id, email=None, lifetime=3600):
+        now = int(time.time())
+        payload = {
+            'user_id': user_id,
+            'sub': user_id,
+            'email': email or f"{user_id}@bench.local",
+            'iat': now,
+            'exp': now + lifetime
+        }
+        return jwt.encode(self._signer, payload).decode()
+
+
+# Make sure the emulator is configured and return the environment the app should run with
+def emulator_env(signer):
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("FIRESTORE_EMULATOR_HOST is not set, start the emulator with `gcloud emulators firestore start` first")
+    env = dict(os.environ)
+    env["GOOGLE_CLOUD_PROJECT"] = EMULATOR_PROJECT
+    env["FIREBASE_CERTS_FILE"] = signer.certs_file
+    return env
+
+
+# Write the tree of a git revision into a directory so an older version of the app can be benchmarked
+def export_ref(ref, directory):
+    archive = subprocess.run(["git", "archive", ref], cwd=ROOT, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return directory
+
+
+# Import main.py in this process, pointed at the emulator and the local signing key. Used by the benchmarks that call
+# routes directly so they can count RPCs. With backend="memory" the app uses the in-memory store and needs no emulator
+def import_app(signer, backend="firestore"):
+    if backend == "memory":
+        os.environ["STORAGE_BACKEND"] = "memory"
+        os.environ["FIREBASE_CERTS_FILE"] = signer.certs_file
+    else:
+        os.environ.update(emulator_env(signer))
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import main
+    return main
+
+
+# Import the main.py of `directory` in this process the way memory_app.py serves it, on the in-memory store with
+# every operation taking `latency` seconds. Unlike import_app this works for revisions from before the store existed,
+# so a route can be timed in-process on an exported older tree too. Returns the app module and the MemoryClient
+def import_memory_app(signer, directory=ROOT, latency=0.0):
+    for name in ("GOOGLE_APPLICATION_CREDENTIALS", "FIRESTORE_EMULATOR_HOST", "GOOGLE_CLOUD_PROJECT"):
+        os.environ.pop(name, None)
+    os.environ["FIREBASE_CERTS_FILE"] = signer.certs_file
+    os.environ["MEMORY_STORE_LATENCY"] = str(latency)
+    os.environ.setdefault("BENCH_TASKS", "0")
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    sys.path.append(ROOT)
+    import memory_app
+    client = memory_app.stores[0] if memory_app.stores else memory_app.main.firestore_db.get()
+    return memory_app.main, client
+
+
+# Build a request object carrying the token cookie, for calling a route function directly
+def make_request(token, method="POST", path="/"):
+    from starlette.requests import Request
+    return Request({
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'cookie', f"token={token}".encode())]
+    })
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Start the app in a uvicorn subprocess and wait until it accepts connections. `app` is the module:attribute uvicorn
+# serves, relative to app_dir
+def start_server(app_dir, env, workers=1, app="main:app"):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=app_dir, env=env, stdout=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server in {app_dir} exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    sys.exit("Server did not start within 30 seconds")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+# Fire total_requests GET requests at a url from `concurrency` threads and report throughput and latency
+def run_load(url, token, concurrency, total_requests):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one_request(_):
+        nonlocal errors
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.cookies.set("token", token)
+        start = time.perf_counter()
+        response = local.session.get(url, allow_redirects=False)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_request, range(total_requests)))
+    duration = time.perf_counter() - start
+
+    return {
+        'requests': total_requests,
+        'errors': errors,
+        'throughput': total_requests / duration,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def print_results(label, results):
+    print(f"{label:<40} {results['throughput']:>9.1f} req/s  p50 {results['p50_ms']:>8.1f} ms  "
+          f"p95 {results['p95_ms']:>8.1f} ms  p99 {results['p99_ms']:>8.1f} ms  errors {results['errors']}")
@@ -0,0 +1,126 @@
+# Measures how many concurrent requests one worker can serve for the dashboard and a board page. Each revision is
+# served from a single uvicorn worker, so the numbers show whether handlers block the event loop while they wait on
+# the database. Pass --ref once for each older revision to compare the current tree against:
+#     python benchmarks/concurrency.py --ref baseline-revision --ref HEAD~1
+#
+# By default the app runs on the in-memory store through memory_app.py, with every store operation taking --latency
+# seconds. Revisions from before the store existed are run on it too, their synchronous firestore client blocking
+# for the same time as a real one would. With --backend firestore start the emulator first, only revisions that read
+# FIREBASE_CERTS_FILE can be measured that way:
+#     FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/concurrency.py --backend firestore --ref HEAD~1
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+
+from google.cloud import firestore
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import (ROOT, EMULATOR_PROJECT, TokenSigner, emulator_env, export_ref, start_server, stop_server,
+                    run_load, print_results)
+
+# The board and the user memory_app.py seeds
+MEMORY_BOARD_ID = "bench-board"
+MEMORY_CREATOR_ID = "bench-creator"
+
+# Settings that would point the app at a real project, left out of the environment of the in-memory runs
+CREDENTIAL_SETTINGS = ("GOOGLE_APPLICATION_CREDENTIALS", "FIRESTORE_EMULATOR_HOST", "GOOGLE_CLOUD_PROJECT",
+                       "STORAGE_BACKEND")
+
+
+# Create one board with a creator, some members and some tasks. Returns the board id and the creator id
+def seed(db, tasks, members):
+    creator_id = "bench-creator"
+    member_ids = [creator_id] + [f"bench-member-{i}" for i in range(members)]
+
+    board_ref = db.collection('boards').document()
+    board_ref.set({
+        'name': 'Benchmark board',
+        'creator_id': creator_id,
+        'creator_email': f"{creator_id}@bench.local",
+        'created_at': datetime.datetime.now(),
+        'members': member_ids
+    })
+
+    batch = db.batch()
+    for user_id in member_ids:
+        batch.set(db.collection('users').document(user_id), {
+            'name': user_id,
+            'email': f"{user_id}@bench.local",
+            'created_boards': [board_ref.id] if user_id == creator_id else [],
+            'member_boards': [] if user_id == creator_id else [board_ref.id]
+        })
+    batch.commit()
+
+    for start in range(0, tasks, 500):
+        batch = db.batch()
+        for i in range(start, min(start + 500, tasks)):
+            batch.set(db.collection('tasks').document(), {
+                'title': f"Task {i}",
+                'due_date': '2030-01-01',
+                'created_by': creator_id,
+                'created_at': datetime.datetime.now(),
+                'board_id': board_ref.id,
+                'completed': i % 3 == 0,
+                'completion_date': None,
+                'assigned_to': member_ids[i % len(member_ids)],
+                'unassigned': False
+            })
+        batch.commit()
+
+    return board_ref.id, creator_id
+
+
+def memory_env(signer, directory, args):
+    env = {name: value for name, value in os.environ.items() if name not in CREDENTIAL_SETTINGS}
+    env["FIREBASE_CERTS_FILE"] = signer.certs_file
+    env["MEMORY_STORE_LATENCY"] = str(args.latency)
+    env["BENCH_TASKS"] = str(args.tasks)
+    env["BENCH_MEMBERS"] = str(args.members)
+    env["STATIC_BUILD_DIR"] = os.path.join(directory, "static")
+    env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), ROOT])
+    return env
+
+
+def benchmark(label, app_dir, env, token, board_id, args):
+    app = "memory_app:app" if args.backend == "memory" else "main:app"
+    process, base_url = start_server(app_dir, env, app=app)
+    try:
+        # warm up the token cache and the gRPC channel before measuring
+        run_load(f"{base_url}/", token, 1, 5)
+        print_results(f"{label} /", run_load(f"{base_url}/", token, args.concurrency, args.requests))
+        print_results(f"{label} /board", run_load(f"{base_url}/board/{board_id}", token, args.concurrency, args.requests))
+    finally:
+        stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent request throughput for the dashboard and board pages")
+    parser.add_argument("--ref", action="append", default=[], help="git revision to compare the current tree against")
+    parser.add_argument("--backend", choices=["memory", "firestore"], default="memory")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds each in-memory store operation takes")
+    parser.add_argument("--tasks", type=int, default=200, help="tasks on the benchmark board")
+    parser.add_argument("--members", type=int, default=20, help="members on the benchmark board")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight at once")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        if args.backend == "memory":
+            env = memory_env(signer, directory, args)
+            board_id, creator_id = MEMORY_BOARD_ID, MEMORY_CREATOR_ID
+        else:
+            env = emulator_env(signer)
+            board_id, creator_id = seed(firestore.Client(project=EMULATOR_PROJECT), args.tasks, args.members)
+        token = signer.token(creator_id)
+
+        for ref in args.ref:
+            app_dir = export_ref(ref, os.path.join(directory, f"ref-{len(os.listdir(directory))}"))
+            benchmark(ref, app_dir, env, token, board_id, args)
+        benchmark("working tree", ROOT, env, token, board_id, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Measures what a repeat view of a large board costs: the bytes sent and the CPU the app spends on a first view with
+# and without compression, and on a revalidation that is answered with a 304. The app runs in this process on the
+# in-memory store and is called directly through ASGI, so the CPU time is the app's own and not an HTTP client's.
+#
+#     python benchmarks/conditional_get.py --tasks 2000 --requests 200
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import TokenSigner, import_app, percentile
+from routes import seed
+
+
+# Send one GET straight to the ASGI app and return the status, the response headers and the body as sent
+async def asgi_get(app, path, headers):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'client': ('127.0.0.1', 50000),
+        'server': ('bench', 80)
+    }
+    response = {'status': None, 'headers': [], 'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = message.get('headers', [])
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    return response
+
+
+# Request the page `total` times one after another and summarise what each request cost
+async def measure(app_module, path, headers, total):
+    db = app_module.firestore_db
+    latencies = []
+    before = db.stats()
+    cpu_start = time.process_time()
+    for _ in range(total):
+        start = time.perf_counter()
+        response = await asgi_get(app_module.app, path, headers)
+        latencies.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+    after = db.stats()
+
+    header_bytes = sum(len(name) + len(value) + 4 for name, value in response['headers'])
+    return {
+        'status': response['status'],
+        'encoding': dict(response['headers']).get(b'content-encoding', b'identity').decode(),
+        'body_bytes': len(response['body']),
+        'header_bytes': header_bytes,
+        'cpu_ms': cpu / total * 1000,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'reads': (after['reads'] - before['reads']) / total
+    }
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        app_module = import_app(signer, "memory")
+        state = await seed(app_module, args.tasks, args.tasks, args.members, 0)
+        path = f"/board/{state['board_id']}"
+        cookie = {'Cookie': f"token={signer.token(state['creator_id'])}"}
+
+        # warm up the token cache and the board cache, and get the page's ETag
+        for _ in range(3):
+            first = await asgi_get(app_module.app, path, cookie)
+        etag = dict(first['headers'])[b'etag'].decode()
+
+        cases = [
+            ("first view, uncompressed", {**cookie, 'Accept-Encoding': 'identity'}),
+            ("first view, gzip", {**cookie, 'Accept-Encoding': 'gzip'}),
+            ("first view, br", {**cookie, 'Accept-Encoding': 'br, gzip'}),
+            ("repeat view, 304", {**cookie, 'Accept-Encoding': 'br, gzip', 'If-None-Match': etag})
+        ]
+        print(f"{path} on a board with {args.tasks} tasks and {args.members + 1} members, "
+              f"{args.requests} requests each")
+        for label, headers in cases:
+            result = await measure(app_module, path, headers, args.requests)
+            print(f"  {label:<26} {result['status']}  {result['encoding']:<8} "
+                  f"body {result['body_bytes']:>7} B  headers {result['header_bytes']:>4} B  "
+                  f"cpu {result['cpu_ms']:>6.2f} ms  p50 {result['p50_ms']:>6.2f} ms  p99 {result['p99_ms']:>6.2f} ms  "
+                  f"reads {result['reads']:>5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes and CPU of first and repeat views of a board page")
+    parser.add_argument("--tasks", type=int, default=2000, help="tasks on the board")
+    parser.add_argument("--members", type=int, default=20, help="members of the board besides the creator")
+    parser.add_argument("--requests", type=int, default=200, help="requests per case")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# Seeds a board with a large number of tasks and title reservations, force deletes it through the API and follows the
+# background job until it finishes. Reports how long the request that started the job took and how many tasks per
+# second the job deleted.
+#
+# The app runs in this process and the requests are sent to it through ASGI, the job runs on the same event loop as it
+# would in a worker. With --backend memory (the default) nothing else is needed, and every operation on the in-memory
+# store waits --latency seconds. With --backend firestore start the emulator first:
+#     python benchmarks/force_delete.py --tasks 100000
+#     FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/force_delete.py --backend firestore --tasks 100000
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import TokenSigner, import_app
+
+# Tasks seeded at once. Each task and its reservation is two writes, so 250 tasks fill a batch
+SEED_BATCH_TASKS = 250
+
+
+# Create a board with `tasks` tasks, each with a title reservation, and `members` members besides the creator
+async def seed(app_module, creator_id, tasks, members):
+    db = app_module.firestore_db
+    member_ids = [f"delete-member-{i}" for i in range(members)]
+    board_ref = db.collection('boards').document()
+    await board_ref.set({
+        'name': 'Force delete',
+        'creator_id': creator_id,
+        'creator_email': f"{creator_id}@bench.local",
+        'created_at': datetime.datetime.now(),
+        'members': [creator_id] + member_ids,
+        'active_tasks': tasks,
+        'completed_tasks': 0,
+        'counters_initialized': True
+    })
+
+    batch = db.batch()
+    batch.set(db.collection('users').document(creator_id), {
+        'name': creator_id, 'email': f"{creator_id}@bench.local", 'created_boards': [board_ref.id], 'member_boards': []
+    })
+    for member_id in member_ids:
+        batch.set(db.collection('users').document(member_id), {
+            'name': member_id, 'email': f"{member_id}@bench.local", 'created_boards': [], 'member_boards': [board_ref.id]
+        })
+    await batch.commit()
+
+    async def write_chunk(start):
+        batch = db.batch()
+        for i in range(start, min(start + SEED_BATCH_TASKS, tasks)):
+            task_ref = db.collection('tasks').document()
+            batch.set(task_ref, {
+                'title': f"task {i}",
+                'due_date': '2030-01-01',
+                'created_by': creator_id,
+                'created_at': datetime.datetime.now(),
+                'board_id': board_ref.id,
+                'completed': False,
+                'completion_date': None,
+                'assigned_to': None,
+                'unassigned': True
+            })
+            batch.set(db.collection('task_titles').document(f"{board_ref.id}_{i}"), {
+                'board_id': board_ref.id, 'title': f"task {i}", 'task_id': task_ref.id
+            })
+        await batch.commit()
+
+    starts = list(range(0, tasks, SEED_BATCH_TASKS))
+    for group in range(0, len(starts), 16):
+        await asyncio.gather(*(write_chunk(start) for start in starts[group:group + 16]))
+    return board_ref.id
+
+
+# Force delete the board and poll the job every `poll` seconds until it has finished. Returns the job, how long the
+# request took and how long the job took from the request until it was seen to have finished
+async def force_delete(app_module, token, board_id, poll):
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={'token': token}) as client:
+        start = time.perf_counter()
+        response = await client.post(f"/api/v1/boards/{board_id}/delete")
+        response.raise_for_status()
+        accepted = time.perf_counter() - start
+        status_url = response.json()['status_url']
+
+        while True:
+            job = (await client.get(status_url)).json()
+            print(f"  {job['state']:<8} {job.get('members_removed', 0):>6} members  {job['tasks_deleted']:>8} tasks  "
+                  f"{job['titles_deleted']:>8} titles  {job['progress'] * 100:5.1f}%")
+            if job['state'] != 'running':
+                break
+            await asyncio.sleep(poll)
+        return job, accepted, time.perf_counter() - start
+
+
+async def run(app_module, signer, args):
+    db = app_module.firestore_db
+    creator_id = "delete-creator"
+    start = time.perf_counter()
+    board_id = await seed(app_module, creator_id, args.tasks, args.members)
+    print(f"Seeded {args.tasks} tasks in {time.perf_counter() - start:.1f}s")
+
+    job, accepted, duration = await force_delete(app_module, signer.token(creator_id), board_id, args.poll)
+
+    left = len(await db.collection('tasks').where('board_id', '==', board_id).limit(1).get())
+    members_left = len(await db.collection('users').where('member_boards', 'array_contains', board_id).get())
+    print(f"Request returned in {accepted * 1000:.1f} ms")
+    print(f"Job {job['state']} in {duration:.1f}s, {job['tasks_deleted'] / duration:.0f} tasks/s")
+    if left or members_left:
+        print(f"Left behind: tasks {bool(left)}, users still listing the board {members_left}")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how fast a board with many tasks is force deleted")
+    parser.add_argument("--tasks", type=int, default=100000, help="tasks on the board")
+    parser.add_argument("--members", type=int, default=20, help="members of the board besides the creator")
+    parser.add_argument("--poll", type=float, default=0.5, help="seconds between job status checks")
+    parser.add_argument("--backend", choices=["memory", "firestore"], default="memory")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds each in-memory store operation takes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        if args.backend == "memory":
+            os.environ["MEMORY_STORE_LATENCY"] = str(args.latency)
+        app_module = import_app(signer, args.backend)
+        print(f"{args.backend} backend")
+        sys.exit(0 if asyncio.run(run(app_module, signer, args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
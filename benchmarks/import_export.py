@@ -0,0 +1,179 @@
+# Measures the task import and export routes on a large file: rows a second and the peak memory of the process while
+# each runs. The file is written to disk first and streamed into the import in 64 KB chunks the way a client uploads
+# it, and the export is read without keeping the body, so what the memory shows is the app's own. A few rows can be
+# made bad or duplicates to see what the per-row errors cost.
+#
+# The app runs in this process on the in-memory store. The store keeps every imported task, so the memory it takes
+# grows with the import whatever the route does. The export adds nothing to the store, so its peak is the one that
+# shows whether a route holds the whole file. The store has no index to start a page from, so every page of the
+# export goes through all of the board's tasks and the export slows down as the board grows, where firestore reads
+# each page straight from the index:
+#     python benchmarks/import_export.py --rows 100000 --bad 100
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import TokenSigner, import_app
+from routes import seed
+
+# How much of the file is sent to the app at a time
+UPLOAD_CHUNK = 64 * 1024
+
+
+# Samples the resident memory of the process every few milliseconds from a thread until stopped, and keeps the peak.
+# ru_maxrss is only the peak since the process started, so it is the fallback where /proc isn't there
+class PeakMemory:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = self.current()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def current():
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+# Write a file of `rows` new tasks for the import. Every `bad`th row has no due date and every `duplicates`th one
+# repeats the title of the row before, so each of those is reported as an error
+def write_file(path, file_format, rows, assignees, bad, duplicates):
+    with open(path, "w", newline="") as output:
+        if file_format == "csv":
+            output.write("title,due_date,assigned_to\r\n")
+        for i in range(rows):
+            title = f"Imported task {i - 1 if duplicates and i and i % duplicates == 0 else i}"
+            due_date = "" if bad and i % bad == bad - 1 else f"2030-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+            assigned_to = assignees[i % len(assignees)]
+            if file_format == "csv":
+                output.write(f"{title},{due_date},{assigned_to}\r\n")
+            else:
+                output.write(json.dumps({'title': title, 'due_date': due_date or None,
+                                         'assigned_to': assigned_to}) + "\n")
+
+
+# Send a request straight to the ASGI app with the body read from `body_file` a chunk at a time. The response body is
+# only counted, or kept when `keep` is set. Returns the status, the bytes of the response and the body if kept
+async def asgi_request(app, method, path, headers, body_file=None, keep=False):
+    path, _, query = path.partition("?")
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'client': ('127.0.0.1', 50000),
+        'server': ('bench', 80)
+    }
+    response = {'status': None, 'bytes': 0, 'body': b''}
+    uploaded = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal uploaded
+        if uploaded:
+            # a streaming response listens for the client going away, which here is once the response has been sent
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+        chunk = body_file.read(UPLOAD_CHUNK) if body_file else b''
+        uploaded = len(chunk) < UPLOAD_CHUNK
+        return {'type': 'http.request', 'body': chunk, 'more_body': not uploaded}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['bytes'] += len(message.get('body', b''))
+            if keep:
+                response['body'] += message.get('body', b'')
+            if not message.get('more_body', False):
+                finished.set()
+
+    await app(scope, receive, send)
+    return response
+
+
+async def run_format(app_module, signer, file_format, directory, args):
+    state = await seed(app_module, f"import-{file_format}", 0, args.members, 0)
+    board_id = state['board_id']
+    headers = {'Cookie': f"token={signer.token(state['creator_id'])}"}
+    assignees = [f"bench-import-{file_format}-member-{i}" for i in range(args.members)] or [""]
+    path = os.path.join(directory, f"tasks.{file_format}")
+    write_file(path, file_format, args.rows, assignees, args.bad, args.duplicates)
+    size = os.path.getsize(path)
+
+    start_rss = PeakMemory.current()
+    with open(path, "rb") as body_file, PeakMemory() as memory:
+        start = time.perf_counter()
+        response = await asgi_request(app_module.app, "POST", f"/api/v1/boards/{board_id}/import?format={file_format}",
+                                      headers, body_file, keep=True)
+        import_seconds = time.perf_counter() - start
+    if response['status'] != 200:
+        sys.exit(f"import failed with {response['status']}: {response['body'][:200]}")
+    summary = json.loads(response['body'])
+    print(f"  {file_format:<7} import  {args.rows} rows ({size / 2 ** 20:.1f} MB) in {import_seconds:6.2f} s  "
+          f"{args.rows / import_seconds:>8.0f} rows/s  created {summary['created']}  failed {summary['failed']}  "
+          f"peak RSS +{(memory.peak - start_rss) / 2 ** 20:6.1f} MB")
+
+    start_rss = PeakMemory.current()
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        response = await asgi_request(app_module.app, "GET", f"/api/v1/boards/{board_id}/export?format={file_format}",
+                                      headers)
+        export_seconds = time.perf_counter() - start
+    print(f"  {file_format:<7} export  {summary['created']} rows ({response['bytes'] / 2 ** 20:.1f} MB) in "
+          f"{export_seconds:6.2f} s  {summary['created'] / export_seconds:>8.0f} rows/s  "
+          f"peak RSS +{(memory.peak - start_rss) / 2 ** 20:6.1f} MB")
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        app_module = import_app(signer, "memory")
+        print(f"import and export of {args.rows} tasks, {app_module.IMPORT_CHUNK_SIZE} rows a write, "
+              f"{app_module.EXPORT_PAGE_SIZE} rows a page, process RSS at start "
+              f"{PeakMemory.current() / 2 ** 20:.0f} MB")
+        for file_format in args.formats:
+            await run_format(app_module, signer, file_format, directory, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and peak memory of the task import and export routes")
+    parser.add_argument("--rows", type=int, default=100000, help="rows in the imported file")
+    parser.add_argument("--members", type=int, default=20, help="members of the board tasks are assigned to")
+    parser.add_argument("--bad", type=int, default=0, help="make every Nth row invalid")
+    parser.add_argument("--duplicates", type=int, default=0, help="make every Nth row repeat a title")
+    parser.add_argument("--formats", nargs="+", default=["ndjson", "csv"], choices=["ndjson", "csv"])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
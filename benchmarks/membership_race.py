@@ -0,0 +1,131 @@
+# Fires parallel add and remove member requests at one board and checks that no membership entries are lost or left
+# behind. The board's members array and each user's member_boards must agree once all the requests have finished.
+#
+# The app runs in this process and the requests are sent to it concurrently through ASGI, so every request that is
+# waiting on the database lets the others run. With --backend memory (the default) nothing else is needed, and every
+# operation on the in-memory store waits --latency seconds so the requests overlap the way they would on firestore.
+# With --backend firestore start the emulator first:
+#     python benchmarks/membership_race.py --users 200
+#     FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/membership_race.py --backend firestore
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import TokenSigner, import_app
+
+
+# Create a board and `users` user documents that aren't members of it yet, with the user_emails entries the add
+# member form looks them up by
+async def seed(app_module, creator_id, users):
+    db = app_module.firestore_db
+    board_ref = db.collection('boards').document()
+    await board_ref.set({
+        'name': 'Membership race',
+        'creator_id': creator_id,
+        'creator_email': f"{creator_id}@bench.local",
+        'created_at': datetime.datetime.now(),
+        'members': [creator_id],
+        'active_tasks': 0,
+        'completed_tasks': 0,
+        'counters_initialized': True
+    })
+
+    user_ids = [f"race-user-{i}" for i in range(users)]
+    batch = db.batch()
+    batch.set(db.collection('users').document(creator_id), {
+        'name': creator_id, 'email': f"{creator_id}@bench.local", 'created_boards': [board_ref.id], 'member_boards': []
+    })
+    for user_id in user_ids:
+        batch.set(db.collection('users').document(user_id), {
+            'name': user_id, 'email': f"{user_id}@bench.local", 'created_boards': [], 'member_boards': []
+        })
+        batch.set(app_module.email_index_ref(f"{user_id}@bench.local"), {'user_id': user_id})
+    await batch.commit()
+    return board_ref.id, user_ids
+
+
+# Send every form to `path` with at most `concurrency` requests in flight. A request the app turns away with a 503
+# is sent again after its Retry-After, the way a browser retrying would
+async def post_all(client, path, forms, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def post(form):
+        async with slots:
+            while True:
+                response = await client.post(path, data=form)
+                if response.status_code != 503:
+                    break
+                await asyncio.sleep(float(response.headers.get('retry-after', 1)))
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} answered {response.status_code} for {form}")
+
+    await asyncio.gather(*(post(form) for form in forms))
+
+
+# Compare the board's members with the member_boards of every user and return a list of problems
+async def check(db, board_id, creator_id, expected_members):
+    problems = []
+    members = set((await db.collection('boards').document(board_id).get()).to_dict()['members'])
+    if members != expected_members | {creator_id}:
+        problems.append(f"board members missing {sorted(expected_members - members)}, "
+                        f"unexpected {sorted(members - expected_members - {creator_id})}")
+
+    for user in await db.collection('users').where('member_boards', 'array_contains', board_id).get():
+        if user.id not in expected_members:
+            problems.append(f"{user.id} still lists the board in member_boards")
+    for user_id in expected_members:
+        if board_id not in (await db.collection('users').document(user_id).get()).to_dict()['member_boards']:
+            problems.append(f"{user_id} is a member but the board is missing from member_boards")
+    return problems
+
+
+# Add `users` users to a new board all at once, then remove every other one all at once, checking the membership
+# after each. Returns the problems found
+async def race(app_module, token, users, concurrency, creator_id="race-creator"):
+    db = app_module.firestore_db
+    board_id, user_ids = await seed(app_module, creator_id, users)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={'token': token}) as client:
+        await post_all(client, "/add-user-to-board",
+                       [{'board_id': board_id, 'user_email': f"{user_id}@bench.local"} for user_id in user_ids],
+                       concurrency)
+        problems = await check(db, board_id, creator_id, set(user_ids))
+
+        removed = user_ids[::2]
+        await post_all(client, "/remove-user-from-board",
+                       [{'board_id': board_id, 'user_id': user_id} for user_id in removed], concurrency)
+        problems += await check(db, board_id, creator_id, set(user_ids) - set(removed))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that parallel membership changes are not lost")
+    parser.add_argument("--users", type=int, default=100, help="users added to the board in parallel")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight at once")
+    parser.add_argument("--backend", choices=["memory", "firestore"], default="memory")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds each in-memory store operation takes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        if args.backend == "memory":
+            os.environ["MEMORY_STORE_LATENCY"] = str(args.latency)
+        app_module = import_app(signer, args.backend)
+        problems = asyncio.run(race(app_module, signer.token("race-creator"), args.users, args.concurrency))
+
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problems found adding {args.users} users and removing {args.users // 2} "
+          f"with {args.concurrency} requests in flight ({args.backend} backend)")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Serves the main.py of the current directory on the in-memory store, seeded with a benchmark board, so revisions of
+# the app can be compared with no emulator. Run it with uvicorn from the app's directory with this directory and the
+# repository root on PYTHONPATH (common.start_server does this when given app="memory_app:app").
+#
+# A revision that has the in-memory store is run with STORAGE_BACKEND=memory. An older one is given the store in place
+# of the firestore clients: AsyncClient becomes a MemoryClient, and the synchronous Client, which the earliest
+# revisions call from their async handlers, becomes a wrapper that blocks the calling thread for the same latency the
+# way a real synchronous call would. Their token check is pointed at the local key in FIREBASE_CERTS_FILE.
+#
+# Settings: MEMORY_STORE_LATENCY (seconds per store operation), BENCH_TASKS and BENCH_MEMBERS (size of the board)
+import asyncio
+import datetime
+import inspect
+import json
+import os
+import threading
+import time
+
+import google.oauth2.id_token
+from google.auth import jwt
+from google.cloud import firestore
+
+from memory_store import MemoryClient, MemoryDocument, MemoryQuery, MemoryWriteBatch
+
+# The ids of the seeded board and the user who created it
+BOARD_ID = "bench-board"
+CREATOR_ID = "bench-creator"
+
+LATENCY = float(os.environ.get("MEMORY_STORE_LATENCY", "0"))
+
+
+# Runs the store's coroutines on a loop of its own thread, so a synchronous caller can wait for them while the app's
+# event loop is blocked, the same as with the synchronous firestore client
+class _StoreThread:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+# A synchronous view of the in-memory store standing in for firestore.Client. Every call that would be a round trip
+# sleeps for LATENCY seconds on the caller's thread
+class BlockingClient:
+    def __init__(self, target, store_thread):
+        self._target = target
+        self._store_thread = store_thread
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            args = [arg._target if isinstance(arg, BlockingClient) else arg for arg in args]
+            result = value(*args, **kwargs)
+            if inspect.iscoroutine(result):
+                time.sleep(LATENCY)
+                return self._store_thread.run(result)
+            if inspect.isasyncgen(result):
+                time.sleep(LATENCY)
+                return iter(self._store_thread.run(_collect(result)))
+            if isinstance(result, (MemoryClient, MemoryDocument, MemoryQuery, MemoryWriteBatch)):
+                return BlockingClient(result, self._store_thread)
+            return result
+        return call
+
+
+async def _collect(generator):
+    return [item async for item in generator]
+
+
+def _verify_locally(id_token, request=None, audience=None, clock_skew_in_seconds=0):
+    with open(os.environ["FIREBASE_CERTS_FILE"]) as certs_file:
+        return jwt.decode(id_token, certs=json.load(certs_file), clock_skew_in_seconds=clock_skew_in_seconds)
+
+
+stores = []
+if os.path.exists("memory_store.py"):
+    os.environ["STORAGE_BACKEND"] = "memory"
+else:
+    def _async_client(*args, **kwargs):
+        client = MemoryClient()
+        client.latency = LATENCY
+        stores.append(client)
+        return client
+
+    def _sync_client(*args, **kwargs):
+        client = MemoryClient()
+        stores.append(client)
+        return BlockingClient(client, _StoreThread())
+
+    firestore.AsyncClient = _async_client
+    firestore.Client = _sync_client
+    google.oauth2.id_token.verify_firebase_token = _verify_locally
+
+import main  # noqa: E402
+
+
+# Write the board, its members and its tasks straight into the store. The documents have the fields every revision
+# reads, the counters and the unassigned flag are ignored by the revisions that don't have them
+async def seed(db, tasks, members):
+    member_ids = [CREATOR_ID] + [f"bench-member-{i}" for i in range(members)]
+    latency, db.latency = db.latency, 0
+
+    await db.collection('boards').document(BOARD_ID).set({
+        'name': 'Benchmark board',
+        'creator_id': CREATOR_ID,
+        'creator_email': f"{CREATOR_ID}@bench.local",
+        'created_at': datetime.datetime.now(datetime.timezone.utc),
+        'members': member_ids,
+        'active_tasks': tasks - (tasks + 2) // 3,
+        'completed_tasks': (tasks + 2) // 3,
+        'counters_initialized': True
+    })
+    batch = db.batch()
+    for user_id in member_ids:
+        batch.set(db.collection('users').document(user_id), {
+            'name': user_id,
+            'email': f"{user_id}@bench.local",
+            'created_boards': [BOARD_ID] if user_id == CREATOR_ID else [],
+            'member_boards': [] if user_id == CREATOR_ID else [BOARD_ID]
+        })
+    for i in range(tasks):
+        batch.set(db.collection('tasks').document(), {
+            'title': f"Task {i}",
+            'due_date': '2030-01-01',
+            'created_by': CREATOR_ID,
+            'created_at': datetime.datetime.now(datetime.timezone.utc),
+            'board_id': BOARD_ID,
+            'completed': i % 3 == 0,
+            'completion_date': None,
+            'assigned_to': member_ids[i % len(member_ids)],
+            'unassigned': False
+        })
+    await batch.commit()
+    db.latency = latency
+
+
+# uvicorn imports the app from inside its event loop, so the seed runs on a loop of its own
+_seeding = threading.Thread(target=asyncio.run, args=(seed(
+    stores[0] if stores else main.firestore_db.get(), int(os.environ.get("BENCH_TASKS", "200")),
+    int(os.environ.get("BENCH_MEMBERS", "20"))
+),))
+_seeding.start()
+_seeding.join()
+
+app = main.app
@@ -0,0 +1,120 @@
+# Sends the board page of a large board more requests a second than one worker can serve and reports how long the
+# answers took, with the admission queues turned off and then on. Requests are sent on a fixed schedule however slow
+# the answers are, the way independent users would send them, and each latency is counted from when the request was
+# due. Without admission control the queue inside the worker grows for as long as the burst lasts and so does the
+# latency of every request. With it the requests that can't be served in time are answered with a quick 503, and the
+# p99 of the ones that are served stays under the queue timeout plus the time to render the page.
+#
+# The app runs in this process on the in-memory store, which waits --latency seconds on every operation to stand in
+# for firestore:
+#     python benchmarks/overload.py --tasks 1000 --load 2 --seconds 5
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import TokenSigner, import_app, percentile
+from conditional_get import asgi_get
+from routes import seed
+
+
+# Send the page `total` times one after another and return the mean time each one took
+async def service_time(app, path, headers, total):
+    start = time.perf_counter()
+    for _ in range(total):
+        await asgi_get(app, path, headers)
+    return (time.perf_counter() - start) / total
+
+
+# Send `rate` requests a second for `seconds` seconds and wait for all of them to be answered
+async def burst(app, path, headers, rate, seconds):
+    results = []
+
+    async def one(due):
+        response = await asgi_get(app, path, headers)
+        results.append((response['status'], time.perf_counter() - due))
+
+    start = time.perf_counter()
+    total = int(rate * seconds)
+    requests = []
+    while len(requests) < total:
+        # the app runs on the same event loop, so after it has been busy several requests can be due at once
+        now = time.perf_counter()
+        while len(requests) < total and start + len(requests) / rate <= now:
+            requests.append(asyncio.ensure_future(one(start + len(requests) / rate)))
+        await asyncio.sleep(max(start + len(requests) / rate - time.perf_counter(), 0))
+    await asyncio.gather(*requests)
+    return results, time.perf_counter() - start
+
+
+def summarise(results, duration):
+    served = [latency for status, latency in results if status == 200]
+    shed = [latency for status, latency in results if status == 503]
+    return {
+        'sent': len(results),
+        'served': len(served),
+        'shed': len(shed),
+        'other': len(results) - len(served) - len(shed),
+        'goodput': len(served) / duration,
+        'served_p50_ms': statistics.median(served) * 1000 if served else 0.0,
+        'served_p99_ms': percentile(served, 0.99) * 1000,
+        'shed_p99_ms': percentile(shed, 0.99) * 1000
+    }
+
+
+# Turn the admission queues off by giving them room for everyone, or back on with the settings the app started with
+def set_admission(app_module, enabled):
+    for queue in app_module.route_queues.values():
+        if enabled:
+            queue.limit, queue.queue_size, queue.timeout = (app_module.ROUTE_CONCURRENCY, app_module.ROUTE_QUEUE_SIZE,
+                                                            app_module.ROUTE_QUEUE_TIMEOUT)
+        else:
+            queue.limit, queue.queue_size, queue.timeout = sys.maxsize, None, None
+        queue.service_time = None
+
+
+async def run(args):
+    os.environ["MEMORY_STORE_LATENCY"] = str(args.latency)
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        app_module = import_app(signer, "memory")
+        if not app_module.route_queues:
+            sys.exit("admission control is turned off, unset ROUTE_CONCURRENCY to run this benchmark")
+        state = await seed(app_module, args.tasks, args.tasks, args.members, 0)
+        path = f"/board/{state['board_id']}"
+        headers = {'Cookie': f"token={signer.token(state['creator_id'])}"}
+
+        await service_time(app_module.app, path, headers, 5)
+        mean = await service_time(app_module.app, path, headers, 20)
+        rate = args.load / mean
+        print(f"{path} on a board with {args.tasks} tasks takes {mean * 1000:.1f} ms on its own, sending "
+              f"{rate:.0f} requests a second ({args.load:g}x what one worker serves) for {args.seconds:g} s")
+        print(f"admission queues: {app_module.ROUTE_CONCURRENCY} at a time, {app_module.ROUTE_QUEUE_SIZE} waiting, "
+              f"{app_module.ROUTE_QUEUE_TIMEOUT:g} s timeout")
+
+        for label, enabled in (("admission off", False), ("admission on", True)):
+            set_admission(app_module, enabled)
+            result = summarise(*await burst(app_module.app, path, headers, rate, args.seconds))
+            print(f"  {label:<14} sent {result['sent']:>5}  served {result['served']:>5}  shed {result['shed']:>5}  "
+                  f"goodput {result['goodput']:>6.1f}/s  served p50 {result['served_p50_ms']:>7.0f} ms  "
+                  f"p99 {result['served_p99_ms']:>7.0f} ms  503 p99 {result['shed_p99_ms']:>5.0f} ms")
+            if result['other']:
+                print(f"  {result['other']} requests got neither a 200 nor a 503")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of the board page under more load than a worker can serve")
+    parser.add_argument("--tasks", type=int, default=1000, help="tasks on the board")
+    parser.add_argument("--members", type=int, default=20, help="members of the board besides the creator")
+    parser.add_argument("--load", type=float, default=2.0, help="requests sent as a multiple of what a worker serves")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long the burst lasts")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds each in-memory store operation takes")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Measures removing a member from a board when they have 10, 1k and 10k tasks assigned to them. The app runs in this
+# process and the request is sent to it through ASGI, so the firestore RPCs it makes can be counted.
+#
+# By default the app runs on the in-memory store, with every store operation taking --latency seconds, and needs
+# nothing else. --ref runs an older revision the same way (see memory_app.py) to compare against. With --backend
+# firestore start the emulator first:
+#     python benchmarks/remove_member.py --ref baseline-revision
+#     FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/remove_member.py --backend firestore
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, TokenSigner, RpcCounter, export_ref, import_app, import_memory_app
+
+
+# Create a board owned by creator_id with member_id on it and `tasks` tasks assigned to the member
+async def seed(main, creator_id, member_id, tasks):
+    db = main.firestore_db
+    board_ref = db.collection('boards').document()
+    await board_ref.set({
+        'name': f"Remove member {tasks}",
+        'creator_id': creator_id,
+        'creator_email': f"{creator_id}@bench.local",
+        'created_at': datetime.datetime.now(),
+        'members': [creator_id, member_id],
+        'active_tasks': tasks,
+        'completed_tasks': 0,
+        'counters_initialized': True
+    })
+    await db.collection('users').document(creator_id).set({
+        'name': creator_id, 'email': f"{creator_id}@bench.local", 'created_boards': [board_ref.id], 'member_boards': []
+    })
+    await db.collection('users').document(member_id).set({
+        'name': member_id, 'email': f"{member_id}@bench.local", 'created_boards': [], 'member_boards': [board_ref.id]
+    })
+
+    # written with plain batches rather than the app's helpers so older revisions can be seeded too
+    for start in range(0, tasks, 500):
+        batch = db.batch()
+        for i in range(start, min(start + 500, tasks)):
+            batch.set(db.collection('tasks').document(), {
+                'title': f"Task {i}",
+                'due_date': '2030-01-01',
+                'created_by': creator_id,
+                'created_at': datetime.datetime.now(),
+                'board_id': board_ref.id,
+                'completed': False,
+                'completion_date': None,
+                'assigned_to': member_id,
+                'unassigned': False
+            })
+        await batch.commit()
+    return board_ref.id
+
+
+async def run(main, signer, sizes, counter):
+    creator_id = "bench-creator"
+    token = signer.token(creator_id)
+
+    transport = httpx.ASGITransport(app=main.app)
+    client = httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={'token': token})
+    # one request first, so the timings don't include the signature check or anything set up on the first request
+    await client.get("/")
+
+    print(f"{'tasks':>8} {'latency ms':>12} {'rpcs':>6}  breakdown")
+    for tasks in sizes:
+        member_id = f"bench-member-{tasks}"
+        board_id = await seed(main, creator_id, member_id, tasks)
+        counter.reset()
+        start = time.perf_counter()
+        response = await client.post("/remove-user-from-board", data={'board_id': board_id, 'user_id': member_id})
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            print(f"{tasks}: the route answered {response.status_code}")
+        rpcs = counter.total()
+        breakdown = ", ".join(f"{name} {count}" for name, count in sorted(counter.counts.items()))
+
+        remaining = await (main.firestore_db.collection('tasks')
+                           .where('board_id', '==', board_id)
+                           .where('assigned_to', '==', member_id)
+                           .count().get())
+        if remaining[0][0].value:
+            print(f"{tasks}: {remaining[0][0].value} tasks are still assigned to the removed member")
+        print(f"{tasks:>8} {elapsed * 1000:>12.1f} {rpcs:>6}  {breakdown}")
+
+    await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RPC count and latency of removing a heavily assigned member")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000], help="assigned task counts")
+    parser.add_argument("--backend", choices=["memory", "firestore"], default="memory")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds each in-memory store operation takes")
+    parser.add_argument("--ref", help="git revision to measure instead of the current tree (memory backend only)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        if args.backend == "firestore":
+            app_module = import_app(signer)
+            counter = RpcCounter()
+        else:
+            tree = export_ref(args.ref, os.path.join(directory, "tree")) if args.ref else ROOT
+            app_module, client = import_memory_app(signer, tree, latency=args.latency)
+            counter = RpcCounter(client)
+        print(f"{args.ref or 'current tree'}, {args.backend} backend")
+        asyncio.run(run(app_module, signer, args.sizes, counter))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Loads the pages of the app twice the way a browser with a cache would and counts the requests and bytes each load
+# costs. The first load starts with an empty cache. On the second one a page or static file still fresh under its
+# Cache-Control max-age isn't requested at all, and one that has to be revalidated is asked for with If-None-Match.
+# The content hashed static files should never be requested again, and the script exits with an error if one is.
+#
+#     python benchmarks/repeat_load.py --tasks 2000
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import TokenSigner, import_app
+from routes import seed
+
+ASSET_PATTERN = re.compile(r'(?:href|src)="(?:https?://[^/"]+)?(/static/[^"]+)"')
+
+
+# Just enough of a browser's HTTP cache: responses are stored with their ETag and how long they stay fresh
+class BrowserCache:
+    def __init__(self):
+        self.entries = {}
+
+    def fresh(self, url):
+        entry = self.entries.get(url)
+        return entry is not None and entry['expires'] > time.monotonic()
+
+    def etag(self, url):
+        entry = self.entries.get(url)
+        return entry['etag'] if entry else None
+
+    def store(self, url, response):
+        cache_control = response.headers.get('cache-control', '')
+        if 'no-store' in cache_control:
+            return
+        max_age = re.search(r'max-age=(\d+)', cache_control)
+        self.entries[url] = {
+            'etag': response.headers.get('etag'),
+            'expires': time.monotonic() + (int(max_age.group(1)) if max_age and 'no-cache' not in cache_control
+                                           else 0),
+            'body': response.content
+        }
+
+    def body(self, url):
+        return self.entries[url]['body']
+
+
+# Load one page and the static files it links to through the cache. Returns what was sent over the wire
+async def load(client, cache, path, totals):
+    async def fetch(url, kind):
+        if cache.fresh(url):
+            totals[f'{kind}_from_cache'] += 1
+            return cache.body(url)
+        headers = {'If-None-Match': cache.etag(url)} if cache.etag(url) else {}
+        response = await client.get(url, headers=headers)
+        totals[f'{kind}_requests'] += 1
+        totals['bytes'] += response.num_bytes_downloaded
+        if response.status_code == 304:
+            totals[f'{kind}_not_modified'] += 1
+            return cache.body(url)
+        cache.store(url, response)
+        return response.content
+
+    html = (await fetch(path, 'page')).decode()
+    for asset in dict.fromkeys(ASSET_PATTERN.findall(html)):
+        await fetch(asset, 'static')
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        app_module = import_app(signer, "memory")
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        state = await seed(app_module, args.tasks, args.tasks, args.members, 0)
+        pages = ["/", f"/board/{state['board_id']}", "/my-tasks", "/profile"]
+
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                     headers={'Accept-Encoding': 'br, gzip'}) as client:
+            client.cookies.set("token", signer.token(state['creator_id']))
+            cache = BrowserCache()
+            static_repeats = 0
+            for label in ("first load", "repeat load"):
+                totals = dict.fromkeys(['page_requests', 'page_not_modified', 'page_from_cache', 'static_requests',
+                                        'static_not_modified', 'static_from_cache', 'bytes'], 0)
+                for path in pages:
+                    await load(client, cache, path, totals)
+                print(f"{label:<12} pages {totals['page_requests']} requested ({totals['page_not_modified']} 304)  "
+                      f"static {totals['static_requests']} requested ({totals['static_not_modified']} 304), "
+                      f"{totals['static_from_cache']} from cache  {totals['bytes']} bytes over the wire")
+                static_repeats = totals['static_requests']
+
+    if static_repeats:
+        sys.exit(f"the repeat load requested {static_repeats} static files, they should all come from the cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Requests and bytes of a first and a repeat load of every page")
+    parser.add_argument("--tasks", type=int, default=2000, help="tasks on the board")
+    parser.add_argument("--members", type=int, default=20, help="members of the board besides the creator")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# Drives every route of the app in this process through an ASGI client and reports latency, throughput and how many
+# documents each request reads and writes. A board is seeded for every scale, so the same routes are measured on a
+# small, a large and a very large board.
+#
+# With the in-memory store nothing else is needed:
+#     python benchmarks/routes.py --output benchmarks/baselines/routes-memory.json
+# or against the firestore emulator:
+#     FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/routes.py --backend firestore
+#
+# Pass --compare with a saved run to see what changed. Latencies depend on the machine but the reads and writes per
+# request don't, so a change in those is a real change in how the app talks to the database. The in-memory store
+# looks at every task on a board to answer a paged query where firestore reads only the page, so on the largest
+# boards its latencies are mostly the store and the emulator gives the more realistic numbers. The event stream and
+# force delete have their own benchmarks (sse_subscribers.py and force_delete.py) and are not driven here.
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import TokenSigner, RpcCounter, import_app, percentile
+
+# Each task and its title reservation are two writes, so 250 tasks fill a batch. Users are seeded the same way
+SEED_BATCH_TASKS = 250
+
+# The RPCs that read documents and the ones that write them, for counting against the emulator
+READ_RPCS = {'get_document', 'list_documents', 'batch_get_documents', 'run_query', 'run_aggregation_query'}
+WRITE_RPCS = {'update_document', 'delete_document', 'commit', 'batch_write'}
+
+
+# Counts reads and writes. The in-memory store counts documents the way firestore bills them, against the emulator
+# only the RPCs can be counted
+class UsageCounter:
+    def __init__(self, app_module):
+        self.db = app_module.firestore_db
+        self.rpcs = None if app_module.STORAGE_BACKEND == "memory" else RpcCounter()
+        self.unit = "documents" if self.rpcs is None else "rpcs"
+
+    def snapshot(self):
+        if self.rpcs is None:
+            return self.db.stats()
+        return {
+            'reads': sum(count for name, count in self.rpcs.counts.items() if name in READ_RPCS),
+            'writes': sum(count for name, count in self.rpcs.counts.items() if name in WRITE_RPCS)
+        }
+
+
+# Create a board with `tasks` tasks, their title reservations, `members` members and `guests` users who are not on
+# the board yet. Returns everything the routes need to know about what was seeded
+async def seed(app_module, scale, tasks, members, guests):
+    db = app_module.firestore_db
+    creator_id = f"bench-{scale}-creator"
+    member_ids = [creator_id] + [f"bench-{scale}-member-{i}" for i in range(members)]
+    guest_ids = [f"bench-{scale}-guest-{i}" for i in range(guests)]
+
+    board_ref = db.collection('boards').document()
+    await board_ref.set({
+        'name': f"Benchmark board {scale}",
+        'creator_id': creator_id,
+        'creator_email': f"{creator_id}@bench.local",
+        'created_at': datetime.datetime.now(),
+        'members': member_ids,
+        'active_tasks': tasks - (tasks + 2) // 3,
+        'completed_tasks': (tasks + 2) // 3,
+        'counters_initialized': True
+    })
+
+    # each user and their email index entry is two writes
+    user_ids = member_ids + guest_ids
+    for start in range(0, len(user_ids), SEED_BATCH_TASKS):
+        batch = db.batch()
+        for user_id in user_ids[start:start + SEED_BATCH_TASKS]:
+            batch.set(db.collection('users').document(user_id), {
+                'name': user_id,
+                'email': f"{user_id}@bench.local",
+                'created_boards': [board_ref.id] if user_id == creator_id else [],
+                'member_boards': [board_ref.id] if user_id in member_ids[1:] else []
+            })
+            batch.set(app_module.email_index_ref(f"{user_id}@bench.local"), {'user_id': user_id})
+        await batch.commit()
+
+    task_ids = []
+    for start in range(0, tasks, SEED_BATCH_TASKS):
+        batch = db.batch()
+        for i in range(start, min(start + SEED_BATCH_TASKS, tasks)):
+            task_ref = db.collection('tasks').document()
+            title = f"Task {i}"
+            task_data = app_module.new_task_data(
+                board_ref.id, title, f"2030-{i % 12 + 1:02d}-{i % 28 + 1:02d}", member_ids[i % len(member_ids)],
+                creator_id
+            )
+            if i % 3 == 0:
+                task_data['completed'] = True
+                task_data['completion_date'] = task_data['created_at']
+            batch.set(task_ref, task_data)
+            batch.set(app_module.title_reservation_ref(board_ref.id, title), {
+                'board_id': board_ref.id, 'title': title, 'task_id': task_ref.id
+            })
+            task_ids.append(task_ref.id)
+        await batch.commit()
+
+    return {
+        'board_id': board_ref.id,
+        'creator_id': creator_id,
+        'member_ids': member_ids,
+        'guest_ids': guest_ids,
+        'task_ids': task_ids,
+        'added_task_ids': [],
+        'api_task_ids': [],
+        'created_board_ids': []
+    }
+
+
+# The routes to measure, in the order they run. Each one is a label, a function that builds the i-th request from the
+# seeded state and optionally a function that records something from the response for a later route. The routes that
+# only read come first, the ones that delete what earlier routes created come last
+def route_list(state):
+    board_id = state['board_id']
+    task_ids = state['task_ids']
+    json_headers = {'Accept': 'application/json'}
+
+    def seeded_task(i):
+        return task_ids[i % len(task_ids)]
+
+    def record_added(response):
+        if response.status_code == 200:
+            state['added_task_ids'].append(response.json()['task_id'])
+
+    def record_api_created(response):
+        if response.status_code == 200:
+            state['api_task_ids'].extend(item['id'] for item in response.json()['results'] if 'id' in item)
+
+    def api_batch(i):
+        return state['api_task_ids'][i * 10:(i + 1) * 10]
+
+    return [
+        ("GET /login", lambda i: ("GET", "/login", {}), None),
+        ("GET /", lambda i: ("GET", "/", {}), None),
+        ("GET /profile", lambda i: ("GET", "/profile", {}), None),
+        ("GET /new-board", lambda i: ("GET", "/new-board", {}), None),
+        ("GET /my-tasks", lambda i: ("GET", "/my-tasks", {}), None),
+        ("GET /board", lambda i: ("GET", f"/board/{board_id}", {}), None),
+        ("GET /board?filter=completed", lambda i: ("GET", f"/board/{board_id}", {'params': {'filter': 'completed'}}),
+         None),
+        ("GET /board/tasks", lambda i: ("GET", f"/board/{board_id}/tasks", {'params': {'filter': 'active'}}), None),
+        ("GET /api/v1/boards/summary", lambda i: ("GET", f"/api/v1/boards/{board_id}/summary", {}), None),
+        ("GET /api/v1/boards/tasks", lambda i: ("GET", f"/api/v1/boards/{board_id}/tasks", {}), None),
+        ("GET /api/v1/my-tasks", lambda i: ("GET", "/api/v1/my-tasks", {}), None),
+        ("POST /add-task", lambda i: ("POST", "/add-task", {'headers': json_headers, 'data': {
+            'board_id': board_id, 'title': f"Added {i}", 'due_date': '2030-06-01', 'assigned_to': state['creator_id']
+        }}), record_added),
+        ("POST /edit-task", lambda i: ("POST", "/edit-task", {'headers': json_headers, 'data': {
+            'board_id': board_id, 'task_id': seeded_task(i), 'title': f"Edited {i}", 'due_date': '2030-07-01',
+            'assigned_to': state['creator_id']
+        }}), None),
+        ("POST /toggle-task", lambda i: ("POST", "/toggle-task", {'headers': json_headers, 'data': {
+            'board_id': board_id, 'task_id': seeded_task(i)
+        }}), None),
+        ("POST /api/v1/boards/tasks", lambda i: ("POST", f"/api/v1/boards/{board_id}/tasks", {'json': {
+            'tasks': [{'title': f"Bulk {i}-{j}", 'due_date': '2030-08-01'} for j in range(10)]
+        }}), record_api_created),
+        ("PATCH /api/v1/boards/tasks", lambda i: ("PATCH", f"/api/v1/boards/{board_id}/tasks", {'json': {
+            'tasks': [{'id': task_id, 'assigned_to': state['creator_id']} for task_id in api_batch(i)]
+        }}), None),
+        ("POST /api/v1/boards/tasks/complete", lambda i: ("POST", f"/api/v1/boards/{board_id}/tasks/complete", {
+            'json': {'task_ids': api_batch(i)}
+        }), None),
+        ("POST /api/v1/boards/tasks/delete", lambda i: ("POST", f"/api/v1/boards/{board_id}/tasks/delete", {
+            'json': {'task_ids': api_batch(i)}
+        }), None),
+        ("POST /delete-task", lambda i: ("POST", "/delete-task", {'headers': json_headers, 'data': {
+            'board_id': board_id, 'task_id': state['added_task_ids'][i % len(state['added_task_ids'])]
+        }}), None),
+        ("POST /rename-board", lambda i: ("POST", "/rename-board", {'data': {
+            'board_id': board_id, 'new_name': f"Benchmark board {i}"
+        }}), None),
+        ("POST /add-user-to-board", lambda i: ("POST", "/add-user-to-board", {'data': {
+            'board_id': board_id, 'user_email': f"{state['guest_ids'][i % len(state['guest_ids'])]}@bench.local"
+        }}), None),
+        ("POST /remove-user-from-board", lambda i: ("POST", "/remove-user-from-board", {'data': {
+            'board_id': board_id, 'user_id': state['guest_ids'][i % len(state['guest_ids'])]
+        }}), None),
+        ("POST /create-board", lambda i: ("POST", "/create-board", {'data': {'board_name': f"Created {i}"}}), None),
+        ("POST /delete-board", lambda i: ("POST", "/delete-board", {'data': {
+            'board_id': state['created_board_ids'][i % len(state['created_board_ids'])]
+        }}), None),
+    ]
+
+
+# Send `total` requests built by `build`, at most `concurrency` at a time, and summarise the latencies and usage
+async def measure(client, counter, build, record, concurrency, total):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(i):
+        nonlocal errors
+        method, path, kwargs = build(i)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+        # redirects are how the form routes answer, anything else at or above 400 is an error
+        if response.status_code >= 400:
+            errors += 1
+        if record:
+            record(response)
+
+    before = counter.snapshot()
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total)))
+    duration = time.perf_counter() - start
+    after = counter.snapshot()
+
+    return {
+        'requests': total,
+        'errors': errors,
+        'throughput': round(total / duration, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'reads_per_request': round((after['reads'] - before['reads']) / total, 2),
+        'writes_per_request': round((after['writes'] - before['writes']) / total, 2)
+    }
+
+
+async def run_scale(app_module, signer, counter, scale, args):
+    state = await seed(app_module, scale, scale, args.members, args.requests)
+    transport = httpx.ASGITransport(app=app_module.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        client.cookies.set("token", signer.token(state['creator_id']))
+        # warm up the token cache and the board cache before measuring
+        for _ in range(3):
+            await client.get(f"/board/{state['board_id']}")
+
+        for label, build, record in route_list(state):
+            if label == "POST /delete-board":
+                user = await app_module.firestore_db.collection('users').document(state['creator_id']).get()
+                state['created_board_ids'] = [
+                    board_id for board_id in user.get('created_boards') if board_id != state['board_id']
+                ]
+            results[label] = await measure(client, counter, build, record, args.concurrency, args.requests)
+            print_result(label, results[label])
+    return results
+
+
+def print_result(label, result):
+    print(f"  {label:<38} {result['throughput']:>8.1f} req/s  p50 {result['p50_ms']:>8.1f} ms  "
+          f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+          f"reads {result['reads_per_request']:>8.2f}  writes {result['writes_per_request']:>6.2f}  "
+          f"errors {result['errors']}")
+
+
+# Print the routes whose reads or writes per request changed since a saved run, and how the median latency moved
+def compare(results, baseline):
+    print(f"Compared with the saved run ({baseline['backend']}, counting {baseline['unit']})")
+    for scale, routes in results['scales'].items():
+        saved_routes = baseline['scales'].get(scale, {})
+        for label, result in routes.items():
+            saved = saved_routes.get(label)
+            if saved is None:
+                print(f"  {scale:>6} {label:<38} new")
+                continue
+            usage = ""
+            for key in ('reads_per_request', 'writes_per_request'):
+                if result[key] != saved[key]:
+                    usage += f"  {key.split('_')[0]} {saved[key]:.2f} -> {result[key]:.2f}"
+            ratio = result['p50_ms'] / saved['p50_ms'] if saved['p50_ms'] else 1.0
+            if usage or abs(ratio - 1) >= 0.25:
+                print(f"  {scale:>6} {label:<38} p50 x{ratio:.2f}{usage}")
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        app_module = import_app(signer, args.backend)
+        # httpx logs every request it sends, keep that out of the report
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        counter = UsageCounter(app_module)
+
+        results = {
+            'backend': app_module.STORAGE_BACKEND,
+            'unit': counter.unit,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'members': args.members,
+            'scales': {}
+        }
+        for scale in args.scales:
+            print(f"{scale} tasks")
+            start = time.perf_counter()
+            results['scales'][str(scale)] = await run_scale(app_module, signer, counter, scale, args)
+            print(f"  finished in {time.perf_counter() - start:.1f}s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency, throughput and database usage of every route")
+    parser.add_argument("--backend", choices=["memory", "firestore"], default="memory",
+                        help="run against the in-memory store or the firestore emulator")
+    parser.add_argument("--scales", type=lambda value: [int(scale) for scale in value.split(",")],
+                        default=[10, 1000, 50000], help="comma separated number of tasks on the board")
+    parser.add_argument("--members", type=int, default=20, help="members of each board besides the creator")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--requests", type=int, default=100, help="requests per route")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+            output.write("\n")
+    if args.compare:
+        with open(args.compare) as saved:
+            compare(results, json.load(saved))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# Opens many live event streams on one board against a single server worker, then adds tasks and measures how long
+# each change takes to reach every subscriber. All the subscribers share one set of firestore listeners, so the time
+# to fan a change out should grow with the number of open streams, not the number of firestore reads.
+#
+# Start the firestore emulator, then run:
+#     FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/sse_subscribers.py --subscribers 1000
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import requests
+from google.cloud import firestore
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, EMULATOR_PROJECT, TokenSigner, emulator_env, percentile, start_server, stop_server
+
+
+def seed(db, creator_id):
+    board_ref = db.collection('boards').document()
+    board_ref.set({
+        'name': 'Live updates',
+        'creator_id': creator_id,
+        'creator_email': f"{creator_id}@bench.local",
+        'created_at': datetime.datetime.now(),
+        'members': [creator_id],
+        'active_tasks': 0,
+        'completed_tasks': 0,
+        'counters_initialized': True
+    })
+    db.collection('users').document(creator_id).set({
+        'name': creator_id, 'email': f"{creator_id}@bench.local", 'created_boards': [board_ref.id], 'member_boards': []
+    })
+    return board_ref.id
+
+
+# One subscriber. Opens the event stream over a raw connection and records when each task it is waiting for arrives
+class Subscriber:
+    def __init__(self, base_url, board_id, token):
+        self.url = urllib.parse.urlparse(base_url)
+        self.board_id = board_id
+        self.token = token
+        self.arrivals = {}
+        self.connected = asyncio.Event()
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection(self.url.hostname, self.url.port)
+        writer.write((
+            f"GET /board/{self.board_id}/events HTTP/1.1\r\n"
+            f"Host: {self.url.netloc}\r\n"
+            f"Cookie: token={self.token}\r\n"
+            f"Accept: text/event-stream\r\n\r\n"
+        ).encode())
+        await writer.drain()
+
+        event_type = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                line = line.decode().strip()
+                if line.startswith("retry:"):
+                    self.connected.set()
+                elif line.startswith("event:"):
+                    event_type = line[len("event:"):].strip()
+                elif line.startswith("data:") and event_type == "tasks":
+                    for task in json.loads(line[len("data:"):])['tasks']:
+                        if task['change'] == 'added':
+                            self.arrivals.setdefault(task['id'], time.perf_counter())
+        finally:
+            writer.close()
+
+
+async def run(base_url, board_id, token, subscribers, changes, interval):
+    clients = [Subscriber(base_url, board_id, token) for _ in range(subscribers)]
+    streams = [asyncio.ensure_future(client.run()) for client in clients]
+
+    start = time.perf_counter()
+    await asyncio.wait_for(asyncio.gather(*(client.connected.wait() for client in clients)), 120)
+    print(f"{subscribers} subscribers connected in {time.perf_counter() - start:.2f}s")
+
+    loop = asyncio.get_running_loop()
+    session = requests.Session()
+    session.cookies.set("token", token)
+    headers = {'Accept': 'application/json'}
+
+    sent = {}
+    for i in range(changes):
+        form = {'board_id': board_id, 'title': f"live task {i}", 'due_date': '2030-01-01'}
+        sent_at = time.perf_counter()
+        response = await loop.run_in_executor(
+            None, lambda: session.post(f"{base_url}/add-task", data=form, headers=headers)
+        )
+        response.raise_for_status()
+        sent[response.json()['task_id']] = sent_at
+        await asyncio.sleep(interval)
+
+    # give the last change time to reach everyone
+    await asyncio.sleep(2)
+    for stream in streams:
+        stream.cancel()
+    await asyncio.gather(*streams, return_exceptions=True)
+
+    latencies = []
+    missed = 0
+    for client in clients:
+        for task_id, sent_at in sent.items():
+            if task_id in client.arrivals:
+                latencies.append(client.arrivals[task_id] - sent_at)
+            else:
+                missed += 1
+    return latencies, missed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how fast board changes reach many live subscribers")
+    parser.add_argument("--subscribers", type=int, default=500, help="event streams open on the board")
+    parser.add_argument("--changes", type=int, default=20, help="tasks added while the streams are open")
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between changes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        env = emulator_env(signer)
+        db = firestore.Client(project=EMULATOR_PROJECT)
+
+        creator_id = "live-creator"
+        board_id = seed(db, creator_id)
+        token = signer.token(creator_id)
+
+        process, base_url = start_server(ROOT, env, workers=1)
+        try:
+            latencies, missed = asyncio.run(
+                run(base_url, board_id, token, args.subscribers, args.changes, args.interval)
+            )
+        finally:
+            stop_server(process)
+
+    print(f"{len(latencies)} deliveries, {missed} missed")
+    print(f"write to delivery  p50 {percentile(latencies, 0.50) * 1000:>8.1f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:>8.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:>8.1f} ms  "
+          f"max {max(latencies, default=0) * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Measures how long a worker takes to start: importing main.py, then running the app's startup and shutdown the way
+# uvicorn does. Every run is a fresh python process so nothing is already imported. The firestore runs point at an
+# emulator address that nothing listens on, which is fine as starting up must not connect to anything. The last check
+# imports the app with no emulator and no google credentials at all, which has to work for tools like maintenance.py.
+# Pass --ref to compare against an older revision.
+#
+#     python benchmarks/startup.py --runs 10 --ref HEAD~1
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import ROOT, EMULATOR_PROJECT, TokenSigner, export_ref
+
+# Run in the app's directory by a fresh interpreter. Prints the import and startup times as JSON, or only imports
+# the app when given the argument 'import'
+PROBE = """
+import asyncio, json, sys, time
+sys.path.insert(0, '.')
+start = time.perf_counter()
+try:
+    import main
+except Exception as err:
+    print(json.dumps({'error': f'{type(err).__name__}: {err}'}))
+    sys.exit(0)
+imported = time.perf_counter()
+if sys.argv[1:] == ['import']:
+    print(json.dumps({'import_s': imported - start}))
+    sys.exit(0)
+
+async def lifespan():
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+    return started
+
+started = asyncio.run(lifespan())
+print(json.dumps({'import_s': imported - start, 'startup_s': started - imported,
+                  'shutdown_s': time.perf_counter() - started}))
+"""
+
+# Settings that would let the app find credentials or a real project, cleared so every run starts from nothing
+CREDENTIAL_SETTINGS = ("GOOGLE_APPLICATION_CREDENTIALS", "FIRESTORE_EMULATOR_HOST", "GOOGLE_CLOUD_PROJECT")
+
+
+def probe_env(signer, backend, emulator=True):
+    env = {name: value for name, value in os.environ.items() if name not in CREDENTIAL_SETTINGS}
+    env["STORAGE_BACKEND"] = backend
+    env["FIREBASE_CERTS_FILE"] = signer.certs_file
+    env["STATIC_BUILD_DIR"] = os.path.join(os.path.dirname(signer.certs_file), "static")
+    if backend == "firestore" and emulator:
+        env["FIRESTORE_EMULATOR_HOST"] = "127.0.0.1:9"
+        env["GOOGLE_CLOUD_PROJECT"] = EMULATOR_PROJECT
+    return env
+
+
+def probe(app_dir, env, import_only=False):
+    command = [sys.executable, "-c", PROBE] + (["import"] if import_only else [])
+    result = subprocess.run(command, cwd=app_dir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# The modules that take longest to import, from python's own -X importtime report
+def slowest_imports(app_dir, env, count):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=app_dir, env=env,
+                            capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nested imports are indented two spaces a level. Only the modules main.py imports itself are listed, what
+        # they import is part of their cumulative time
+        if len(name) - len(name.lstrip()) == 3:
+            modules.append((int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def benchmark(label, app_dir, signer, args):
+    results = {}
+    for backend in ("memory", "firestore"):
+        env = probe_env(signer, backend)
+        runs = [probe(app_dir, env) for _ in range(args.runs)]
+        errors = [run['error'] for run in runs if 'error' in run]
+        if errors:
+            print(f"{label:<10} {backend:<10} failed: {errors[0]}")
+            results[backend] = {'error': errors[0]}
+            continue
+        summary = {
+            name: statistics.median(run[name] for run in runs) * 1000
+            for name in ('import_s', 'startup_s', 'shutdown_s')
+        }
+        results[backend] = summary
+        print(f"{label:<10} {backend:<10} import {summary['import_s']:>7.1f} ms  "
+              f"startup {summary['startup_s']:>7.1f} ms  shutdown {summary['shutdown_s']:>6.1f} ms  "
+              f"(median of {args.runs})")
+
+    no_credentials = probe(app_dir, probe_env(signer, "firestore", emulator=False), import_only=True)
+    results['no_credentials'] = no_credentials
+    print(f"{label:<10} import with no credentials: "
+          f"{'failed, ' + no_credentials['error'] if 'error' in no_credentials else 'ok'}")
+
+    if args.imports:
+        print(f"{label:<10} slowest imports of main.py (cumulative):")
+        for microseconds, name in slowest_imports(app_dir, probe_env(signer, "firestore"), args.imports):
+            print(f"{'':<12}{microseconds / 1000:>8.1f} ms  {name}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import, startup and shutdown time of a worker")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--imports", type=int, default=8, help="how many of the slowest imports to list")
+    parser.add_argument("--ref", help="git revision to compare the current tree against")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        signer = TokenSigner(directory)
+        results = {'current': benchmark("current", ROOT, signer, args)}
+        if args.ref:
+            app_dir = export_ref(args.ref, os.path.join(directory, "ref"))
+            results[args.ref] = benchmark(args.ref, app_dir, signer, args)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+            output.write("\n")
+
+
+if __name__ == "__main__":
+    main()
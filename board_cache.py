@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# An in-memory read-through cache of board documents so membership and creator checks don't need a firestore read on
+# every request. A board that isn't cached is loaded with `loader` (an async function taking a board id and returning
+# a snapshot) and kept until it is evicted as the least recently used board.
+#
+# If a `subscribe` function is given, each cached board gets a listener that keeps its entry up to date. It is called
+# as subscribe(board_id, on_change) and must return a function that stops the listener. on_change(board_id, snapshot)
+# can be called from any thread, with snapshot set to None when the board has been deleted. Listeners are limited to
+# `max_listeners` boards, any other board is only trusted for `ttl` seconds before it is loaded again.
+#
+# Loads can overlap with each other and with listener updates, so a copy is never replaced by an older one: a load
+# that finishes after a newer copy was cached keeps the newer copy, and a load older than the last version a listener
+# reported isn't cached at all, as nothing would replace it until the board changed again.
+class BoardCache:
+    def __init__(self, loader, subscribe=None, max_size=1000, max_listeners=100, ttl=5.0, clock=time.monotonic):
+        self._loader = loader
+        self._subscribe = subscribe
+        self._max_size = max_size
+        self._max_listeners = max_listeners
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._unsubscribes = {}
+        # the update time of the newest version of each listened to board, whether or not it is cached
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    # Return the snapshot of a board, from the cache if we have a fresh copy
+    async def get(self, board_id):
+        with self._lock:
+            entry = self._entries.get(board_id)
+            if entry is not None and (board_id in self._unsubscribes or self._clock() - entry[1] < self._ttl):
+                self._entries.move_to_end(board_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        snapshot = self._store(board_id, await self._loader(board_id))
+        self._listen(board_id)
+        return snapshot
+
+    # Forget a board so the next request loads it again. Routes call this after they change a board so the person
+    # who made the change never sees the old version, even before the listener catches up. The listener is kept
+    def invalidate(self, board_id):
+        with self._lock:
+            if self._entries.pop(board_id, None) is not None:
+                self.invalidations += 1
+
+    # Called by a listener when a board changes. A change that is older than the copy we already have (which can
+    # happen just after a route has invalidated and reloaded the board) is ignored. A board that isn't cached, such as
+    # one that was just invalidated, isn't stored as the change could be older than the write of the route that
+    # invalidated it, but its update time is kept so a load that read the board before the change isn't cached
+    def _on_change(self, board_id, snapshot):
+        with self._lock:
+            if snapshot is not None and snapshot.exists and board_id in self._unsubscribes and \
+                    not _older(snapshot.update_time, self._versions.get(board_id)):
+                self._versions[board_id] = snapshot.update_time
+            entry = self._entries.get(board_id)
+            if entry is None:
+                return
+            if snapshot is not None and snapshot.exists and entry[0].exists and \
+                    _older(snapshot.update_time, entry[0].update_time):
+                return
+            self.invalidations += 1
+            if snapshot is None or not snapshot.exists:
+                del self._entries[board_id]
+            else:
+                self._entries[board_id] = (snapshot, self._clock())
+        if snapshot is None or not snapshot.exists:
+            self._stop_listening(board_id)
+
+    # Cache a board that was just loaded and return the copy to use, which is the cached one if it is newer
+    def _store(self, board_id, snapshot):
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(board_id)
+            if snapshot.exists:
+                if entry is not None and entry[0].exists and _older(snapshot.update_time, entry[0].update_time):
+                    self._entries.move_to_end(board_id)
+                    return entry[0]
+                if _older(snapshot.update_time, self._versions.get(board_id)):
+                    return snapshot
+            self._entries[board_id] = (snapshot, self._clock())
+            self._entries.move_to_end(board_id)
+            while len(self._entries) > self._max_size:
+                evicted.append(self._entries.popitem(last=False)[0])
+                self.evictions += 1
+        for evicted_id in evicted:
+            self._stop_listening(evicted_id)
+        return snapshot
+
+    # Start a listener for a board if we are allowed another one
+    def _listen(self, board_id):
+        if self._subscribe is None:
+            return
+        with self._lock:
+            if board_id in self._unsubscribes or len(self._unsubscribes) >= self._max_listeners:
+                return
+            if board_id not in self._entries:
+                return
+            # reserve the slot before subscribing as the first change can arrive straight away
+            self._unsubscribes[board_id] = None
+        try:
+            unsubscribe = self._subscribe(board_id, self._on_change)
+        except Exception as err:
+            logger.warning(f"Could not listen to board {board_id}: {str(err)}")
+            with self._lock:
+                self._unsubscribes.pop(board_id, None)
+            return
+        with self._lock:
+            if board_id in self._unsubscribes:
+                self._unsubscribes[board_id] = unsubscribe
+                return
+        # the board was evicted or deleted while we were subscribing
+        unsubscribe()
+
+    # Stop every listener. Called when the app shuts down, boards are then only trusted for `ttl` seconds
+    def close(self):
+        with self._lock:
+            board_ids = list(self._unsubscribes)
+        for board_id in board_ids:
+            self._stop_listening(board_id)
+
+    def _stop_listening(self, board_id):
+        with self._lock:
+            unsubscribe = self._unsubscribes.pop(board_id, None)
+            self._versions.pop(board_id, None)
+        if unsubscribe is not None:
+            unsubscribe()
+
+    # Counters so we can see how well the cache is doing
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'listeners': len(self._unsubscribes)
+            }
+
+
+# True if update time `a` is before `b`. Either can be None when it isn't known, which is never older
+def _older(a, b):
+    return a is not None and b is not None and a < b
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Fans out live changes on a board to everyone who has the board open. All the viewers of a board share one
+# listener, which is started when the first viewer connects and stopped when the last one leaves.
+#
+# `subscribe` is called as subscribe(board_id, on_event) and must return a function that stops the listener.
+# on_event(event) can be called from any thread. If a `prepare` coroutine is given it is run once for each event,
+# before the event is sent to the viewers, so work like rendering HTML is shared by all of them. It can return None to
+# drop an event. Every viewer has a bounded queue, and a viewer that falls too far behind is sent a 'reload' event
+# and disconnected rather than holding up everyone else.
+class BoardEventHub:
+    def __init__(self, subscribe, prepare=None, queue_size=100, keepalive=15.0):
+        self._subscribe = subscribe
+        self._prepare = prepare
+        self._queue_size = queue_size
+        self._keepalive = keepalive
+        self._channels = {}
+        self.events_sent = 0
+        self.viewers_dropped = 0
+
+    # Async generator of the events for a board. Yields {'type': 'ping'} when nothing has happened for a while so the
+    # caller can keep the connection open, and finishes after a 'reload' event
+    async def listen(self, board_id):
+        queue = asyncio.Queue(self._queue_size)
+        channel = self._channels.get(board_id)
+        if channel is None:
+            channel = self._open(board_id)
+        channel.viewers.add(queue)
+
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self._keepalive)
+                except asyncio.TimeoutError:
+                    yield {'type': 'ping'}
+                    continue
+                yield event
+                if event['type'] == 'reload':
+                    return
+        finally:
+            channel.viewers.discard(queue)
+            if not channel.viewers and self._channels.get(board_id) is channel:
+                self._close(board_id)
+
+    # The number of people watching a board, or all boards if no board is given
+    def viewer_count(self, board_id=None):
+        if board_id is not None:
+            channel = self._channels.get(board_id)
+            return len(channel.viewers) if channel else 0
+        return sum(len(channel.viewers) for channel in self._channels.values())
+
+    def stats(self):
+        return {
+            'boards': len(self._channels),
+            'viewers': self.viewer_count(),
+            'events_sent': self.events_sent,
+            'viewers_dropped': self.viewers_dropped
+        }
+
+    # Stop every board's listener. Called when the app shuts down, viewers still connected stop getting events
+    def close(self):
+        for board_id in list(self._channels):
+            self._close(board_id)
+
+    # Start the listener for a board and the pump that hands its events out. The channel is only registered once the
+    # listener is running, so if subscribing fails the next viewer tries again instead of joining a channel that will
+    # never get an event
+    def _open(self, board_id):
+        loop = asyncio.get_running_loop()
+        channel = _Channel()
+
+        # events arrive on the listener's thread so hand them over to the event loop
+        def on_event(event):
+            loop.call_soon_threadsafe(channel.inbox.put_nowait, event)
+
+        channel.unsubscribe = self._subscribe(board_id, on_event)
+        channel.pump = asyncio.ensure_future(self._pump(board_id, channel))
+        self._channels[board_id] = channel
+        return channel
+
+    def _close(self, board_id):
+        channel = self._channels.pop(board_id)
+        channel.pump.cancel()
+        if channel.unsubscribe is not None:
+            channel.unsubscribe()
+
+    # Take events for a board off its inbox one at a time, so they reach the viewers in the order they happened
+    async def _pump(self, board_id, channel):
+        while True:
+            event = await channel.inbox.get()
+            if self._prepare is not None:
+                try:
+                    event = await self._prepare(board_id, event)
+                except Exception as err:
+                    logger.warning(f"Could not prepare event for board {board_id}: {str(err)}")
+                    event = {'type': 'reload'}
+            if event is None:
+                continue
+
+            for queue in list(channel.viewers):
+                try:
+                    queue.put_nowait(event)
+                    self.events_sent += 1
+                except asyncio.QueueFull:
+                    # this viewer isn't keeping up, throw away what it hasn't read and tell it to reload the page
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait({'type': 'reload'})
+                    channel.viewers.discard(queue)
+                    self.viewers_dropped += 1
+
+
+# The viewers of one board, the queue their events arrive on and the listener feeding it
+class _Channel:
+    def __init__(self):
+        self.viewers = set()
+        self.inbox = asyncio.Queue()
+        self.pump = None
+        self.unsubscribe = None
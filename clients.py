@@ -0,0 +1,111 @@
+import asyncio
+import inspect
+import itertools
+import os
+import threading
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.services.firestore.transports.grpc_asyncio import FirestoreGrpcAsyncIOTransport
+
+
+# Stands in for a client that is only created the first time it is used, and hands every attribute lookup on to it so
+# code can use the LazyClient as if it were the client. Nothing is created when the module holding it is imported,
+# which keeps imports fast and means they don't need credentials. A client holding gRPC channels can't be used in a
+# process forked after the channels were opened, so a forked child forgets the client and creates its own.
+# close(client), if given, is how the client is closed and can be a coroutine function
+class LazyClient:
+    def __init__(self, factory, close=None):
+        self._factory = factory
+        self._close = close
+        self._client = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._forget)
+
+    # The client, created if this process hasn't made one yet
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    @property
+    def created(self):
+        return self._client is not None
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is not None and self._close is not None:
+            result = self._close(client)
+            if inspect.isawaitable(result):
+                await result
+
+    # Run in a forked child. The parent's client and lock are left alone, the child never touches them
+    def _forget(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+# The gRPC transport of PooledAsyncClient. Every channel it opens gets a subchannel pool of its own, which is what makes
+# gRPC open a separate connection for each channel instead of sharing one between channels with the same settings
+class PooledGrpcAsyncIOTransport(FirestoreGrpcAsyncIOTransport):
+    @classmethod
+    def create_channel(cls, *args, options=(), **kwargs):
+        options = list(options) + [("grpc.use_local_subchannel_pool", 1)]
+        return super().create_channel(*args, options=options, **kwargs)
+
+
+# The async firestore client with its requests spread over `channels` gRPC channels, taken in turn. One connection
+# carries at most 100 requests at a time, so a worker that has more than that in flight needs more than one. The
+# channels are opened by the first request, on the event loop that will use them, and close() closes them
+class PooledAsyncClient(firestore.AsyncClient):
+    def __init__(self, *args, channels=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.channels = max(int(channels), 1)
+        self._apis = []
+        self._turn = itertools.count()
+
+    # _firestore_api_helper is private to google-cloud-firestore and this override is written against 2.20.0, the
+    # version pinned in requirements.txt. Check it still applies before upgrading, tests/test_clients.py fails if the
+    # client stops going through it or stops taking the channels in turn
+    def _firestore_api_helper(self, transport, client_class, client_module):
+        if not self._apis:
+            apis = []
+            for _ in range(self.channels):
+                # the base class builds one API client and keeps it, make it build a new one each time round
+                self._firestore_api_internal = None
+                apis.append(super()._firestore_api_helper(PooledGrpcAsyncIOTransport, client_class, client_module))
+            self._apis = apis
+        return self._apis[next(self._turn) % len(self._apis)]
+
+    async def close(self):
+        apis, self._apis = self._apis, []
+        self._firestore_api_internal = None
+        await asyncio.gather(*(api.transport.close() for api in apis))
+
+
+# Close whichever client it is given. The synchronous client used for listeners has no close() of its own, its channel
+# is closed through the API client if it ever opened one. The in-memory store has nothing to close
+def close_client(client):
+    if isinstance(client, firestore.Client):
+        api = client._firestore_api_internal
+        if api is not None:
+            api.transport.close()
+        return None
+    close = getattr(client, "close", None)
+    return close() if close is not None else None
+
+
+# Credentials from a service account key file, along with its project. Without a key file the clients fall back to
+# google's default credentials, or to the emulator when FIRESTORE_EMULATOR_HOST is set
+def service_account_settings(path):
+    if not os.path.exists(path):
+        return {}
+    from google.oauth2 import service_account
+    credentials = service_account.Credentials.from_service_account_file(path)
+    return {'credentials': credentials, 'project': credentials.project_id}
@@ -0,0 +1,154 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses with these content types are compressed, anything else (images, fonts) is already compressed or too small
+# to be worth it. Event streams are left alone so every event is sent as soon as it happens
+COMPRESSIBLE_TYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'application/javascript', 'text/javascript',
+    'application/json', 'application/x-ndjson', 'image/svg+xml'
+)
+
+
+# The encodings named in an Accept-Encoding header, leaving out the ones the client turns down with q=0
+def accepted_encodings(accept_encoding):
+    accepted = set()
+    for entry in accept_encoding.split(","):
+        name, _, parameters = entry.strip().partition(";")
+        quality = parameters.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+# The encoding to answer a request with: br when the client takes it and the brotli package is installed, then gzip
+def choose_encoding(accept_encoding):
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._finish = self._compressor.finish
+            self._add = self._compressor.process
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._finish = self._compressor.flush
+            self._add = self._compressor.compress
+
+    def compress(self, data, last):
+        output = self._add(data) if data else b""
+        return output + self._finish() if last else output
+
+
+# ASGI middleware that compresses text responses with br or gzip, whichever the client prefers that we have. A body
+# sent in one piece is only compressed when it is at least minimum_size bytes. Streamed bodies are compressed as they
+# go. Responses that already have a Content-Encoding are passed through, and so are 304s and other empty responses.
+# A strong ETag is made weak on a compressed response because the bytes differ from the uncompressed one, which the
+# conditional request checks here and in StaticFiles treat as the same
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=500, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        start_message = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                response_headers = start_message.get("headers", [])
+                if not compressible(response_headers):
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                response_headers = [(name, value) for name, value in response_headers if name.lower() != b"vary"] + \
+                    [(b"vary", vary_value(response_headers))]
+                if encoding is None or (not more_body and len(body) < self.minimum_size):
+                    start_message["headers"] = response_headers
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                start_message["headers"] = encoded_headers(response_headers, encoding)
+                if not more_body:
+                    # the whole body is here so it can go out with its length
+                    body = compressor.compress(body, True)
+                    start_message["headers"].append((b"content-length", str(len(body)).encode("latin-1")))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, not more_body),
+                "more_body": more_body
+            })
+
+        await self.app(scope, receive, send_compressed)
+
+
+# Whether a response should be compressed, from the headers it was started with
+def compressible(headers):
+    content_type = b""
+    for name, value in headers:
+        name = name.lower()
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value
+    return content_type.split(b";")[0].strip().decode("latin-1").lower() in COMPRESSIBLE_TYPES
+
+
+# The Vary header of a response with Accept-Encoding added to whatever it already varied on
+def vary_value(headers):
+    values = [value.decode("latin-1") for name, value in headers if name.lower() == b"vary"]
+    fields = [field.strip() for value in values for field in value.split(",") if field.strip()]
+    if "accept-encoding" not in [field.lower() for field in fields]:
+        fields.append("Accept-Encoding")
+    return ", ".join(fields).encode("latin-1")
+
+
+# The headers of a response once its body is compressed. The old length is dropped, a streamed body is sent chunked
+def encoded_headers(headers, encoding):
+    encoded = []
+    for name, value in headers:
+        if name.lower() == b"content-length":
+            continue
+        if name.lower() == b"etag" and not value.startswith(b"W/"):
+            value = b"W/" + value
+        encoded.append((name, value))
+    encoded.append((b"content-encoding", encoding.encode("latin-1")))
+    return encoded
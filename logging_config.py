@@ -0,0 +1,41 @@
+import datetime
+import json
+import logging
+import sys
+
+# The attributes every log record has. Anything else on a record was passed with extra= and is written out as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+# Writes each log record as one JSON object per line, so log collectors can index the fields instead of parsing text.
+# Fields passed with extra= (for example the user of a request) are added to the object
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Send the app's logs to stderr at `level` (a name such as DEBUG or INFO), as plain text or as JSON lines. uvicorn sets
+# up its own loggers and isn't affected
+def configure_logging(level="INFO", log_format="text"):
+    handler = logging.StreamHandler(sys.stderr)
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
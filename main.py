@@ -1,112 +1,1195 @@
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, Response
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, Form, Query, Depends
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-import google.oauth2.id_token
-from google.auth.transport import requests
+from google.api_core import exceptions as google_exceptions
 from google.cloud import firestore
+from pydantic import BaseModel
 from starlette.status import HTTP_302_FOUND
 from typing import Optional, List
+import asyncio
+import contextlib
 import datetime
+import hashlib
+import hmac
+import json
+import logging
 import os
-from google.oauth2 import service_account
+import urllib.parse
+from token_cache import CertificateStore, VerifiedTokenCache, load_certs_file
+from board_cache import BoardCache
+from board_events import BoardEventHub
+from memory_store import MemoryClient, transactional
+from metrics import Metrics, MetricsMiddleware, instrument_firestore, record, timed
+from logging_config import configure_logging
+from profiling import RequestProfiler, ProfilingMiddleware
+from compression import CompressionMiddleware
+from static_assets import StaticAssets, PrecompressedStaticFiles
+from clients import LazyClient, PooledAsyncClient, close_client, service_account_settings
+from admission import AdmissionMiddleware, Limiter, limit_firestore
+from task_files import (FILE_FORMATS, REQUIRED_COLUMNS, UploadError, csv_rows, encode_rows, multipart_file,
+                        ndjson_rows, upload_format, upload_lines)
 
-# Set up credentials for local development
-# This approach uses approved libraries, not firebase-admin
-try:
-    if os.path.exists("service-account-key.json"):
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "service-account-key.json"
-        print("Using local service account credentials")
-except Exception as e:
-    print(f"Error setting credentials: {e}")
+# Logs go to stderr. LOG_LEVEL sets how much is logged (DEBUG adds a line for every token check) and LOG_FORMAT=json
+# writes one JSON object per line for a log collector
+configure_logging(os.environ.get("LOG_LEVEL", "INFO"), os.environ.get("LOG_FORMAT", "text"))
+logger = logging.getLogger("taskmanager")
+
+# For local development the firestore clients use the service account key in this file if there is one, otherwise
+# google's default credentials. This approach uses approved libraries, not firebase-admin
+SERVICE_ACCOUNT_FILE = "service-account-key.json"
+
+# How many gRPC channels, each with its own connection, a worker spreads its firestore requests over
+FIRESTORE_CHANNELS = int(os.environ.get("FIRESTORE_CHANNELS", "1"))
+
+# How long a worker that is shutting down waits for background jobs such as board deletions before cancelling them.
+# A cancelled deletion can be finished later, see delete_board_contents
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get("SHUTDOWN_GRACE_SECONDS", "10"))
+
+# Importing this module doesn't connect to anything. The firestore clients are created by each worker when it starts
+# serving, after any fork, and closed again when it stops. Anything that uses them without running the lifespan, such
+# as maintenance.py or a test client, gets them created on first use instead
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    static_assets.build()
+    firestore_db.get()
+    if local_certs is None:
+        # fetch google's certificates now so the first request doesn't wait for them
+        try:
+            await asyncio.to_thread(certificate_store.get_certs)
+        except Exception as err:
+            logger.warning(f"Could not fetch firebase certificates: {str(err)}")
+    
+    yield
+    
+    await finish_background_jobs(SHUTDOWN_GRACE_SECONDS)
+    board_event_hub.close()
+    board_cache.close()
+    await listener_db.close()
+    await firestore_db.close()
 
 # define the app that will contain all of our routing for Fast API
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Every firestore operation a worker sends waits for one of DATASTORE_CONCURRENCY slots, so a burst of requests that
+# each fan out into hundreds of reads waits its turn inside the worker instead of all of it being sent at once. The
+# default is as many as FIRESTORE_CHANNELS connections carry at a time
+DATASTORE_CONCURRENCY = int(os.environ.get("DATASTORE_CONCURRENCY", str(100 * FIRESTORE_CHANNELS)))
+datastore_limiter = Limiter(DATASTORE_CONCURRENCY)
+
+# The routes that can fan out into a lot of firestore operations have an admission queue each. A worker handles at
+# most ROUTE_CONCURRENCY requests to one of them at a time and up to ROUTE_QUEUE_SIZE more wait their turn. A request
+# that has waited ROUTE_QUEUE_TIMEOUT seconds, or would have to, is answered with a 503 and a Retry-After of
+# RETRY_AFTER_SECONDS, so under a burst the requests that can't be served in time get a quick answer instead of
+# everyone timing out together. ROUTE_CONCURRENCY=0 turns this off
+ADMISSION_ROUTES = [
+    '/', '/my-tasks', '/board/{board_id}', '/board/{board_id}/tasks', '/remove-user-from-board',
+    '/api/v1/boards/{board_id}/tasks'
+]
+ROUTE_CONCURRENCY = int(os.environ.get("ROUTE_CONCURRENCY", "16"))
+ROUTE_QUEUE_SIZE = int(os.environ.get("ROUTE_QUEUE_SIZE", "64"))
+ROUTE_QUEUE_TIMEOUT = float(os.environ.get("ROUTE_QUEUE_TIMEOUT", "1"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "1"))
+route_queues = {}
+if ROUTE_CONCURRENCY > 0:
+    route_queues = {
+        path: Limiter(ROUTE_CONCURRENCY, queue_size=ROUTE_QUEUE_SIZE, timeout=ROUTE_QUEUE_TIMEOUT)
+        for path in ADMISSION_ROUTES
+    }
+
+# The answer to a request turned away by its admission queue. The API gets JSON and the pages get the error page
+def overloaded_response(scope, reason):
+    if scope["path"].startswith("/api/"):
+        return JSONResponse({'error': 'overloaded', 'reason': reason}, status_code=503)
+    return templates.TemplateResponse("error.html", {
+        "request": Request(scope),
+        "error_message": "The server is busy, please try again in a moment"
+    }, status_code=503)
+
+# Added before the other middleware so it runs inside them and the 503s are timed and compressed like any response
+app.add_middleware(AdmissionMiddleware, routes=app.router.routes, queues=route_queues,
+                   retry_after=RETRY_AFTER_SECONDS, shed_response=overloaded_response)
+
+# Metrics served on /metrics in the prometheus text format. Every request is timed by route, and so are token checks,
+# firestore operations and template renders. With SERVER_TIMING=1 each response also carries a Server-Timing header
+# that breaks the request down the same way, which the browser's developer tools show next to the request
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+metrics = Metrics("taskmanager")
+request_seconds = metrics.histogram(
+    "request_duration_seconds", "Time taken to answer a request", ["method", "route", "status"]
+)
+token_seconds = metrics.histogram("token_verification_seconds", "Time taken to verify the token cookie of a request")
+firestore_seconds = metrics.histogram(
+    "firestore_operation_seconds", "Time taken by each firestore operation", ["operation"]
+)
+template_seconds = metrics.histogram("template_render_seconds", "Time taken to render a template", ["template"])
+app.add_middleware(MetricsMiddleware, histogram=request_seconds, server_timing=SERVER_TIMING)
+
+# The profiler is off unless PROFILE_MODE is 'collapsed' (sampled stacks per route, for flame graphs) or 'pstats'
+# (cProfile, one request at a time). It then profiles PROFILE_RATE of the requests, every request to PROFILE_ROUTE and
+# any request sent with the X-Profile header set to PROFILING_TOKEN. Profiles are written to PROFILE_DIR, and
+# profile_summary.py summarises them. With PROFILING_TOKEN set the settings can be changed while the app is running
+# through /debug/profiling
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN")
+profiler = RequestProfiler(
+    os.environ.get("PROFILE_DIR", "profiles"),
+    mode=os.environ.get("PROFILE_MODE", "off"),
+    rate=float(os.environ.get("PROFILE_RATE", "0")),
+    route=os.environ.get("PROFILE_ROUTE"),
+    header_token=PROFILING_TOKEN,
+    interval=float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Pages, API responses and static files are compressed with br or gzip, whichever the browser asks for. br needs the
+# brotli package, without it everything is sent with gzip
+app.add_middleware(CompressionMiddleware)
+
+# Function that records one firestore operation, called by whichever storage backend is in use
+def observe_firestore(operation, seconds):
+    record(firestore_seconds, 'firestore', seconds, operation)
+
+# define a firestore client so we can interact with our database. Setting STORAGE_BACKEND=memory swaps it for an
+# in-memory store with the same interface, so the app can run without google credentials or the emulator. Everything
+# stored is lost when the server stops, it is meant for trying the app out, tests and benchmarks
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "firestore")
+
+# Seconds the in-memory store waits on every operation, to stand in for the round trip to firestore in benchmarks
+MEMORY_STORE_LATENCY = float(os.environ.get("MEMORY_STORE_LATENCY", "0"))
+
+def create_firestore_client():
+    if STORAGE_BACKEND == "memory":
+        client = MemoryClient()
+        client.observer = observe_firestore
+        client.limiter = datastore_limiter
+        client.latency = MEMORY_STORE_LATENCY
+        return client
+    return PooledAsyncClient(channels=FIRESTORE_CHANNELS, **service_account_settings(SERVICE_ACCOUNT_FILE))
+
+firestore_db = LazyClient(create_firestore_client, close=close_client)
+if STORAGE_BACKEND == "memory":
+    logger.info("Using the in-memory storage backend")
+else:
+    instrument_firestore(observe_firestore)
+    limit_firestore(datastore_limiter)
+
+# Verified tokens are cached until they expire so we only pay for the signature check once per token. The
+# certificates are refreshed in the background. If FIREBASE_CERTS_FILE points to a local key set then that is
+# used instead of google's certificates so tokens signed locally can be verified offline
+local_certs = None
+if os.environ.get("FIREBASE_CERTS_FILE"):
+    local_certs = load_certs_file(os.environ["FIREBASE_CERTS_FILE"])
+    logger.info("Using local firebase certificates")
+certificate_store = CertificateStore(certs=local_certs)
+token_cache = VerifiedTokenCache(certificate_store)
+
+# The most documents we ask for in a single get_all call. Longer lists of ids are split into chunks of this size
+GET_ALL_CHUNK_SIZE = 100
+
+# The board fields that main.html shows. The dashboard only reads these so we don't pull the members list of every
+# board over the wire
+DASHBOARD_BOARD_FIELDS = ['name', 'creator_email', 'created_at']
+
+# Firestore accepts at most 500 writes in a single batch
+BATCH_WRITE_LIMIT = 500
+
+# How many batches are committed at the same time when a route has a lot of documents to write
+BATCH_COMMIT_CONCURRENCY = 4
+
+# The most tasks a single request to the bulk task API can work on
+BULK_TASK_LIMIT = 1000
+
+# How many times a recount of a board's task counters counts again when the board changed while it was counting
+RECOUNT_ATTEMPTS = 5
 
-# define a firestore client so we can interact with our database
-firestore_db = firestore.Client()
+# Exports read a board's tasks EXPORT_PAGE_SIZE at a time and send each page as soon as it has been read. Imports
+# create tasks IMPORT_CHUNK_SIZE at a time, and the response of an import lists at most IMPORT_ERROR_LIMIT of the rows
+# that couldn't be imported
+EXPORT_PAGE_SIZE = 500
+IMPORT_CHUNK_SIZE = BULK_TASK_LIMIT
+IMPORT_ERROR_LIMIT = 1000
 
-# we need a request object to be able to talk to firebase for verifying user logins
-firebase_request_adapter = requests.Request()
+# How many tasks or title reservations a board deletion job reads at once. Each page is deleted with
+# commit_in_batches and the job's progress is saved after every page
+BOARD_DELETE_PAGE_SIZE = BATCH_WRITE_LIMIT * BATCH_COMMIT_CONCURRENCY
 
-# define the static and templates directories
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+# The views of the tasks assigned to a user across all of their boards. Each view is a single query on the tasks
+# assigned to the user ordered by due date, so it costs the same however many boards the user is on. Overdue and
+# upcoming only show tasks that aren't complete, split at the start of today (UTC). The composite indexes these need
+# are in firestore.indexes.json
+MY_TASK_VIEWS = ('all', 'overdue', 'upcoming')
+
+# How many tasks the board page shows at a time. More are loaded on demand from /board/{board_id}/tasks
+TASK_PAGE_SIZE = 50
+
+# The filters that can be applied to the task list of a board. Each one is an extra where clause on the tasks query
+# so the filtering happens in firestore rather than here. The composite indexes these need are in
+# firestore.indexes.json
+TASK_FILTERS = {
+    'active': ('completed', '==', False),
+    'completed': ('completed', '==', True),
+    'unassigned': ('unassigned', '==', True)
+}
+
+# Settings for the in-memory cache of board documents. Up to BOARD_CACHE_LISTENERS cached boards are kept up to date
+# by firestore listeners, any others are reloaded once they are older than BOARD_CACHE_TTL seconds
+BOARD_CACHE_SIZE = int(os.environ.get("BOARD_CACHE_SIZE", "1000"))
+BOARD_CACHE_LISTENERS = int(os.environ.get("BOARD_CACHE_LISTENERS", "100"))
+BOARD_CACHE_TTL = float(os.environ.get("BOARD_CACHE_TTL", "5"))
+
+# Templates that record how long each one takes to render. Starlette renders the template when the response is
+# created, so timing TemplateResponse times the render
+class TimedTemplates(Jinja2Templates):
+    def TemplateResponse(self, name, context, *args, **kwargs):
+        with timed(template_seconds, 'template', name):
+            return super().TemplateResponse(name, context, *args, **kwargs)
+
+# define the static and templates directories. The files in static/ are built into STATIC_BUILD_DIR under content
+# hashed names with precompressed versions (see static_assets.py), and the templates link to the hashed names with
+# asset_url('styles.css') so browsers can keep them for good and never ask for them again. The build runs when a
+# worker starts
+STATIC_BUILD_DIR = os.environ.get("STATIC_BUILD_DIR", os.path.join("build", "static"))
+static_assets = StaticAssets("static", STATIC_BUILD_DIR)
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_BUILD_DIR, assets=static_assets, check_dir=False),
+          name="static")
+templates = TimedTemplates(directory="templates")
+templates.env.globals['asset_url'] = static_assets.url
+
+# A hash of every template. It is part of the page ETags along with the version of the static files, so a browser
+# holding a page from before a deploy that changed a template or a static file is sent the new page
+def template_version(directory):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as template:
+            digest.update(name.encode() + b"\0" + template.read())
+    return digest.hexdigest()[:16]
+
+TEMPLATE_VERSION = template_version("templates")
+
+# Function that turns a due date into the timestamp we store. The forms and the API send dates as YYYY-MM-DD and they
+# are stored as midnight UTC on that day, so tasks can be sorted and range queried by due date in firestore. Older
+# tasks may hold a full ISO timestamp, for those only the day is kept. Returns None if the value isn't a date
+def parse_due_date(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        day = value
+    else:
+        text = str(value).strip()
+        try:
+            day = datetime.date.fromisoformat(text)
+        except ValueError:
+            try:
+                day = datetime.datetime.fromisoformat(text).date()
+            except ValueError:
+                return None
+    return datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc)
+
+# Template filter that shows a due date as YYYY-MM-DD. Tasks that haven't been through the due date migration in
+# maintenance.py still hold the string from the form, so those are shown as they are
+def format_due_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d')
+    return value or ''
+
+templates.env.filters['due_date'] = format_due_date
+
+# Function that reads a board document for the board cache
+async def load_board(board_id):
+    return await firestore_db.collection('boards').document(board_id).get()
+
+# Listeners need the synchronous firestore client as the async one doesn't support on_snapshot. It is only created
+# once the first listener is needed
+def create_listener_client():
+    # the in-memory store supports listeners itself
+    if STORAGE_BACKEND == "memory":
+        return firestore_db.get()
+    return firestore.Client(**service_account_settings(SERVICE_ACCOUNT_FILE))
+
+listener_db = LazyClient(create_listener_client, close=close_client)
+
+# Function that starts a firestore listener on a board document for the board cache. The listener runs on its own
+# thread and passes every new version of the board to on_change. Returns the function that stops the listener
+def listen_to_board(board_id, on_change):
+    def on_snapshot(snapshots, changes, read_time):
+        on_change(board_id, snapshots[0] if snapshots else None)
+    
+    watch = listener_db.collection('boards').document(board_id).on_snapshot(on_snapshot)
+    return watch.unsubscribe
+
+# Function that starts the listeners behind the live event stream of a board. One listener watches the board's tasks
+# and another watches the board document itself, and every change is passed to on_event. All the tasks a listener
+# reports at once, such as every task a batch wrote, are passed on as one event. Returns the function that stops both
+# listeners
+def listen_to_board_events(board_id, on_event):
+    first_snapshot = [True]
+    
+    def on_tasks(snapshots, changes, read_time):
+        # the first call lists every task already on the board, the viewers have those already
+        if first_snapshot[0]:
+            first_snapshot[0] = False
+            return
+        if not changes:
+            return
+        on_event({
+            'type': 'tasks',
+            'changes': [{
+                'change': change.type.name.lower(),
+                'task_id': change.document.id,
+                'task': None if change.type.name == 'REMOVED' else change.document.to_dict()
+            } for change in changes]
+        })
+    
+    def on_board(snapshots, changes, read_time):
+        if snapshots and snapshots[0].exists:
+            on_event({'type': 'board', 'board': snapshots[0].to_dict()})
+        else:
+            on_event({'type': 'reload'})
+    
+    task_watch = listener_db.collection('tasks').where('board_id', '==', board_id).on_snapshot(on_tasks)
+    board_watch = listener_db.collection('boards').document(board_id).on_snapshot(on_board)
+    
+    def unsubscribe():
+        task_watch.unsubscribe()
+        board_watch.unsubscribe()
+    return unsubscribe
+
+# Board documents are cached in memory so the membership and creator checks most routes start with don't need a
+# firestore read every time. Routes invalidate a board after they change it
+board_cache = BoardCache(
+    load_board,
+    subscribe=listen_to_board if BOARD_CACHE_LISTENERS > 0 else None,
+    max_size=BOARD_CACHE_SIZE,
+    max_listeners=BOARD_CACHE_LISTENERS,
+    ttl=BOARD_CACHE_TTL
+)
 
 # Function that we will use to validate an id_token. Will return the user_token if valid, None if not
 def validate_firebase_token(id_token):
     # If we don't have a token then return None
     if not id_token:
-        print("No ID token found in cookie")
+        logger.debug("No ID token found in cookie")
         return None
     
     # try to validate the token. If this fails with an exception then this will remain as None so just return at the end
     # if we got an exception then log the exception before returning
     user_token = None
     try:
-        user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        print(f"Successfully validated token for user: {user_token.get('email') if user_token else 'None'}")
+        with timed(token_seconds, 'token'):
+            user_token = token_cache.verify(id_token)
+        logger.debug("Validated token", extra={'user': user_token.get('email') if user_token else None})
     except ValueError as err:
-        # Dump this message to console as it will not be displayed on the template. Use for debugging but if you are building for
-        # production you should handle this much more gracefully.
-        print(f"Token validation error: {str(err)}")
+        # The message isn't shown on the template, the user is just treated as logged out
+        logger.info(f"Token validation error: {str(err)}")
     
     # return the token to the caller
     return user_token
 
+# Emails are stored in the index trimmed and lower case so the lookup doesn't depend on how the address was typed
+def normalize_email(email):
+    return email.strip().lower()
+
+# Function that returns the document in the user_emails collection for an email address. The index maps a normalized
+# email to the id of the user with that email so we can find a user with a single document read. The email is
+# percent encoded because document ids can't contain a slash
+def email_index_ref(email):
+    return firestore_db.collection('user_emails').document(urllib.parse.quote(normalize_email(email), safe='@+'))
+
 # Function that we will use to retrieve and return the document that represents this user
 # by using the ID of the firebase credentials. This function assumes that the credentials have
-# been checked first
-def get_user(user_token):
+# been checked first. Returns the document reference and the user's data
+async def get_user(user_token):
     # now that we have a user token we are going to try and retrieve a user object for this user from firestore if there
     # is not a user object for this user we will create one
     user = firestore_db.collection('users').document(user_token['user_id'])
-    if not user.get().exists:
+    user_snapshot = await user.get()
+    user_data = user_snapshot.to_dict()
+    if not user_snapshot.exists:
         user_data = {
             'name': user_token['email'],  # Use email as the default name
             'email': user_token['email'],
             'created_boards': [],
             'member_boards': []
         }
-        firestore_db.collection('users').document(user_token['user_id']).set(user_data)
+        # Create the user and its entry in the email index together
+        batch = firestore_db.batch()
+        batch.set(user, user_data)
+        batch.set(email_index_ref(user_token['email']), {'user_id': user_token['user_id']})
+        await batch.commit()
+    elif user_data.get('email') != user_token['email']:
+        # The email on the firebase account has changed so move the user's entry in the email index
+        old_email = user_data.get('email')
+        user_data['email'] = user_token['email']
+        batch = firestore_db.batch()
+        batch.update(user, {'email': user_token['email'], 'version': firestore.Increment(1)})
+        if old_email:
+            batch.delete(email_index_ref(old_email))
+        batch.set(email_index_ref(user_token['email']), {'user_id': user_token['user_id']})
+        await batch.commit()
+    
+    # return the user document along with its data so callers don't have to read it again
+    return user, user_data
+
+# Holds what a route needs to know about the request it is serving: the firebase token, the user's document and
+# any board documents it looks at. Each one is fetched the first time it is asked for and then reused, so a
+# document is read at most once per request however many times the route and its helpers need it
+class RequestContext:
+    def __init__(self, request):
+        self.request = request
+        self._token_checked = False
+        self._user_token = None
+        self._user = None
+        self._boards = {}
+
+    # The validated firebase token for the request, or None if there isn't a valid one
+    @property
+    def user_token(self):
+        if not self._token_checked:
+            self._user_token = validate_firebase_token(self.request.cookies.get("token"))
+            self._token_checked = True
+        return self._user_token
+
+    # The reference and data of the logged in user's document, created if this is their first visit
+    async def user(self):
+        if self._user is None:
+            self._user = await get_user(self.user_token)
+        return self._user
+
+    # A snapshot of a board document, from the board cache if it has a fresh copy
+    async def board(self, board_id):
+        if board_id not in self._boards:
+            self._boards[board_id] = await board_cache.get(board_id)
+        return self._boards[board_id]
+
+# FastAPI dependency that hands each route the context for its request. FastAPI only calls a dependency once per
+# request so every dependency that asks for the context shares the same one
+def request_context(request: Request):
+    context = RequestContext(request)
+    request.state.context = context
+    return context
+
+# Function that reads a list of documents from a collection with as few round trips as possible. The ids are sent in
+# batched get_all calls of at most GET_ALL_CHUNK_SIZE documents, and the chunks are fetched at the same time. Returns a
+# dict of document id -> snapshot for the documents that exist. field_paths limits which fields are sent back
+async def get_documents(collection, document_ids, field_paths=None):
+    # dict.fromkeys removes duplicate ids but keeps them in order
+    refs = [firestore_db.collection(collection).document(document_id) for document_id in dict.fromkeys(document_ids)]
+
+    async def fetch_chunk(chunk):
+        return [snapshot async for snapshot in firestore_db.get_all(chunk, field_paths=field_paths)]
+
+    chunks = await asyncio.gather(*[
+        fetch_chunk(refs[start:start + GET_ALL_CHUNK_SIZE]) for start in range(0, len(refs), GET_ALL_CHUNK_SIZE)
+    ])
+    return {snapshot.id: snapshot for chunk in chunks for snapshot in chunk if snapshot.exists}
+
+# Function that commits a stream of writes in batches of at most BATCH_WRITE_LIMIT. Each write is a tuple of
+# (operation, document reference, data) where operation is 'set', 'update' or 'delete'. The writes can be a list or an
+# async generator such as a query stream. A batch is sent as soon as it is full and at most BATCH_COMMIT_CONCURRENCY
+# batches are in flight, so only a few batches are ever held in memory. Returns the number of writes committed
+async def commit_in_batches(writes):
+    in_flight = set()
+    committed = 0
+    batch = firestore_db.batch()
+    batch_size = 0
+
+    async def send(batch):
+        nonlocal in_flight
+        in_flight.add(asyncio.ensure_future(batch.commit()))
+        if len(in_flight) >= BATCH_COMMIT_CONCURRENCY:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+
+    async def add(write):
+        nonlocal batch, batch_size, committed
+        operation, ref, data = write
+        if operation == 'delete':
+            batch.delete(ref)
+        else:
+            getattr(batch, operation)(ref, data)
+        batch_size += 1
+        committed += 1
+        if batch_size == BATCH_WRITE_LIMIT:
+            await send(batch)
+            batch = firestore_db.batch()
+            batch_size = 0
+
+    if hasattr(writes, '__aiter__'):
+        async for write in writes:
+            await add(write)
+    else:
+        for write in writes:
+            await add(write)
+
+    if batch_size:
+        await send(batch)
+    await asyncio.gather(*in_flight)
+    return committed
+
+# Function that counts the active and completed tasks on a board with aggregation queries
+async def count_board_tasks(board_id):
+    board_tasks = firestore_db.collection('tasks').where('board_id', '==', board_id)
+    total_result, completed_result = await asyncio.gather(
+        board_tasks.count().get(),
+        board_tasks.where('completed', '==', True).count().get()
+    )
+    total_tasks = int(total_result[0][0].value)
+    completed_tasks = int(completed_result[0][0].value)
+    return {
+        'active_tasks': total_tasks - completed_tasks,
+        'completed_tasks': completed_tasks
+    }
+
+# Function that counts the tasks on a board and writes the totals back to the board document, marking its counters
+# as initialized. The routes keep the counters up to date from then on, this fills them in for boards created before
+# the counters existed and is used by maintenance.py to repair any drift. Aggregation queries can't run in a
+# transaction, so the write is guarded by the update time of the board as it was before counting instead: every task
+# change that moves a counter updates the board in the same commit, so if the board hasn't changed no change can have
+# been missed by the count. If it has, we count again. With uninitialized_only, a board whose counters another request
+# has initialized in the meantime is left as it is. Returns the counters, or None if the board doesn't exist
+async def recount_board_tasks(board_id, uninitialized_only=False):
+    board_ref = firestore_db.collection('boards').document(board_id)
+    for _ in range(RECOUNT_ATTEMPTS):
+        board = await board_ref.get()
+        if not board.exists:
+            return None
+        board_data = board.to_dict()
+        if uninitialized_only and board_data.get('counters_initialized'):
+            return {'active_tasks': board_data['active_tasks'], 'completed_tasks': board_data['completed_tasks']}
+        counters = await count_board_tasks(board_id)
+        try:
+            await board_ref.update({**counters, 'counters_initialized': True, 'version': firestore.Increment(1)},
+                                   option=firestore_db.write_option(last_update_time=board.update_time))
+        except (google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+            continue
+        board_cache.invalidate(board_id)
+        return counters
+    raise google_exceptions.Aborted(f"board {board_id} kept changing while its tasks were counted")
+
+# Function that makes sure a board's task counters are initialized before a route changes them. Boards from before
+# the counters were added are recounted once, after that the counters are kept up to date by the task routes. If the
+# board is too busy to recount, the route goes ahead: its increments are overwritten by the next recount
+async def ensure_task_counters(board_id, board_data):
+    if not board_data.get('counters_initialized'):
+        try:
+            board_data.update(await recount_board_tasks(board_id, uninitialized_only=True) or {})
+        except google_exceptions.Aborted:
+            logger.warning("Could not recount the tasks of board %s", board_id)
+    return board_data
+
+# Function that returns a board's active and completed task counts for display. Boards whose counters haven't been
+# initialized yet are counted with aggregation queries instead, without writing anything
+async def board_task_counts(board_id, board_data):
+    if board_data.get('counters_initialized'):
+        return {'active_tasks': board_data['active_tasks'], 'completed_tasks': board_data['completed_tasks']}
+    return await count_board_tasks(board_id)
+
+# Function that flips the completed status of a task and moves it between the active and completed counters on its
+# board. Runs inside a transaction so two people toggling the same task at once can't leave the counters wrong.
+# Passing completed sets the status to that value instead of flipping it. Returns False if the task does not exist
+# on this board
+@transactional
+async def toggle_task_in_transaction(transaction, task_ref, board_ref, completed=None):
+    task = await task_ref.get(transaction=transaction)
+    if not task.exists or task.to_dict().get('board_id') != board_ref.id:
+        return False
+
+    # Toggle the completed status, or set it if we were told what it should be
+    current_status = task.to_dict().get('completed', False)
+    new_completed_status = not current_status if completed is None else completed
+    if new_completed_status == current_status:
+        return True
+
+    # Update the task, if marking as complete add the completion date
+    transaction.update(task_ref, {
+        'completed': new_completed_status,
+        'completion_date': datetime.datetime.now() if new_completed_status else None
+    })
+
+    # Move the task from one counter to the other
+    change = 1 if new_completed_status else -1
+    transaction.update(board_ref, {
+        'active_tasks': firestore.Increment(-change),
+        'completed_tasks': firestore.Increment(change),
+        'version': firestore.Increment(1)
+    })
+    return True
+
+# Function that deletes a task, takes it off its board's counters and frees its title in the same transaction.
+# Returns False if the task does not exist on this board
+@transactional
+async def delete_task_in_transaction(transaction, task_ref, board_ref):
+    task = await task_ref.get(transaction=transaction)
+    if not task.exists or task.to_dict().get('board_id') != board_ref.id:
+        return False
+
+    task_data = task.to_dict()
+    reservation_ref = title_reservation_ref(board_ref.id, task_data['title'])
+    reservation = await reservation_ref.get(transaction=transaction)
+
+    counter = 'completed_tasks' if task_data.get('completed', False) else 'active_tasks'
+    transaction.delete(task_ref)
+    transaction.update(board_ref, {
+        counter: firestore.Increment(-1),
+        'version': firestore.Increment(1)
+    })
+    if reservation.exists and reservation.to_dict().get('task_id') == task_ref.id:
+        transaction.delete(reservation_ref)
+    return True
+
+# Titles are compared with surrounding whitespace removed, runs of whitespace collapsed and ignoring case
+def normalize_title(title):
+    return ' '.join(title.split()).casefold()
+
+# Function that returns the reservation document for a task title on a board. Every task reserves its title in the
+# task_titles collection, so checking for a duplicate is a single document read that can be part of the transaction
+# that writes the task. The id uses a hash of the title because titles can be long and contain a slash
+def title_reservation_ref(board_id, title):
+    title_hash = hashlib.sha256(normalize_title(title).encode('utf-8')).hexdigest()
+    return firestore_db.collection('task_titles').document(f"{board_id}_{title_hash}")
+
+# Function that reads a title reservation inside a transaction and returns the id of the task that holds the title,
+# or None if the title is free. A reservation left behind by a task that no longer exists doesn't count
+async def title_owner(transaction, reservation_ref):
+    reservation = await reservation_ref.get(transaction=transaction)
+    if not reservation.exists:
+        return None
+
+    owner_id = reservation.to_dict().get('task_id')
+    owner = await firestore_db.collection('tasks').document(owner_id).get(transaction=transaction)
+    return owner_id if owner.exists else None
+
+# Function that creates a task, reserves its title and counts it as active on the board in one transaction. The
+# duplicate check and the insert are part of the same commit, so two requests adding the same title at once can't
+# both succeed. Returns the id of the new task, or None if the title is already used on the board
+@transactional
+async def add_task_in_transaction(transaction, board_ref, new_task):
+    reservation_ref = title_reservation_ref(board_ref.id, new_task['title'])
+    if await title_owner(transaction, reservation_ref):
+        return None
+
+    task_ref = firestore_db.collection('tasks').document()
+    transaction.set(task_ref, new_task)
+    transaction.set(reservation_ref, {
+        'board_id': board_ref.id,
+        'title': new_task['title'],
+        'task_id': task_ref.id
+    })
+    transaction.update(board_ref, {
+        'active_tasks': firestore.Increment(1),
+        'version': firestore.Increment(1)
+    })
+    return task_ref.id
+
+# Function that updates a task and moves its title reservation if the title has changed. Returns 'updated',
+# 'duplicate' if another task on the board already has the new title, or 'missing' if the task isn't on this board
+@transactional
+async def edit_task_in_transaction(transaction, task_ref, board_id, update_data):
+    task = await task_ref.get(transaction=transaction)
+    if not task.exists or task.to_dict().get('board_id') != board_id:
+        return 'missing'
+
+    old_title = task.to_dict()['title']
+    old_reservation_ref = title_reservation_ref(board_id, old_title)
+    new_reservation_ref = title_reservation_ref(board_id, update_data['title'])
+
+    # All the reads have to happen before any of the writes in a transaction
+    new_owner = await title_owner(transaction, new_reservation_ref)
+    if new_owner and new_owner != task_ref.id:
+        return 'duplicate'
+    if new_reservation_ref.id != old_reservation_ref.id:
+        old_reservation = await old_reservation_ref.get(transaction=transaction)
+        if old_reservation.exists and old_reservation.to_dict().get('task_id') == task_ref.id:
+            transaction.delete(old_reservation_ref)
+
+    transaction.update(task_ref, update_data)
+    transaction.set(new_reservation_ref, {
+        'board_id': board_id,
+        'title': update_data['title'],
+        'task_id': task_ref.id
+    })
+    transaction.update(firestore_db.collection('boards').document(board_id), {
+        'version': firestore.Increment(1)
+    })
+    return 'updated'
+
+# Function that reads the title reservations with the given ids and works out which titles are held. Returns a dict
+# of reservation id to snapshot for every reservation that exists, and a dict of reservation id to the id of the task
+# holding it. A reservation left behind by a task that no longer exists doesn't count as held, the same as in
+# title_owner
+async def read_title_reservations(reservation_ids):
+    reservations = await get_documents('task_titles', reservation_ids)
+    owner_ids = [reservation.to_dict().get('task_id') for reservation in reservations.values()]
+    owners = await get_documents('tasks', [owner_id for owner_id in owner_ids if owner_id], field_paths=['board_id'])
+
+    held = {}
+    for reservation_id, reservation in reservations.items():
+        owner_id = reservation.to_dict().get('task_id')
+        if owner_id in owners:
+            held[reservation_id] = owner_id
+    return reservations, held
+
+# Function that returns the write that reserves a title for a task in a bulk request. A free title is created, so
+# the batch fails if someone took the title since we read it. A stale reservation is only replaced if it hasn't
+# changed since we read it
+def reserve_title_write(board_id, title, task_id, reservations):
+    reservation_ref = title_reservation_ref(board_id, title)
+    data = {'board_id': board_id, 'title': title, 'task_id': task_id}
+    if reservation_ref.id in reservations:
+        option = firestore_db.write_option(last_update_time=reservations[reservation_ref.id].update_time)
+        return ('update', reservation_ref, data, option)
+    return ('create', reservation_ref, data, None)
+
+# Function that commits the changes of a bulk API request. Each item is a dict holding the writes for one task as
+# (operation, document reference, data, option) tuples, the changes it makes to the board's active_tasks and
+# completed_tasks counters, its result and a retry coroutine function that makes the same change in a transaction.
+# Items are packed into batches of at most BATCH_WRITE_LIMIT writes along with one update of the board's counters and
+# version, so every batch is applied completely or not at all. The writes are conditional on the documents not having
+# changed since they were read, and if someone else got there first the batch is rejected and its items are retried
+# one at a time, with the retry's return value becoming the item's result
+async def commit_task_batches(board_ref, items):
+    batches = []
+    batch_items = []
+    batch_size = 1
+    for item in items:
+        if batch_items and batch_size + len(item['writes']) > BATCH_WRITE_LIMIT:
+            batches.append(batch_items)
+            batch_items = []
+            batch_size = 1
+        batch_items.append(item)
+        batch_size += len(item['writes'])
+    if batch_items:
+        batches.append(batch_items)
+
+    semaphore = asyncio.Semaphore(BATCH_COMMIT_CONCURRENCY)
+
+    async def commit(batch_items):
+        batch = firestore_db.batch()
+        counters = {}
+        for item in batch_items:
+            for operation, ref, data, option in item['writes']:
+                if operation == 'delete':
+                    batch.delete(ref, option=option)
+                elif operation == 'update':
+                    batch.update(ref, data, option=option)
+                else:
+                    getattr(batch, operation)(ref, data)
+            for field, change in item['counters'].items():
+                counters[field] = counters.get(field, 0) + change
+        board_update = {field: firestore.Increment(change) for field, change in counters.items() if change}
+        board_update['version'] = firestore.Increment(1)
+        batch.update(board_ref, board_update)
+
+        try:
+            async with semaphore:
+                await batch.commit()
+        except (google_exceptions.Conflict, google_exceptions.FailedPrecondition, google_exceptions.NotFound):
+            for item in batch_items:
+                item['result'] = await item['retry']()
+
+    await asyncio.gather(*[commit(batch_items) for batch_items in batches])
+
+# Function that builds the document for a new task. Used by the add task form and the bulk API so both create the
+# same fields
+def new_task_data(board_id, title, due_date, assigned_to, user_id):
+    return {
+        'title': title,
+        'due_date': parse_due_date(due_date),
+        'created_by': user_id,
+        'created_at': datetime.datetime.now(),
+        'board_id': board_id,
+        'completed': False,
+        'completion_date': None,
+        'assigned_to': assigned_to if assigned_to else None,
+        'unassigned': False if assigned_to else True  # Mark as unassigned if no user assigned
+    }
+
+# Function that gets a task's data ready for the templates
+def task_view(task_id, task_data, board_data):
+    task_data['id'] = task_id
+    
+    # Check if task is unassigned (was assigned to someone who was removed)
+    if task_data.get('assigned_to') is None or (
+        task_data.get('assigned_to') and 
+        task_data['assigned_to'] not in board_data['members']
+    ):
+        task_data['unassigned'] = True
+    else:
+        task_data['unassigned'] = False
+    
+    return task_data
+
+# Function that reads one page of a board's tasks, oldest first. The cursor is the id of the last task on the
+# previous page and the query carries on after it using start_after. Returns the tasks on the page and the cursor
+# for the next page, which is None when there are no more tasks
+async def get_task_page(board_id, board_data, task_filter=None, cursor=None, page_size=TASK_PAGE_SIZE):
+    query = firestore_db.collection('tasks').where('board_id', '==', board_id)
+    if task_filter in TASK_FILTERS:
+        query = query.where(*TASK_FILTERS[task_filter])
+    query = query.order_by('created_at')
+
+    # If the cursor doesn't point at a task on this board we just start from the beginning
+    if cursor:
+        cursor_snapshot = await firestore_db.collection('tasks').document(cursor).get()
+        if cursor_snapshot.exists and cursor_snapshot.to_dict().get('board_id') == board_id:
+            query = query.start_after(cursor_snapshot)
+
+    # Ask for one more task than we need so we know if there is another page
+    task_snapshots = await query.limit(page_size + 1).get()
+
+    tasks = [task_view(task.id, task.to_dict(), board_data) for task in task_snapshots[:page_size]]
+
+    next_cursor = tasks[-1]['id'] if len(task_snapshots) > page_size else None
+    return tasks, next_cursor
+
+# Function that reads one page of the tasks assigned to a user across all of their boards, in order of due date. The
+# cursor works the same way as in get_task_page. The board names are read in one batch for the whole page. Tasks
+# whose board is in the middle of being force deleted are left out
+async def get_my_task_page(user_id, view='all', cursor=None, page_size=TASK_PAGE_SIZE):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    today = datetime.datetime(now.year, now.month, now.day, tzinfo=datetime.timezone.utc)
+    
+    query = firestore_db.collection('tasks').where('assigned_to', '==', user_id)
+    if view == 'overdue':
+        query = query.where('completed', '==', False).where('due_date', '<', today)
+    elif view == 'upcoming':
+        query = query.where('completed', '==', False).where('due_date', '>=', today)
+    query = query.order_by('due_date')
+    
+    if cursor:
+        cursor_snapshot = await firestore_db.collection('tasks').document(cursor).get()
+        if cursor_snapshot.exists and cursor_snapshot.to_dict().get('assigned_to') == user_id:
+            query = query.start_after(cursor_snapshot)
+    
+    task_snapshots = await query.limit(page_size + 1).get()
+    page = task_snapshots[:page_size]
+    boards = await get_documents('boards', [task.to_dict()['board_id'] for task in page], field_paths=['name'])
     
-    # return the user document
-    return user
+    tasks = []
+    for task in page:
+        task_data = task.to_dict()
+        board = boards.get(task_data['board_id'])
+        if board is None:
+            continue
+        task_data['id'] = task.id
+        task_data['board_name'] = board.to_dict()['name']
+        due_date = task_data.get('due_date')
+        task_data['overdue'] = (not task_data.get('completed') and isinstance(due_date, datetime.datetime)
+                                and due_date < today)
+        tasks.append(task_data)
+    
+    next_cursor = page[-1].id if len(task_snapshots) > page_size else None
+    return tasks, next_cursor
+
+# Function that reads the user documents of everyone on a board, in the order they are listed on the board. They are
+# read with batched get_all calls and only the email is fetched, not the board lists of every member
+async def get_board_members(board_data):
+    member_snapshots = await get_documents('users', board_data['members'], field_paths=['email'])
+
+    board_members = []
+    for user_id in board_data['members']:
+        if user_id in member_snapshots:
+            member_data = member_snapshots[user_id].to_dict()
+            member_data['id'] = user_id
+            member_data['is_creator'] = (user_id == board_data['creator_id'])
+            board_members.append(member_data)
+    return board_members
+
+# Function that maps member ids to members so the templates can look up the person a task is assigned to directly
+# instead of searching the member list for every task
+def members_by_id(board_members):
+    return {member['id']: member for member in board_members}
+
+# Function that deletes a board and takes it off its creator's created_boards, but only if the creator is the only
+# member and there are no tasks on it. Runs inside a transaction so the checks and the delete see the same board.
+# Adding a task updates the counters on the board document, so a task added at the same time makes the transaction
+# retry and then fail the check. Returns False if the board can't be deleted
+@transactional
+async def delete_board_in_transaction(transaction, board_ref, user_ref):
+    board = await board_ref.get(transaction=transaction)
+    if not board.exists:
+        return False
+    
+    board_data = board.to_dict()
+    
+    # Check if there are non-owner users on the board
+    if len(board_data['members']) > 1:
+        return False
+    
+    # Check if there are tasks on the board. We look at the tasks collection as well as the counters so that a board
+    # whose counters have drifted is never deleted with tasks still on it
+    if board_data.get('active_tasks', 0) + board_data.get('completed_tasks', 0) > 0:
+        return False
+    board_tasks = firestore_db.collection('tasks').where('board_id', '==', board_ref.id).limit(1)
+    if await board_tasks.get(transaction=transaction):
+        return False
+    
+    transaction.delete(board_ref)
+    transaction.update(user_ref, {
+        'created_boards': firestore.ArrayRemove([board_ref.id]),
+        'version': firestore.Increment(1)
+    })
+    return True
+
+# Function that starts force deleting a board, tasks and members included. The board is deleted and taken off the
+# creator's created_boards straight away, in one transaction with the job document that tracks the rest of the work,
+# so the board is gone as soon as this returns. Adding a task updates the board document so no new tasks can be added
+# after this. The board is taken off its members' member_boards and its tasks and title reservations are deleted
+# afterwards by delete_board_contents, so the transaction stays the same size however many members the board has.
+# Returns False if the board doesn't exist or the user isn't its creator
+@transactional
+async def start_board_deletion_in_transaction(transaction, board_ref, job_ref, user_id):
+    board = await board_ref.get(transaction=transaction)
+    if not board.exists or board.to_dict()['creator_id'] != user_id:
+        return False
+    
+    board_data = board.to_dict()
+    now = datetime.datetime.now()
+    transaction.set(job_ref, {
+        'type': 'delete_board',
+        'board_id': board_ref.id,
+        'board_name': board_data['name'],
+        'user_id': user_id,
+        'state': 'running',
+        'total_tasks': board_data.get('active_tasks', 0) + board_data.get('completed_tasks', 0),
+        'members_removed': 0,
+        'tasks_deleted': 0,
+        'titles_deleted': 0,
+        'error': None,
+        'started_at': now,
+        'updated_at': now,
+        'finished_at': None
+    })
+    transaction.delete(board_ref)
+    transaction.update(firestore_db.collection('users').document(user_id), {
+        'created_boards': firestore.ArrayRemove([board_ref.id]),
+        'version': firestore.Increment(1)
+    })
+    return True
+
+# Function that finishes force deleting a board: takes it off the member_boards of every user still listing it, then
+# deletes its tasks and title reservations. Works a page at a time, writing each page with batched commits and saving
+# the progress on the job document in between. It only relies on what is left in firestore so it can be run again to
+# finish a job that was interrupted
+async def delete_board_contents(job_ref):
+    job = (await job_ref.get()).to_dict()
+    board_id = job['board_id']
+    progress = {counter: job.get(counter, 0) for counter in ('members_removed', 'tasks_deleted', 'titles_deleted')}
+    
+    def remove_member(user):
+        return ('update', user.reference, {
+            'member_boards': firestore.ArrayRemove([board_id]),
+            'version': firestore.Increment(1)
+        })
+    
+    def delete(document):
+        return ('delete', document.reference, None)
+    
+    stages = (
+        ('members_removed', firestore_db.collection('users').where('member_boards', 'array_contains', board_id)
+         .select([]), remove_member),
+        ('tasks_deleted', firestore_db.collection('tasks').where('board_id', '==', board_id).select(['board_id']),
+         delete),
+        ('titles_deleted', firestore_db.collection('task_titles').where('board_id', '==', board_id)
+         .select(['board_id']), delete)
+    )
+    
+    try:
+        for counter, query, write in stages:
+            page_query = query.limit(BOARD_DELETE_PAGE_SIZE)
+            while True:
+                page = await page_query.get()
+                if not page:
+                    break
+                progress[counter] += await commit_in_batches(write(document) for document in page)
+                await job_ref.update({**progress, 'updated_at': datetime.datetime.now()})
+        
+        await job_ref.update({'state': 'done', 'error': None, 'finished_at': datetime.datetime.now()})
+    except Exception as err:
+        logger.exception(f"Error deleting board {board_id}: {str(err)}")
+        await job_ref.update({'state': 'failed', 'error': str(err), 'updated_at': datetime.datetime.now()})
+
+# Jobs that run after the request that started them has returned. asyncio only keeps a weak reference to a running
+# task so they are held here until they finish
+background_jobs = set()
+
+def run_in_background(coroutine):
+    job = asyncio.ensure_future(coroutine)
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+    return job
+
+# Wait up to `timeout` seconds for the background jobs to finish and cancel the ones that don't
+async def finish_background_jobs(timeout):
+    if not background_jobs:
+        return
+    done, pending = await asyncio.wait(set(background_jobs), timeout=timeout)
+    for job in pending:
+        job.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+# Function that force deletes a board. Returns the job document that tracks the deletion, or None if the user can't
+# delete the board
+async def force_delete_board(board_id, user_id):
+    board_ref = firestore_db.collection('boards').document(board_id)
+    job_ref = firestore_db.collection('jobs').document()
+    started = await start_board_deletion_in_transaction(firestore_db.transaction(), board_ref, job_ref, user_id)
+    board_cache.invalidate(board_id)
+    if not started:
+        return None
+    
+    run_in_background(delete_board_contents(job_ref))
+    return job_ref
+
+# Function that turns a raw change from the board listeners into the event the viewers are sent. It runs once per
+# change however many people are watching. Task changes carry the changed tasks rendered together with the same
+# template as the board page so the browser can drop them straight in. The board and its members are read once for
+# the whole change, however many tasks it touches. Board changes carry the counters and the member ids
+async def prepare_board_event(board_id, event):
+    if event['type'] == 'board':
+        board_data = event['board']
+        return {
+            'type': 'board',
+            'data': {
+                'name': board_data.get('name'),
+                'members': board_data.get('members', []),
+                'active_tasks': board_data.get('active_tasks', 0),
+                'completed_tasks': board_data.get('completed_tasks', 0),
+                'total_tasks': board_data.get('active_tasks', 0) + board_data.get('completed_tasks', 0)
+            }
+        }
+    
+    if event['type'] != 'tasks':
+        return event
+    
+    changed = [change for change in event['changes'] if change['change'] != 'removed']
+    task_views = {}
+    html = ''
+    if changed:
+        board = await board_cache.get(board_id)
+        if not board.exists:
+            return {'type': 'reload'}
+        board_data = board.to_dict()
+        
+        for change in changed:
+            task_views[change['task_id']] = task_view(change['task_id'], change['task'], board_data)
+        board_members = await get_board_members(board_data)
+        html = templates.get_template("task_page.html").render(
+            board_id=board_id, tasks=list(task_views.values()), members_by_id=members_by_id(board_members),
+            next_cursor=None, task_filter=None
+        )
+    
+    tasks = []
+    for change in event['changes']:
+        task = {'id': change['task_id'], 'change': change['change']}
+        if change['task_id'] in task_views:
+            task['completed'] = task_views[change['task_id']].get('completed', False)
+            task['unassigned'] = task_views[change['task_id']]['unassigned']
+        tasks.append(task)
+    return {'type': 'tasks', 'data': {'tasks': tasks, 'html': html}}
+
+# Live changes to boards are sent to everyone viewing them from one shared set of listeners per board
+board_event_hub = BoardEventHub(listen_to_board_events, prepare=prepare_board_event)
+
+# The caches and the live event hub keep their own counts, they are read when /metrics is scraped
+metrics.collected("token_cache_lookups_total", "Token checks answered from the cache or verified", "counter",
+                  ["result"], lambda: [(('hit',), token_cache.hits), (('miss',), token_cache.misses)])
+metrics.collected("board_cache_lookups_total", "Board reads answered from the cache or from firestore", "counter",
+                  ["result"], lambda: [(('hit',), board_cache.hits), (('miss',), board_cache.misses)])
+metrics.collected("board_cache_invalidations_total", "Boards dropped from the cache after a change", "counter", [],
+                  lambda: [((), board_cache.invalidations)])
+metrics.collected("board_event_viewers", "Live event streams open", "gauge", [],
+                  lambda: [((), board_event_hub.viewer_count())])
+metrics.collected("board_events_sent_total", "Live events sent to viewers", "counter", [],
+                  lambda: [((), board_event_hub.events_sent)])
+metrics.collected("admission_queue_depth", "Requests waiting in a route's admission queue", "gauge", ["route"],
+                  lambda: [((path,), queue.waiting) for path, queue in route_queues.items()])
+metrics.collected("admission_in_flight", "Requests being handled on a route with an admission queue", "gauge",
+                  ["route"], lambda: [((path,), queue.active) for path, queue in route_queues.items()])
+metrics.collected("admission_admitted_total", "Requests let through a route's admission queue", "counter", ["route"],
+                  lambda: [((path,), queue.admitted) for path, queue in route_queues.items()])
+metrics.collected("admission_shed_total", "Requests turned away with a 503 by a route's admission queue", "counter",
+                  ["route", "reason"], lambda: [((path, reason), count) for path, queue in route_queues.items()
+                                                for reason, count in sorted(queue.shed.items())])
+metrics.collected("admission_wait_seconds_total", "Time requests spent waiting in admission queues", "counter",
+                  ["route"], lambda: [((path,), queue.wait_seconds) for path, queue in route_queues.items()])
+metrics.collected("datastore_operations_in_flight", "Firestore operations sent and not yet answered", "gauge", [],
+                  lambda: [((), datastore_limiter.active)])
+metrics.collected("datastore_queue_depth", "Firestore operations waiting for a slot to be sent", "gauge", [],
+                  lambda: [((), datastore_limiter.waiting)])
+metrics.collected("datastore_wait_seconds_total", "Time firestore operations spent waiting for a slot", "counter", [],
+                  lambda: [((), datastore_limiter.wait_seconds)])
+
+# The board page and the dashboard are sent with an ETag made from the version stamps of the documents they are
+# rendered from. Every route that changes what a board page shows adds one to the board's version, and every change to
+# the boards on someone's dashboard adds one to the version of their user document. A browser asking again for a page
+# it already has is answered with a 304 before any tasks are read or anything is rendered. A member changing the email
+# on their account doesn't change the boards' versions, the new email shows up the next time the board changes.
+# no-cache makes the browser check every time it shows a page and private keeps shared caches from storing one
+PAGE_CACHE_CONTROL = 'private, no-cache'
+
+def page_etag(*parts):
+    digest = hashlib.sha256(json.dumps([TEMPLATE_VERSION, static_assets.version, *parts], default=str).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+# Whether the If-None-Match header of a request names the ETag. Weak and strong tags compare the same
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+def not_modified(etag):
+    return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': PAGE_CACHE_CONTROL})
+
+# Mutation routes answer with a small JSON delta instead of a redirect when the page asks for JSON, which is how the
+# board page sends its forms when it has a live event stream open
+def wants_json(request):
+    return 'application/json' in request.headers.get('accept', '')
 
 # Route for the main page
 @app.get("/", response_class=HTMLResponse)
-async def root(request: Request):
+async def root(request: Request, context: RequestContext = Depends(request_context)):
     # Query firebase for the request token. We also declare a bunch of other variables here as we will need them
     # for rendering the template at the end. We have an error_message there in case you want to output an error to
     # the user in the template.
-    id_token = request.cookies.get("token")
     error_message = "-"
     user_token = None
     user = None
     
     # Check if we have a valid firebase login if not return the template with empty data as we will show the login box
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return templates.TemplateResponse("main.html", {"request": request, "user_token": None, "error_message": None, "user_info": None})
     
     # Get the user document and boards
-    user = get_user(user_token)
-    user_data = user.get().to_dict()
-    
-    # Get all boards the user has created or is a member of
+    user, user_data = await context.user()
+    
+    etag = page_etag('dashboard', user_token['user_id'], user_token['email'], user_data.get('version', 0),
+                     request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    # Get all boards the user has created or is a member of. They are read together in batched get_all calls and
+    # we only ask for the fields the dashboard shows
+    created_board_ids = user_data.get('created_boards', [])
+    member_board_ids = user_data.get('member_boards', [])
+    board_snapshots = await get_documents('boards', created_board_ids + member_board_ids, DASHBOARD_BOARD_FIELDS)
+
     created_boards = []
-    for board_id in user_data.get('created_boards', []):
-        board = firestore_db.collection('boards').document(board_id).get()
-        if board.exists:
+    for board_id in created_board_ids:
+        board = board_snapshots.get(board_id)
+        if board:
             board_data = board.to_dict()
             board_data['id'] = board_id
             board_data['is_creator'] = True
             created_boards.append(board_data)
-    
+
     member_boards = []
-    for board_id in user_data.get('member_boards', []):
-        board = firestore_db.collection('boards').document(board_id).get()
-        if board.exists:
+    for board_id in member_board_ids:
+        board = board_snapshots.get(board_id)
+        if board:
             board_data = board.to_dict()
             board_data['id'] = board_id
             board_data['is_creator'] = False
@@ -121,14 +1204,13 @@ async def root(request: Request):
         "error_message": error_message, 
         "user_info": user_data,
         "boards": all_boards
-    })
+    }, headers={'ETag': etag, 'Cache-Control': PAGE_CACHE_CONTROL})
 
 # Login route
 @app.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request):
+async def login_page(request: Request, context: RequestContext = Depends(request_context)):
     # Check if user is already logged in
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     
     # If already logged in, redirect to home
     if user_token:
@@ -140,10 +1222,9 @@ async def login_page(request: Request):
 
 # Register route
 @app.get("/register", response_class=HTMLResponse)
-async def register_page(request: Request):
+async def register_page(request: Request, context: RequestContext = Depends(request_context)):
     # Check if user is already logged in
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     
     # If already logged in, redirect to home
     if user_token:
@@ -155,16 +1236,14 @@ async def register_page(request: Request):
 
 # Route to create a new board
 @app.post("/create-board", response_class=RedirectResponse)
-async def create_board(request: Request, board_name: str = Form(...)):
+async def create_board(request: Request, board_name: str = Form(...), context: RequestContext = Depends(request_context)):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the user
-    user = get_user(user_token)
-    user_data = user.get().to_dict()
+    user, user_data = await context.user()
     
     # Create a new board
     new_board = {
@@ -172,29 +1251,30 @@ async def create_board(request: Request, board_name: str = Form(...)):
         'creator_id': user_token['user_id'],
         'creator_email': user_token['email'],
         'created_at': datetime.datetime.now(),
-        'members': [user_token['user_id']]  # Creator is automatically a member
+        'members': [user_token['user_id']],  # Creator is automatically a member
+        'active_tasks': 0,
+        'completed_tasks': 0,
+        'counters_initialized': True
     }
     
-    # Add the board to Firestore
+    # Add the board to Firestore and add it to the user's created_boards list. ArrayUnion adds the id without us
+    # having to read and write back the whole list, and the batch makes both writes happen together
     board_ref = firestore_db.collection('boards').document()
-    board_ref.set(new_board)
-    
-    # Update the user's created_boards list
-    created_boards = user_data.get('created_boards', [])
-    created_boards.append(board_ref.id)
-    
-    user.update({
-        'created_boards': created_boards
+    batch = firestore_db.batch()
+    batch.set(board_ref, new_board)
+    batch.update(user, {
+        'created_boards': firestore.ArrayUnion([board_ref.id]),
+        'version': firestore.Increment(1)
     })
+    await batch.commit()
     
     return RedirectResponse("/", status_code=HTTP_302_FOUND)
 
 # Route to create new board page
 @app.get("/new-board", response_class=HTMLResponse)
-async def new_board_page(request: Request):
+async def new_board_page(request: Request, context: RequestContext = Depends(request_context)):
     # Validate user is logged in
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
@@ -205,16 +1285,14 @@ async def new_board_page(request: Request):
 
 # Route to user profile page
 @app.get("/profile", response_class=HTMLResponse)
-async def user_profile(request: Request):
+async def user_profile(request: Request, context: RequestContext = Depends(request_context)):
     # Validate user is logged in
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get user data
-    user = get_user(user_token)
-    user_data = user.get().to_dict()
+    user, user_data = await context.user()
     
     return templates.TemplateResponse("user_profile.html", {
         "request": request,
@@ -222,18 +1300,48 @@ async def user_profile(request: Request):
         "user_info": user_data
     })
 
+# Route for the tasks assigned to the user on every board they are on
+@app.get("/my-tasks", response_class=HTMLResponse)
+async def my_tasks(
+    request: Request,
+    view: str = 'all',
+    cursor: Optional[str] = None,
+    context: RequestContext = Depends(request_context)
+):
+    user_token = context.user_token
+    if not user_token:
+        return RedirectResponse("/")
+    
+    if view not in MY_TASK_VIEWS:
+        view = 'all'
+    
+    tasks, next_cursor = await get_my_task_page(user_token['user_id'], view, cursor)
+    
+    return templates.TemplateResponse("my_tasks.html", {
+        "request": request,
+        "user_token": user_token,
+        "tasks": tasks,
+        "view": view,
+        "next_cursor": next_cursor
+    })
+
 # Route to view a board
 @app.get("/board/{board_id}", response_class=HTMLResponse)
-async def view_board(request: Request, board_id: str):
+async def view_board(
+    request: Request,
+    board_id: str,
+    task_filter: Optional[str] = Query(None, alias="filter"),
+    cursor: Optional[str] = None,
+    context: RequestContext = Depends(request_context)
+):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -244,43 +1352,22 @@ async def view_board(request: Request, board_id: str):
     if user_token['user_id'] not in board_data['members']:
         return RedirectResponse("/")
     
-    # Get all tasks for this board
-    tasks_ref = firestore_db.collection('tasks').where('board_id', '==', board_id).stream()
-    tasks = []
+    etag = page_etag('board', board_id, board_data.get('version', 0), board.update_time, user_token['user_id'],
+                     user_token['email'], request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag)
     
-    active_tasks = 0
-    completed_tasks = 0
+    # The task counters are kept on the board document so we don't have to count the tasks ourselves
+    counts = await board_task_counts(board_id, board_data)
+    active_tasks = counts['active_tasks']
+    completed_tasks = counts['completed_tasks']
     
-    for task in tasks_ref:
-        task_data = task.to_dict()
-        task_data['id'] = task.id
-        
-        # If task is completed, add the completion status
-        if task_data.get('completed', False):
-            completed_tasks += 1
-        else:
-            active_tasks += 1
-            
-        # Check if task is unassigned (was assigned to someone who was removed)
-        if task_data.get('assigned_to') is None or (
-            task_data.get('assigned_to') and 
-            task_data['assigned_to'] not in board_data['members']
-        ):
-            task_data['unassigned'] = True
-        else:
-            task_data['unassigned'] = False
-            
-        tasks.append(task_data)
-    
-    # Get all users for the board
-    board_members = []
-    for user_id in board_data['members']:
-        user_ref = firestore_db.collection('users').document(user_id).get()
-        if user_ref.exists:
-            member_data = user_ref.to_dict()
-            member_data['id'] = user_id
-            member_data['is_creator'] = (user_id == board_data['creator_id'])
-            board_members.append(member_data)
+    # Get the first page of tasks for this board and all users for the board. The two don't depend on each other
+    # so we run the tasks query and the member reads at the same time. The rest of the tasks are loaded on demand
+    (tasks, next_cursor), board_members = await asyncio.gather(
+        get_task_page(board_id, board_data, task_filter, cursor),
+        get_board_members(board_data)
+    )
     
     # Determine if current user is the creator
     is_creator = (user_token['user_id'] == board_data['creator_id'])
@@ -291,11 +1378,84 @@ async def view_board(request: Request, board_id: str):
         "board": board_data,
         "board_id": board_id,
         "tasks": tasks,
+        "next_cursor": next_cursor,
+        "task_filter": task_filter if task_filter in TASK_FILTERS else None,
         "members": board_members,
+        "members_by_id": members_by_id(board_members),
         "is_creator": is_creator,
         "active_tasks": active_tasks,
         "completed_tasks": completed_tasks,
         "total_tasks": active_tasks + completed_tasks
+    }, headers={'ETag': etag, 'Cache-Control': PAGE_CACHE_CONTROL})
+
+# Route that returns the next page of a board's tasks as an HTML fragment. The board page calls this when the user
+# asks for more tasks and appends the result to the task list
+@app.get("/board/{board_id}/tasks", response_class=HTMLResponse)
+async def board_task_page(
+    request: Request,
+    board_id: str,
+    task_filter: Optional[str] = Query(None, alias="filter"),
+    cursor: Optional[str] = None,
+    context: RequestContext = Depends(request_context)
+):
+    # Check for token and validate
+    user_token = context.user_token
+    if not user_token:
+        return HTMLResponse("", status_code=401)
+    
+    # Get the board
+    board = await context.board(board_id)
+    
+    if not board.exists:
+        return HTMLResponse("", status_code=404)
+    
+    board_data = board.to_dict()
+    
+    # Check if user is authorized to view this board
+    if user_token['user_id'] not in board_data['members']:
+        return HTMLResponse("", status_code=403)
+    
+    (tasks, next_cursor), board_members = await asyncio.gather(
+        get_task_page(board_id, board_data, task_filter, cursor),
+        get_board_members(board_data)
+    )
+    
+    return templates.TemplateResponse("task_page.html", {
+        "request": request,
+        "board_id": board_id,
+        "tasks": tasks,
+        "next_cursor": next_cursor,
+        "task_filter": task_filter if task_filter in TASK_FILTERS else None,
+        "members_by_id": members_by_id(board_members)
+    })
+
+# Route that streams live changes to a board as server-sent events, so the board page can update itself in place
+# instead of reloading after every change. Everyone viewing a board shares the same listeners
+@app.get("/board/{board_id}/events")
+async def board_events(request: Request, board_id: str, context: RequestContext = Depends(request_context)):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    user_token = context.user_token
+    
+    async def stream():
+        # ask the browser to wait a few seconds before reconnecting if the connection drops
+        yield "retry: 5000\n\n"
+        async for event in board_event_hub.listen(board_id):
+            if event['type'] == 'ping':
+                yield ": ping\n\n"
+                continue
+            # a viewer who has been removed from the board reloads and is sent back to the dashboard
+            if event['type'] == 'board' and user_token['user_id'] not in event['data']['members']:
+                event = {'type': 'reload'}
+            data = json.dumps(event.get('data', {}), default=str)
+            yield f"event: {event['type']}\ndata: {data}\n\n"
+            if event['type'] == 'reload':
+                return
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 @app.post("/add-task", response_class=RedirectResponse)
@@ -304,17 +1464,17 @@ async def add_task(
     board_id: str = Form(...),
     title: str = Form(...),
     due_date: str = Form(...),
-    assigned_to: Optional[str] = Form(None)
+    assigned_to: Optional[str] = Form(None),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board to verify membership
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -325,98 +1485,46 @@ async def add_task(
     if user_token['user_id'] not in board_data['members']:
         return RedirectResponse("/")
     
-    # Check if a task with the same name already exists on this board
-    duplicate_tasks = list(firestore_db.collection('tasks')
-                         .where('board_id', '==', board_id)
-                         .where('title', '==', title)
-                         .limit(1)
-                         .stream())
-    
-    if duplicate_tasks:
-        # Redirect back to board with error message
-        return RedirectResponse(f"/board/{board_id}?error=duplicate_task", status_code=HTTP_302_FOUND)
+    if parse_due_date(due_date) is None:
+        if wants_json(request):
+            return JSONResponse({'error': 'invalid_due_date'}, status_code=400)
+        return RedirectResponse(f"/board/{board_id}?error=invalid_due_date", status_code=HTTP_302_FOUND)
     
     # Create a new task
-    new_task = {
-        'title': title,
-        'due_date': due_date,
-        'created_by': user_token['user_id'],
-        'created_at': datetime.datetime.now(),
-        'board_id': board_id,
-        'completed': False,
-        'completion_date': None,
-        'assigned_to': assigned_to if assigned_to else None,
-        'unassigned': False if assigned_to else True  # Mark as unassigned if no user assigned
-    }
+    new_task = new_task_data(board_id, title, due_date, assigned_to, user_token['user_id'])
     
-    # Add the task to Firestore
-    task_ref = firestore_db.collection('tasks').document()
-    task_ref.set(new_task)
+    # Add the task to Firestore and count it as active on the board. The check for a task with the same name on
+    # this board happens in the same transaction
+    await ensure_task_counters(board_id, board_data)
+    task_id = await add_task_in_transaction(firestore_db.transaction(), board_ref, new_task)
+    board_cache.invalidate(board_id)
+    
+    if not task_id:
+        if wants_json(request):
+            return JSONResponse({'error': 'duplicate_task'}, status_code=409)
+        # Redirect back to board with error message
+        return RedirectResponse(f"/board/{board_id}?error=duplicate_task", status_code=HTTP_302_FOUND)
     
+    if wants_json(request):
+        return JSONResponse({'task_id': task_id, 'change': 'added'})
     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
 
-# # Route to add a task
-# @app.post("/add-task", response_class=RedirectResponse)
-# async def add_task(
-#     request: Request, 
-#     board_id: str = Form(...),
-#     title: str = Form(...),
-#     due_date: str = Form(...),
-#     assigned_to: Optional[str] = Form(None)
-# ):
-#     # Check for token and validate
-#     id_token = request.cookies.get("token")
-#     user_token = validate_firebase_token(id_token)
-#     if not user_token:
-#         return RedirectResponse("/")
-    
-#     # Get the board to verify membership
-#     board_ref = firestore_db.collection('boards').document(board_id)
-#     board = board_ref.get()
-    
-#     if not board.exists:
-#         return RedirectResponse("/")
-    
-#     board_data = board.to_dict()
-    
-#     # Check if user is authorized to add a task to this board
-#     if user_token['user_id'] not in board_data['members']:
-#         return RedirectResponse("/")
-    
-#     # Create a new task
-#     new_task = {
-#         'title': title,
-#         'due_date': due_date,
-#         'created_by': user_token['user_id'],
-#         'created_at': datetime.datetime.now(),
-#         'board_id': board_id,
-#         'completed': False,
-#         'completion_date': None,
-#         'assigned_to': assigned_to if assigned_to else None
-#     }
-    
-#     # Add the task to Firestore
-#     task_ref = firestore_db.collection('tasks').document()
-#     task_ref.set(new_task)
-    
-#     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
-
 # Route to mark a task as complete/incomplete
 @app.post("/toggle-task", response_class=RedirectResponse)
 async def toggle_task(
     request: Request,
     task_id: str = Form(...),
-    board_id: str = Form(...)
+    board_id: str = Form(...),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board to verify membership
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -427,31 +1535,16 @@ async def toggle_task(
     if user_token['user_id'] not in board_data['members']:
         return RedirectResponse("/")
     
-    # Get the task
+    # Toggle the task and update the board's counters
+    await ensure_task_counters(board_id, board_data)
     task_ref = firestore_db.collection('tasks').document(task_id)
-    task = task_ref.get()
-    
-    if not task.exists:
-        return RedirectResponse(f"/board/{board_id}")
-    
-    task_data = task.to_dict()
-    
-    # Toggle the completed status
-    new_completed_status = not task_data.get('completed', False)
-    
-    # Update the task
-    update_data = {
-        'completed': new_completed_status
-    }
-    
-    # If marking as complete, add the completion date
-    if new_completed_status:
-        update_data['completion_date'] = datetime.datetime.now()
-    else:
-        update_data['completion_date'] = None
-    
-    task_ref.update(update_data)
+    toggled = await toggle_task_in_transaction(firestore_db.transaction(), task_ref, board_ref)
+    board_cache.invalidate(board_id)
     
+    if wants_json(request):
+        if not toggled:
+            return JSONResponse({'error': 'task_not_found'}, status_code=404)
+        return JSONResponse({'task_id': task_id, 'change': 'modified'})
     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
 
 # Route to delete a task
@@ -459,17 +1552,17 @@ async def toggle_task(
 async def delete_task(
     request: Request,
     task_id: str = Form(...),
-    board_id: str = Form(...)
+    board_id: str = Form(...),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board to verify membership
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -480,10 +1573,16 @@ async def delete_task(
     if user_token['user_id'] not in board_data['members']:
         return RedirectResponse("/")
     
-    # Delete the task
+    # Delete the task and take it off the board's counters
+    await ensure_task_counters(board_id, board_data)
     task_ref = firestore_db.collection('tasks').document(task_id)
-    task_ref.delete()
+    deleted = await delete_task_in_transaction(firestore_db.transaction(), task_ref, board_ref)
+    board_cache.invalidate(board_id)
     
+    if wants_json(request):
+        if not deleted:
+            return JSONResponse({'error': 'task_not_found'}, status_code=404)
+        return JSONResponse({'task_id': task_id, 'change': 'removed'})
     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
 
 # Route to edit a task
@@ -494,17 +1593,17 @@ async def edit_task(
     board_id: str = Form(...),
     title: str = Form(...),
     due_date: str = Form(...),
-    assigned_to: Optional[str] = Form(None)
+    assigned_to: Optional[str] = Form(None),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board to verify membership
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -515,23 +1614,36 @@ async def edit_task(
     if user_token['user_id'] not in board_data['members']:
         return RedirectResponse("/")
     
-    task_ref = firestore_db.collection('tasks').document(task_id)
-    
-    # Check if the task was previously unassigned and is now assigned
-    task = task_ref.get()
-    task_data = task.to_dict()
+    if parse_due_date(due_date) is None:
+        if wants_json(request):
+            return JSONResponse({'error': 'invalid_due_date'}, status_code=400)
+        return RedirectResponse(f"/board/{board_id}?error=invalid_due_date", status_code=HTTP_302_FOUND)
     
+    # The unassigned flag always follows the assignment so the unassigned filter on the board page can be done
+    # with a query
     update_data = {
         'title': title,
-        'due_date': due_date,
-        'assigned_to': assigned_to if assigned_to else None
+        'due_date': parse_due_date(due_date),
+        'assigned_to': assigned_to if assigned_to else None,
+        'unassigned': False if assigned_to else True
     }
     
-    # Remove unassigned flag if task is now assigned to a user
-    if assigned_to and task_data.get('unassigned', False):
-        update_data['unassigned'] = False
+    # Update the task. If the title changes the new title is checked for duplicates and reserved in the same
+    # transaction
+    task_ref = firestore_db.collection('tasks').document(task_id)
+    result = await edit_task_in_transaction(firestore_db.transaction(), task_ref, board_id, update_data)
+    board_cache.invalidate(board_id)
+    
+    if wants_json(request):
+        if result == 'duplicate':
+            return JSONResponse({'error': 'duplicate_task'}, status_code=409)
+        if result == 'missing':
+            return JSONResponse({'error': 'task_not_found'}, status_code=404)
+        return JSONResponse({'task_id': task_id, 'change': 'modified'})
     
-    task_ref.update(update_data)
+    if result == 'duplicate':
+        # Redirect back to board with error message
+        return RedirectResponse(f"/board/{board_id}?error=duplicate_task", status_code=HTTP_302_FOUND)
     
     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
 
@@ -540,17 +1652,17 @@ async def edit_task(
 async def add_user_to_board(
     request: Request,
     board_id: str = Form(...),
-    user_email: str = Form(...)
+    user_email: str = Form(...),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -561,38 +1673,31 @@ async def add_user_to_board(
     if user_token['user_id'] != board_data['creator_id']:
         return RedirectResponse(f"/board/{board_id}")
     
-    # Find user by email
-    users_ref = firestore_db.collection('users').where('email', '==', user_email).stream()
-    found_user = None
-    
-    for user in users_ref:
-        found_user = user
-        break
+    # Find user by email using the email index
+    email_entry = await email_index_ref(user_email).get()
     
-    if not found_user:
+    if not email_entry.exists:
         return RedirectResponse(f"/board/{board_id}")
     
-    user_id = found_user.id
-    user_data = found_user.to_dict()
+    user_id = email_entry.to_dict()['user_id']
     
     # Check if user is already a member
     if user_id in board_data['members']:
         return RedirectResponse(f"/board/{board_id}")
     
-    # Add user to board members
-    board_data['members'].append(user_id)
-    board_ref.update({
-        'members': board_data['members']
+    # Add user to board members and the board to the user's member_boards. ArrayUnion only adds the id if it isn't
+    # there already, so two requests at the same time can't overwrite each other's changes
+    batch = firestore_db.batch()
+    batch.update(board_ref, {
+        'members': firestore.ArrayUnion([user_id]),
+        'version': firestore.Increment(1)
     })
-    
-    # Add board to user's member_boards
-    member_boards = user_data.get('member_boards', [])
-    if board_id not in member_boards:
-        member_boards.append(board_id)
-        
-    firestore_db.collection('users').document(user_id).update({
-        'member_boards': member_boards
+    batch.update(firestore_db.collection('users').document(user_id), {
+        'member_boards': firestore.ArrayUnion([board_id]),
+        'version': firestore.Increment(1)
     })
+    await batch.commit()
+    board_cache.invalidate(board_id)
     
     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
 
@@ -601,17 +1706,17 @@ async def add_user_to_board(
 async def remove_user_from_board(
     request: Request,
     board_id: str = Form(...),
-    user_id: str = Form(...)
+    user_id: str = Form(...),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -626,53 +1731,58 @@ async def remove_user_from_board(
     if user_id == board_data['creator_id']:
         return RedirectResponse(f"/board/{board_id}")
     
-    # Remove user from board members
-    if user_id in board_data['members']:
-        board_data['members'].remove(user_id)
-        board_ref.update({
-            'members': board_data['members']
+    # Mark all tasks assigned to this user as unassigned. The tasks are streamed and the updates are sent in
+    # batches, so a user with thousands of tasks only costs a handful of round trips. This is done before the
+    # membership changes so if it fails part way the creator can simply remove the user again
+    assigned_tasks = (firestore_db.collection('tasks')
+                      .where('board_id', '==', board_id)
+                      .where('assigned_to', '==', user_id)
+                      .select(['assigned_to'])
+                      .stream())
+    await commit_in_batches(
+        ('update', task.reference, {
+            'assigned_to': None,
+            'unassigned': True  # Explicitly mark as unassigned
         })
+        async for task in assigned_tasks
+    )
     
-    # Remove board from user's member_boards
+    # Remove user from board members and the board from the user's member_boards. Both arrays are changed with
+    # ArrayRemove in a single batch so there is no read-modify-write and they can't end up out of step
     user_ref = firestore_db.collection('users').document(user_id)
-    user = user_ref.get()
+    user = await user_ref.get()
     
+    batch = firestore_db.batch()
+    batch.update(board_ref, {
+        'members': firestore.ArrayRemove([user_id]),
+        'version': firestore.Increment(1)
+    })
     if user.exists:
-        user_data = user.to_dict()
-        member_boards = user_data.get('member_boards', [])
-        
-        if board_id in member_boards:
-            member_boards.remove(board_id)
-            user_ref.update({
-                'member_boards': member_boards
-            })
-    
-    # Mark all tasks assigned to this user as unassigned
-    tasks_ref = firestore_db.collection('tasks').where('board_id', '==', board_id).where('assigned_to', '==', user_id).stream()
-    
-    for task in tasks_ref:
-        firestore_db.collection('tasks').document(task.id).update({
-            'assigned_to': None,
-            'unassigned': True  # Explicitly mark as unassigned
+        batch.update(user_ref, {
+            'member_boards': firestore.ArrayRemove([board_id]),
+            'version': firestore.Increment(1)
         })
+    await batch.commit()
+    board_cache.invalidate(board_id)
     
     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
+
 # Route to rename a board
 @app.post("/rename-board", response_class=RedirectResponse)
 async def rename_board(
     request: Request,
     board_id: str = Form(...),
-    new_name: str = Form(...)
+    new_name: str = Form(...),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -683,10 +1793,14 @@ async def rename_board(
     if user_token['user_id'] != board_data['creator_id']:
         return RedirectResponse(f"/board/{board_id}")
     
-    # Rename the board
-    board_ref.update({
-        'name': new_name
-    })
+    # Rename the board. The name is on the dashboard of everyone on the board so their versions change too
+    await commit_in_batches([
+        ('update', board_ref, {'name': new_name, 'version': firestore.Increment(1)})
+    ] + [
+        ('update', firestore_db.collection('users').document(member_id), {'version': firestore.Increment(1)})
+        for member_id in board_data['members']
+    ])
+    board_cache.invalidate(board_id)
     
     return RedirectResponse(f"/board/{board_id}", status_code=HTTP_302_FOUND)
 
@@ -694,17 +1808,18 @@ async def rename_board(
 @app.post("/delete-board", response_class=RedirectResponse)
 async def delete_board(
     request: Request,
-    board_id: str = Form(...)
+    board_id: str = Form(...),
+    force: bool = Form(False),
+    context: RequestContext = Depends(request_context)
 ):
     # Check for token and validate
-    id_token = request.cookies.get("token")
-    user_token = validate_firebase_token(id_token)
+    user_token = context.user_token
     if not user_token:
         return RedirectResponse("/")
     
     # Get the board
     board_ref = firestore_db.collection('boards').document(board_id)
-    board = board_ref.get()
+    board = await context.board(board_id)
     
     if not board.exists:
         return RedirectResponse("/")
@@ -715,38 +1830,639 @@ async def delete_board(
     if user_token['user_id'] != board_data['creator_id']:
         return RedirectResponse("/")
     
+    # A forced delete takes the board away straight away and clears out its tasks in the background
+    if force:
+        await force_delete_board(board_id, user_token['user_id'])
+        return RedirectResponse("/", status_code=HTTP_302_FOUND)
+    
     # Check if there are non-owner users on the board
     if len(board_data['members']) > 1:
         return RedirectResponse(f"/board/{board_id}")
     
-    # Check if there are tasks on the board
-    tasks_ref = firestore_db.collection('tasks').where('board_id', '==', board_id).limit(1).stream()
-    has_tasks = False
-    for _ in tasks_ref:
-        has_tasks = True
-        break
+    # Delete the board and remove it from the creator's created_boards. The member and task checks are done again
+    # inside the transaction so a member or task added at the same moment stops the delete
+    user_ref = firestore_db.collection('users').document(user_token['user_id'])
+    deleted = await delete_board_in_transaction(firestore_db.transaction(), board_ref, user_ref)
+    board_cache.invalidate(board_id)
     
-    if has_tasks:
+    if not deleted:
         return RedirectResponse(f"/board/{board_id}")
     
-    # Remove board from creator's created_boards
-    user_ref = firestore_db.collection('users').document(user_token['user_id'])
-    user = user_ref.get()
+    return RedirectResponse("/", status_code=HTTP_302_FOUND)
+
+# JSON route that returns the task counters for a board. The counters come from the board document so this never
+# has to read the tasks collection
+@app.get("/api/v1/boards/{board_id}/summary")
+async def board_summary(request: Request, board_id: str, context: RequestContext = Depends(request_context)):
+    # Check the user is signed in and can view this board
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    counts = await board_task_counts(board_id, board.to_dict())
+    
+    return {
+        'board_id': board_id,
+        'active_tasks': counts['active_tasks'],
+        'completed_tasks': counts['completed_tasks'],
+        'total_tasks': counts['active_tasks'] + counts['completed_tasks']
+    }
+
+# Function that checks the caller of an API route is signed in and a member of the board. Returns the board and
+# None, or None and the error response to send back
+async def api_board(context, board_id):
+    user_token = context.user_token
+    if not user_token:
+        return None, JSONResponse({'error': 'not_authenticated'}, status_code=401)
     
-    if user.exists:
-        user_data = user.to_dict()
-        created_boards = user_data.get('created_boards', [])
+    board = await context.board(board_id)
+    if not board.exists:
+        return None, JSONResponse({'error': 'board_not_found'}, status_code=404)
+    
+    if user_token['user_id'] not in board.to_dict()['members']:
+        return None, JSONResponse({'error': 'not_a_member'}, status_code=403)
+    
+    return board, None
+
+# Route that force deletes a board with all of its tasks and members. Only the creator can do this. The board is
+# gone when this returns, the tasks are deleted by a background job whose progress can be followed at status_url
+@app.post("/api/v1/boards/{board_id}/delete", status_code=202)
+async def api_delete_board(board_id: str, context: RequestContext = Depends(request_context)):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    if board.to_dict()['creator_id'] != context.user_token['user_id']:
+        return JSONResponse({'error': 'not_the_creator'}, status_code=403)
+    
+    job_ref = await force_delete_board(board_id, context.user_token['user_id'])
+    if job_ref is None:
+        return JSONResponse({'error': 'board_not_found'}, status_code=404)
+    
+    return {'job_id': job_ref.id, 'status_url': f"/api/v1/jobs/{job_ref.id}"}
+
+# Route that returns the progress of a background job. Only the user who started the job can see it
+@app.get("/api/v1/jobs/{job_id}")
+async def api_job_status(job_id: str, context: RequestContext = Depends(request_context)):
+    user_token = context.user_token
+    if not user_token:
+        return JSONResponse({'error': 'not_authenticated'}, status_code=401)
+    
+    job = await firestore_db.collection('jobs').document(job_id).get()
+    if not job.exists or job.to_dict()['user_id'] != user_token['user_id']:
+        return JSONResponse({'error': 'job_not_found'}, status_code=404)
+    
+    job_data = job.to_dict()
+    job_data['job_id'] = job_id
+    if job_data['type'] == 'delete_board':
+        if job_data['state'] == 'done':
+            job_data['progress'] = 1.0
+        else:
+            # every task has at most one title reservation, and they are deleted after the tasks
+            deleted = job_data['tasks_deleted'] + job_data['titles_deleted']
+            job_data['progress'] = min(deleted / max(2 * job_data['total_tasks'], 1), 1.0)
+    return job_data
+
+# Function that checks the fields of a task sent to the bulk API. Returns an error code or None if they are fine
+def task_input_error(title, due_date, assigned_to, board_data):
+    if not title or not title.strip():
+        return 'title_required'
+    if not due_date:
+        return 'due_date_required'
+    if parse_due_date(due_date) is None:
+        return 'invalid_due_date'
+    if assigned_to and assigned_to not in board_data['members']:
+        return 'assignee_not_a_member'
+    return None
+
+# Request bodies for the bulk task API
+class NewTask(BaseModel):
+    title: str
+    due_date: str
+    assigned_to: Optional[str] = None
+
+class CreateTasks(BaseModel):
+    tasks: List[NewTask]
+
+# Only the fields that are sent are changed. Send assigned_to as null to unassign a task
+class TaskChanges(BaseModel):
+    id: str
+    title: Optional[str] = None
+    due_date: Optional[str] = None
+    assigned_to: Optional[str] = None
+
+class UpdateTasks(BaseModel):
+    tasks: List[TaskChanges]
+
+class TaskIds(BaseModel):
+    task_ids: List[str]
+
+class CompleteTasks(TaskIds):
+    completed: bool = True
+
+# Function that turns the per item results of a bulk request into the response. Results are in the same order as the
+# items in the request
+def bulk_response(results):
+    return {'results': [dict(index=index, **result) for index, result in enumerate(results)]}
+
+# Function that reads the tasks named in a bulk request. Returns the snapshots of the tasks that are on the board and
+# fills in an error in results for every other id
+async def read_board_tasks(board_id, task_ids, results):
+    tasks = await get_documents('tasks', task_ids)
+    seen = set()
+    found = {}
+    for index, task_id in enumerate(task_ids):
+        task = tasks.get(task_id)
+        if task_id in seen:
+            results[index] = {'id': task_id, 'error': 'repeated_task'}
+        elif task is None or task.to_dict().get('board_id') != board_id:
+            results[index] = {'id': task_id, 'error': 'task_not_found'}
+        else:
+            found[index] = task
+        seen.add(task_id)
+    return found
+
+# Route that lists the tasks assigned to the user across all of their boards, in order of due date
+@app.get("/api/v1/my-tasks")
+async def api_my_tasks(
+    view: str = 'all',
+    cursor: Optional[str] = None,
+    limit: int = Query(TASK_PAGE_SIZE, ge=1, le=BULK_TASK_LIMIT),
+    context: RequestContext = Depends(request_context)
+):
+    user_token = context.user_token
+    if not user_token:
+        return JSONResponse({'error': 'not_authenticated'}, status_code=401)
+    
+    if view not in MY_TASK_VIEWS:
+        return JSONResponse({'error': 'unknown_view'}, status_code=400)
+    
+    tasks, next_cursor = await get_my_task_page(user_token['user_id'], view, cursor, limit)
+    return {'tasks': tasks, 'next_cursor': next_cursor}
+
+# Route that lists a board's tasks a page at a time, oldest first. Takes the same filter and cursor as the board page
+@app.get("/api/v1/boards/{board_id}/tasks")
+async def api_list_tasks(
+    board_id: str,
+    task_filter: Optional[str] = Query(None, alias="filter"),
+    cursor: Optional[str] = None,
+    limit: int = Query(TASK_PAGE_SIZE, ge=1, le=BULK_TASK_LIMIT),
+    context: RequestContext = Depends(request_context)
+):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    if task_filter and task_filter not in TASK_FILTERS:
+        return JSONResponse({'error': 'unknown_filter'}, status_code=400)
+    
+    tasks, next_cursor = await get_task_page(board_id, board.to_dict(), task_filter, cursor, limit)
+    return {'tasks': tasks, 'next_cursor': next_cursor}
+
+# Function that creates tasks on a board for the bulk API and imports. Each task is a (title, due_date, assigned_to)
+# tuple. Titles are checked against each other and against the titles already reserved on the board, so the same
+# duplicate rule applies as for the add task form. Returns a result for each task, in the same order
+async def create_board_tasks(board_ref, board_data, user_id, tasks):
+    board_id = board_ref.id
+    results = [None] * len(tasks)
+    
+    # The first task with a title claims it, any later task with the same title is a duplicate
+    claimed = {}
+    for index, (title, due_date, assigned_to) in enumerate(tasks):
+        error = task_input_error(title, due_date, assigned_to, board_data)
+        if error:
+            results[index] = {'error': error}
+            continue
+        reservation_id = title_reservation_ref(board_id, title).id
+        if reservation_id in claimed:
+            results[index] = {'error': 'duplicate_task'}
+        else:
+            claimed[reservation_id] = index
+    
+    reservations, held = await read_title_reservations(list(claimed))
+    
+    items = []
+    for reservation_id, index in claimed.items():
+        if reservation_id in held:
+            results[index] = {'error': 'duplicate_task'}
+            continue
+        
+        title, due_date, assigned_to = tasks[index]
+        new_task = new_task_data(board_id, title, due_date, assigned_to, user_id)
+        task_ref = firestore_db.collection('tasks').document()
         
-        if board_id in created_boards:
-            created_boards.remove(board_id)
-            user_ref.update({
-                'created_boards': created_boards
-            })
+        async def retry(new_task=new_task):
+            task_id = await add_task_in_transaction(firestore_db.transaction(), board_ref, new_task)
+            return {'id': task_id, 'status': 'created'} if task_id else {'error': 'duplicate_task'}
+        
+        items.append({
+            'index': index,
+            'writes': [
+                ('create', task_ref, new_task, None),
+                reserve_title_write(board_id, title, task_ref.id, reservations)
+            ],
+            'counters': {'active_tasks': 1},
+            'result': {'id': task_ref.id, 'status': 'created'},
+            'retry': retry
+        })
     
-    # Delete the board
-    board_ref.delete()
+    await commit_task_batches(board_ref, items)
     
-    return RedirectResponse("/", status_code=HTTP_302_FOUND)
+    for item in items:
+        results[item['index']] = item['result']
+    return results
+
+# Route that creates tasks in bulk
+@app.post("/api/v1/boards/{board_id}/tasks")
+async def api_create_tasks(board_id: str, body: CreateTasks, context: RequestContext = Depends(request_context)):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    if len(body.tasks) > BULK_TASK_LIMIT:
+        return JSONResponse({'error': 'too_many_tasks', 'limit': BULK_TASK_LIMIT}, status_code=413)
+    
+    board_ref = firestore_db.collection('boards').document(board_id)
+    board_data = await ensure_task_counters(board_id, board.to_dict())
+    results = await create_board_tasks(board_ref, board_data, context.user_token['user_id'],
+                                       [(task.title, task.due_date, task.assigned_to) for task in body.tasks])
+    board_cache.invalidate(board_id)
+    return bulk_response(results)
+
+# Route that edits tasks in bulk. A task that changes title gives up its old title and reserves the new one, the
+# same as the edit task form
+@app.patch("/api/v1/boards/{board_id}/tasks")
+async def api_update_tasks(board_id: str, body: UpdateTasks, context: RequestContext = Depends(request_context)):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    if len(body.tasks) > BULK_TASK_LIMIT:
+        return JSONResponse({'error': 'too_many_tasks', 'limit': BULK_TASK_LIMIT}, status_code=413)
+    
+    board_ref = firestore_db.collection('boards').document(board_id)
+    board_data = board.to_dict()
+    results = [None] * len(body.tasks)
+    tasks = await read_board_tasks(board_id, [changes.id for changes in body.tasks], results)
+    
+    # Work out the new version of every task, then read the reservations of the old and new titles in one go
+    updates = {}
+    for index, task in tasks.items():
+        changes = body.tasks[index]
+        task_data = task.to_dict()
+        for field in changes.model_fields_set - {'id'}:
+            task_data[field] = getattr(changes, field)
+        
+        error = task_input_error(task_data['title'], task_data['due_date'], task_data.get('assigned_to'), board_data)
+        if error:
+            results[index] = {'id': task.id, 'error': error}
+            continue
+        
+        # The unassigned flag always follows the assignment, the same as in the edit task form
+        updates[index] = {
+            'title': task_data['title'],
+            'due_date': parse_due_date(task_data['due_date']),
+            'assigned_to': task_data.get('assigned_to') or None,
+            'unassigned': not task_data.get('assigned_to')
+        }
+    
+    reservation_ids = []
+    for index, update_data in updates.items():
+        reservation_ids.append(title_reservation_ref(board_id, tasks[index].to_dict()['title']).id)
+        reservation_ids.append(title_reservation_ref(board_id, update_data['title']).id)
+    reservations, held = await read_title_reservations(reservation_ids)
+    
+    items = []
+    claimed = set()
+    for index, update_data in updates.items():
+        task = tasks[index]
+        old_reservation_ref = title_reservation_ref(board_id, task.to_dict()['title'])
+        new_reservation_ref = title_reservation_ref(board_id, update_data['title'])
+        
+        owner = held.get(new_reservation_ref.id)
+        if (owner and owner != task.id) or new_reservation_ref.id in claimed:
+            results[index] = {'id': task.id, 'error': 'duplicate_task'}
+            continue
+        claimed.add(new_reservation_ref.id)
+        
+        option = firestore_db.write_option(last_update_time=task.update_time)
+        writes = [('update', task.reference, update_data, option)]
+        if owner != task.id:
+            writes.append(reserve_title_write(board_id, update_data['title'], task.id, reservations))
+        if new_reservation_ref.id != old_reservation_ref.id and held.get(old_reservation_ref.id) == task.id:
+            old_option = firestore_db.write_option(last_update_time=reservations[old_reservation_ref.id].update_time)
+            writes.append(('delete', old_reservation_ref, None, old_option))
+        
+        async def retry(task_ref=task.reference, update_data=update_data):
+            result = await edit_task_in_transaction(firestore_db.transaction(), task_ref, board_id, update_data)
+            if result == 'updated':
+                return {'id': task_ref.id, 'status': 'updated'}
+            return {'id': task_ref.id, 'error': 'duplicate_task' if result == 'duplicate' else 'task_not_found'}
+        
+        items.append({
+            'index': index,
+            'writes': writes,
+            'counters': {},
+            'result': {'id': task.id, 'status': 'updated'},
+            'retry': retry
+        })
+    
+    await commit_task_batches(board_ref, items)
+    board_cache.invalidate(board_id)
+    
+    for item in items:
+        results[item['index']] = item['result']
+    return bulk_response(results)
+
+# Route that marks tasks as complete in bulk, or as not complete if completed is false. Tasks that already have that
+# status are left alone
+@app.post("/api/v1/boards/{board_id}/tasks/complete")
+async def api_complete_tasks(board_id: str, body: CompleteTasks, context: RequestContext = Depends(request_context)):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    if len(body.task_ids) > BULK_TASK_LIMIT:
+        return JSONResponse({'error': 'too_many_tasks', 'limit': BULK_TASK_LIMIT}, status_code=413)
+    
+    board_ref = firestore_db.collection('boards').document(board_id)
+    await ensure_task_counters(board_id, board.to_dict())
+    results = [None] * len(body.task_ids)
+    tasks = await read_board_tasks(board_id, body.task_ids, results)
+    status = 'completed' if body.completed else 'reopened'
+    change = 1 if body.completed else -1
+    
+    items = []
+    for index, task in tasks.items():
+        if task.to_dict().get('completed', False) == body.completed:
+            results[index] = {'id': task.id, 'status': 'unchanged'}
+            continue
+        
+        async def retry(task_ref=task.reference):
+            found = await toggle_task_in_transaction(firestore_db.transaction(), task_ref, board_ref, body.completed)
+            return {'id': task_ref.id, 'status': status} if found else {'id': task_ref.id, 'error': 'task_not_found'}
+        
+        option = firestore_db.write_option(last_update_time=task.update_time)
+        items.append({
+            'index': index,
+            'writes': [('update', task.reference, {
+                'completed': body.completed,
+                'completion_date': datetime.datetime.now() if body.completed else None
+            }, option)],
+            'counters': {'active_tasks': -change, 'completed_tasks': change},
+            'result': {'id': task.id, 'status': status},
+            'retry': retry
+        })
+    
+    await commit_task_batches(board_ref, items)
+    board_cache.invalidate(board_id)
+    
+    for item in items:
+        results[item['index']] = item['result']
+    return bulk_response(results)
+
+# Route that deletes tasks in bulk and frees their titles
+@app.post("/api/v1/boards/{board_id}/tasks/delete")
+async def api_delete_tasks(board_id: str, body: TaskIds, context: RequestContext = Depends(request_context)):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    if len(body.task_ids) > BULK_TASK_LIMIT:
+        return JSONResponse({'error': 'too_many_tasks', 'limit': BULK_TASK_LIMIT}, status_code=413)
+    
+    board_ref = firestore_db.collection('boards').document(board_id)
+    await ensure_task_counters(board_id, board.to_dict())
+    results = [None] * len(body.task_ids)
+    tasks = await read_board_tasks(board_id, body.task_ids, results)
+    reservations = await get_documents(
+        'task_titles', [title_reservation_ref(board_id, task.to_dict()['title']).id for task in tasks.values()]
+    )
+    
+    items = []
+    for index, task in tasks.items():
+        task_data = task.to_dict()
+        writes = [('delete', task.reference, None, firestore_db.write_option(last_update_time=task.update_time))]
+        reservation = reservations.get(title_reservation_ref(board_id, task_data['title']).id)
+        if reservation is not None and reservation.to_dict().get('task_id') == task.id:
+            option = firestore_db.write_option(last_update_time=reservation.update_time)
+            writes.append(('delete', reservation.reference, None, option))
+        
+        async def retry(task_ref=task.reference):
+            found = await delete_task_in_transaction(firestore_db.transaction(), task_ref, board_ref)
+            return {'id': task_ref.id, 'status': 'deleted'} if found else {'id': task_ref.id, 'error': 'task_not_found'}
+        
+        completed = task_data.get('completed', False)
+        items.append({
+            'index': index,
+            'writes': writes,
+            'counters': {'completed_tasks': -1} if completed else {'active_tasks': -1},
+            'result': {'id': task.id, 'status': 'deleted'},
+            'retry': retry
+        })
+    
+    await commit_task_batches(board_ref, items)
+    board_cache.invalidate(board_id)
+    
+    for item in items:
+        results[item['index']] = item['result']
+    return bulk_response(results)
+
+# Function that turns a task into a row of an export. The due date is written as YYYY-MM-DD, the same as the forms
+# take it, and the other dates in ISO 8601
+def export_row(task_id, task_data):
+    def timestamp(value):
+        return value.isoformat() if isinstance(value, datetime.datetime) else value
+    
+    return {
+        'id': task_id,
+        'title': task_data.get('title'),
+        'due_date': format_due_date(task_data.get('due_date')) or None,
+        'assigned_to': task_data.get('assigned_to'),
+        'completed': bool(task_data.get('completed')),
+        'completion_date': timestamp(task_data.get('completion_date')),
+        'created_by': task_data.get('created_by'),
+        'created_at': timestamp(task_data.get('created_at'))
+    }
+
+# Async generator of a board's tasks a page at a time, oldest first. Each page is a query that starts after the last
+# task of the page before, so only one page is held in memory however many tasks the board has
+async def board_task_pages(board_id, page_size=EXPORT_PAGE_SIZE):
+    query = firestore_db.collection('tasks').where('board_id', '==', board_id).order_by('created_at').limit(page_size)
+    last = None
+    while True:
+        page = await (query.start_after(last) if last is not None else query).get()
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+# Route that exports every task on a board as NDJSON, or as CSV with ?format=csv. The file is sent while it is being
+# read, so it starts straight away and the memory it takes doesn't grow with the board
+@app.get("/api/v1/boards/{board_id}/export")
+async def api_export_tasks(
+    board_id: str,
+    export_format: str = Query('ndjson', alias="format"),
+    context: RequestContext = Depends(request_context)
+):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    if export_format not in FILE_FORMATS:
+        return JSONResponse({'error': 'unknown_format'}, status_code=400)
+    
+    async def export_file():
+        if export_format == 'csv':
+            yield encode_rows([], export_format, header=True)
+        async for page in board_task_pages(board_id):
+            yield encode_rows([export_row(task.id, task.to_dict()) for task in page], export_format)
+    
+    return StreamingResponse(export_file(), media_type=FILE_FORMATS[export_format], headers={
+        'Content-Disposition': f'attachment; filename="board-{board_id}.{export_format}"'
+    })
+
+# Function that finds the file sent to the import route. A form upload is read from its 'file' field and any other
+# body is the file itself. Either way the file is read as it arrives, the form isn't parsed with request.form() as
+# that would hold the request until the whole upload had been spooled. Returns an async iterator of the file's bytes
+# and its format, or None for both if a form was sent without a file. Raises UploadError if the form is malformed
+async def import_upload(request, requested_format):
+    content_type = request.headers.get('content-type', '')
+    if not content_type.startswith('multipart/form-data'):
+        return request.stream(), upload_format(requested_format, content_type)
+    
+    file_type, filename, chunks = await multipart_file(request.stream(), content_type)
+    if chunks is None:
+        return None, None
+    return chunks, upload_format(requested_format, file_type, filename)
+
+# Function that picks the fields of a new task out of an imported row. A field that isn't text counts as missing
+def import_task(fields):
+    def text(name):
+        value = fields.get(name)
+        return value.strip() or None if isinstance(value, str) else None
+    
+    title = fields.get('title')
+    return (title if isinstance(title, str) else None), text('due_date'), text('assigned_to')
+
+# Route that imports tasks into a board from an NDJSON or CSV file laid out like an export. The file is sent as the
+# body with its format in ?format= or the Content-Type, or as the 'file' field of a form upload. Every row becomes a
+# new task from its title, due_date and assigned_to, with the same checks as the add task form: the title can't be
+# used on the board already or earlier in the file and the assignee has to be a member. Rows are read as the file
+# arrives and created IMPORT_CHUNK_SIZE at a time, the next chunk being read while the one before is written. The
+# response counts the tasks created and the rows that failed, with the line and the reason for each
+@app.post("/api/v1/boards/{board_id}/import")
+async def api_import_tasks(
+    request: Request,
+    board_id: str,
+    import_format: Optional[str] = Query(None, alias="format"),
+    context: RequestContext = Depends(request_context)
+):
+    board, error = await api_board(context, board_id)
+    if error:
+        return error
+    
+    try:
+        chunks, file_format = await import_upload(request, import_format)
+    except UploadError:
+        return JSONResponse({'error': 'invalid_form'}, status_code=400)
+    if chunks is None:
+        return JSONResponse({'error': 'file_required'}, status_code=400)
+    if file_format is None:
+        return JSONResponse({'error': 'unknown_format', 'formats': list(FILE_FORMATS)}, status_code=415)
+    
+    board_ref = firestore_db.collection('boards').document(board_id)
+    board_data = await ensure_task_counters(board_id, board.to_dict())
+    user_id = context.user_token['user_id']
+    summary = {'created': 0, 'failed': 0}
+    errors = []
+    
+    def failed(row, error):
+        summary['failed'] += 1
+        if len(errors) < IMPORT_ERROR_LIMIT:
+            errors.append({'row': row, 'error': error})
+    
+    async def create(chunk):
+        results = await create_board_tasks(board_ref, board_data, user_id, [task for _, task in chunk])
+        for (row, _), result in zip(chunk, results):
+            if 'error' in result:
+                failed(row, result['error'])
+            else:
+                summary['created'] += 1
+    
+    rows = (csv_rows if file_format == 'csv' else ndjson_rows)(upload_lines(chunks))
+    chunk = []
+    writing = None
+    try:
+        async for row, fields, error in rows:
+            if error == 'missing_columns':
+                # this is the header, so nothing has been written yet
+                return JSONResponse({'error': 'missing_columns', 'required': list(REQUIRED_COLUMNS)}, status_code=400)
+            if error:
+                failed(row, error)
+                continue
+            chunk.append((row, import_task(fields)))
+            if len(chunk) == IMPORT_CHUNK_SIZE:
+                if writing is not None:
+                    await writing
+                writing = asyncio.ensure_future(create(chunk))
+                chunk = []
+    except UploadError:
+        # the form broke off part way, so the rows read so far are still imported and the response says so
+        summary['error'] = 'invalid_form'
+    if writing is not None:
+        await writing
+    if chunk:
+        await create(chunk)
+    board_cache.invalidate(board_id)
+    
+    return JSONResponse({**summary, 'errors': sorted(errors, key=lambda item: item['row'])},
+                        status_code=400 if 'error' in summary else 200)
+
+# Route that serves the metrics in the prometheus text format for a prometheus server to scrape
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Changes to the profiler settings. Only the fields that are sent are changed, send route as "" to clear it
+class ProfilingSettings(BaseModel):
+    mode: Optional[str] = None
+    rate: Optional[float] = None
+    route: Optional[str] = None
+
+# The profiling routes are only there for someone who has the PROFILING_TOKEN, to anyone else they don't exist
+def profiling_allowed(request):
+    token = request.headers.get('x-profiling-token', '')
+    return PROFILING_TOKEN is not None and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+# Route that shows the profiler settings and how much has been collected
+@app.get("/debug/profiling")
+async def get_profiling(request: Request):
+    if not profiling_allowed(request):
+        return JSONResponse({'error': 'not_found'}, status_code=404)
+    return profiler.settings()
+
+# Route that changes what the profiler profiles, for example {"mode": "collapsed", "route": "/board/{board_id}"}
+@app.post("/debug/profiling")
+async def update_profiling(request: Request, settings: ProfilingSettings):
+    if not profiling_allowed(request):
+        return JSONResponse({'error': 'not_found'}, status_code=404)
+    try:
+        profiler.configure(settings.mode, settings.rate, settings.route)
+    except ValueError:
+        return JSONResponse({'error': 'invalid_mode'}, status_code=400)
+    return profiler.settings()
+
+# Route that writes the stacks collected so far to PROFILE_DIR. pstats profiles are written as each request finishes
+@app.post("/debug/profiling/dump")
+async def dump_profiles(request: Request, reset: bool = False):
+    if not profiling_allowed(request):
+        return JSONResponse({'error': 'not_found'}, status_code=404)
+    files = profiler.dump()
+    if reset:
+        profiler.reset()
+    return {'files': files}
 
 # Add an error handler for internal server errors
 @app.exception_handler(500)
@@ -0,0 +1,180 @@
+# Maintenance jobs for the task management database. Run them from the same directory as main.py so they pick up
+# the same credentials, for example:
+#     python maintenance.py recount-tasks            recount the task counters on every board
+#     python maintenance.py recount-tasks BOARD_ID   recount the task counters on one board
+#     python maintenance.py backfill-email-index     add every existing user to the email index
+#     python maintenance.py backfill-title-index     reserve the title of every existing task
+#     python maintenance.py backfill-unassigned      set every task's unassigned flag from its assignment
+#     python maintenance.py finish-board-deletions   finish board deletions that were interrupted
+#     python maintenance.py migrate-due-dates        store every task's due date as a timestamp
+import argparse
+import asyncio
+
+from google.api_core import exceptions as google_exceptions
+
+from main import (firestore_db, recount_board_tasks, commit_in_batches, email_index_ref, title_reservation_ref,
+                  normalize_title, delete_board_contents, parse_due_date)
+
+
+# Recount the active and completed task counters on the given boards, or on every board if none are given. Prints
+# each board whose counters had drifted from the real numbers
+async def recount_tasks(board_ids):
+    if board_ids:
+        boards = [await firestore_db.collection('boards').document(board_id).get() for board_id in board_ids]
+    else:
+        boards = [board async for board in firestore_db.collection('boards').select(['active_tasks', 'completed_tasks']).stream()]
+
+    repaired = 0
+    for board in boards:
+        if not board.exists:
+            print(f"Board {board.id} does not exist")
+            continue
+
+        board_data = board.to_dict()
+        try:
+            counters = await recount_board_tasks(board.id)
+        except google_exceptions.Aborted as error:
+            print(f"Board {board.id}: {error}")
+            continue
+        if counters is None:
+            print(f"Board {board.id} does not exist")
+            continue
+        if board_data.get('active_tasks') != counters['active_tasks'] or board_data.get('completed_tasks') != counters['completed_tasks']:
+            repaired += 1
+            print(f"Board {board.id}: active {board_data.get('active_tasks')} -> {counters['active_tasks']}, "
+                  f"completed {board_data.get('completed_tasks')} -> {counters['completed_tasks']}")
+
+    print(f"Recounted {len(boards)} boards, repaired {repaired}")
+
+
+# Write an email index entry for every user. Users created before the index existed can't be added to boards until
+# this has run. The entries are written with batched commits
+async def backfill_email_index():
+    users = firestore_db.collection('users').select(['email']).stream()
+    written = await commit_in_batches(
+        ('set', email_index_ref(user.to_dict()['email']), {'user_id': user.id})
+        async for user in users
+        if user.to_dict().get('email')
+    )
+    print(f"Wrote {written} email index entries")
+
+
+# Write a title reservation for every task. Tasks created before reservations existed don't stop a duplicate being
+# added until this has run. If a board already has two tasks with the same title the oldest one keeps the reservation
+async def backfill_title_index():
+    seen = set()
+    duplicates = 0
+
+    async def reservations():
+        nonlocal duplicates
+        tasks = firestore_db.collection('tasks').select(['board_id', 'title']).order_by('created_at').stream()
+        async for task in tasks:
+            task_data = task.to_dict()
+            key = (task_data['board_id'], normalize_title(task_data['title']))
+            if key in seen:
+                duplicates += 1
+                print(f"Task {task.id} has the same title as an older task on board {task_data['board_id']}")
+                continue
+            seen.add(key)
+            yield ('set', title_reservation_ref(task_data['board_id'], task_data['title']), {
+                'board_id': task_data['board_id'],
+                'title': task_data['title'],
+                'task_id': task.id
+            })
+
+    written = await commit_in_batches(reservations())
+    print(f"Wrote {written} title reservations, found {duplicates} duplicate titles")
+
+
+# Set the unassigned flag of every task to match its assignment: a task is unassigned when nobody is assigned to it or
+# the assignee is no longer a member of the board. Tasks that were unassigned before the flag followed the assignment
+# are missing from the unassigned filter on the board page until this has run
+async def backfill_unassigned():
+    members = {}
+
+    async def updates():
+        tasks = firestore_db.collection('tasks').select(['board_id', 'assigned_to', 'unassigned']).stream()
+        async for task in tasks:
+            task_data = task.to_dict()
+            board_id = task_data['board_id']
+            if board_id not in members:
+                board = await firestore_db.collection('boards').document(board_id).get()
+                members[board_id] = set(board.to_dict()['members']) if board.exists else None
+            if members[board_id] is None:
+                continue
+            assigned_to = task_data.get('assigned_to')
+            unassigned = not assigned_to or assigned_to not in members[board_id]
+            if task_data.get('unassigned') != unassigned:
+                yield ('update', task.reference, {'unassigned': unassigned})
+
+    written = await commit_in_batches(updates())
+    print(f"Updated the unassigned flag of {written} tasks")
+
+
+# Finish every board deletion job that didn't complete, because it failed or the server running it was stopped.
+# Don't run this while the server that started a job could still be working on it
+async def finish_board_deletions():
+    jobs = firestore_db.collection('jobs').where('type', '==', 'delete_board') \
+        .where('state', 'in', ['running', 'failed']).stream()
+    finished = 0
+    async for job in jobs:
+        await delete_board_contents(job.reference)
+        job_data = (await job.reference.get()).to_dict()
+        print(f"Board {job_data['board_id']}: {job_data['state']}, removed {job_data.get('members_removed', 0)} "
+              f"members, deleted {job_data['tasks_deleted']} tasks and {job_data['titles_deleted']} title reservations")
+        finished += 1
+    print(f"Finished {finished} board deletions")
+
+
+# Turn the due date of every task that still holds the string from the form into a timestamp, so the task shows up in
+# the due date views. Tasks whose due date can't be read as a date are printed and left alone
+async def migrate_due_dates():
+    unreadable = 0
+
+    async def updates():
+        nonlocal unreadable
+        async for task in firestore_db.collection('tasks').select(['due_date']).stream():
+            due_date = task.to_dict().get('due_date')
+            if not isinstance(due_date, str):
+                continue
+            parsed = parse_due_date(due_date)
+            if parsed is None:
+                unreadable += 1
+                print(f"Task {task.id} has a due date that isn't a date: {due_date!r}")
+                continue
+            yield ('update', task.reference, {'due_date': parsed})
+
+    written = await commit_in_batches(updates())
+    print(f"Migrated {written} due dates, {unreadable} could not be read")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance jobs for the task management database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recount_parser = commands.add_parser("recount-tasks", help="recount the task counters stored on boards")
+    recount_parser.add_argument("board_ids", nargs="*", help="boards to recount, all boards if none are given")
+
+    commands.add_parser("backfill-email-index", help="add every existing user to the email index")
+    commands.add_parser("backfill-title-index", help="reserve the title of every existing task")
+    commands.add_parser("backfill-unassigned", help="set every task's unassigned flag from its assignment")
+    commands.add_parser("finish-board-deletions", help="finish board deletions that were interrupted")
+    commands.add_parser("migrate-due-dates", help="store every task's due date as a timestamp")
+
+    args = parser.parse_args()
+    if args.command == "recount-tasks":
+        asyncio.run(recount_tasks(args.board_ids))
+    elif args.command == "backfill-email-index":
+        asyncio.run(backfill_email_index())
+    elif args.command == "backfill-title-index":
+        asyncio.run(backfill_title_index())
+    elif args.command == "backfill-unassigned":
+        asyncio.run(backfill_unassigned())
+    elif args.command == "finish-board-deletions":
+        asyncio.run(finish_board_deletions())
+    elif args.command == "migrate-due-dates":
+        asyncio.run(migrate_due_dates())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,756 @@
+import asyncio
+import copy
+import datetime
+import functools
+import heapq
+import threading
+import time
+import uuid
+
+from google.api_core import exceptions
+from google.cloud import firestore
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+# Used for a field that isn't on a document, so it can be told apart from a field set to None
+_MISSING = object()
+
+# Filters that only match values of the same type as the one they compare against
+_RANGE_OPERATORS = ('<', '<=', '>', '>=')
+
+
+# An in-memory stand-in for the firestore AsyncClient. It covers the part of the client main.py uses: documents,
+# collections and queries (where, order_by, start_after, limit, select, count), get_all, batches, transactions,
+# write preconditions, the Increment, ArrayUnion and ArrayRemove transforms and on_snapshot listeners. Queries are
+# answered from an index of every top level field so an equality or array_contains filter doesn't scan the whole
+# collection. Nothing is saved, everything is gone when the process stops.
+#
+# This lets the app run with no google credentials or emulator, for trying it out offline and as the reference for
+# the route benchmarks. `reads` and `writes` count documents the same way firestore bills them.
+class MemoryClient:
+    def __init__(self):
+        self._tables = {}
+        self._lock = threading.RLock()
+        self._last_time = datetime.datetime.now(datetime.timezone.utc)
+        self._watches = []
+        self.reads = 0
+        self.writes = 0
+        # If set, called as observer(operation, seconds) for every operation that would be a round trip to firestore,
+        # named after the firestore RPC, so the metrics look the same with either backend
+        self.observer = None
+        # If set, every operation that would be a round trip to firestore waits for a slot of this Limiter (see
+        # admission.py) and then sleeps for `latency` seconds, so benchmarks can see how the app behaves when the
+        # database is slow or busy
+        self.limiter = None
+        self.latency = 0.0
+
+    def collection(self, collection_id):
+        return MemoryCollection(self, collection_id)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def transaction(self, max_attempts=5, **kwargs):
+        return MemoryTransaction(self, max_attempts)
+
+    @staticmethod
+    def write_option(last_update_time=None, exists=None):
+        return _Precondition(last_update_time, exists)
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        await self._round_trip()
+        start = time.perf_counter()
+        snapshots = [reference._read(field_paths, transaction) for reference in references]
+        self._observe('batch_get_documents', start)
+        for snapshot in snapshots:
+            yield snapshot
+
+    # Forget every document. Listeners are kept
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+    def stats(self):
+        return {'reads': self.reads, 'writes': self.writes}
+
+    async def _round_trip(self):
+        if self.limiter is None:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return
+        async with self.limiter:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+
+    def _observe(self, operation, start):
+        if self.observer is not None:
+            self.observer(operation, time.perf_counter() - start)
+
+    def _table(self, collection_id):
+        table = self._tables.get(collection_id)
+        if table is None:
+            table = self._tables[collection_id] = _Table()
+        return table
+
+    # Every write gets a later update time than the one before, even if the clock hasn't moved
+    def _next_time(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if now <= self._last_time:
+            now = self._last_time + datetime.timedelta(microseconds=1)
+        self._last_time = now
+        return now
+
+    # Check the preconditions of a list of writes and then apply all of them, or none of them if a check fails
+    def _commit(self, writes, reads=None):
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                for reference, update_time in (reads or {}).items():
+                    document = self._table(reference._collection_id).documents.get(reference.id)
+                    if (document.update_time if document else None) != update_time:
+                        raise exceptions.Aborted(f"{reference.path} changed during the transaction")
+                for write in writes:
+                    write.check(self._table(write.reference._collection_id).documents.get(write.reference.id))
+
+                commit_time = self._next_time()
+                changed = set()
+                for write in writes:
+                    table = self._table(write.reference._collection_id)
+                    write.apply(table, commit_time)
+                    changed.add(write.reference._collection_id)
+                self.writes += len(writes)
+                watches = [watch for watch in self._watches if watch.collection_id in changed]
+        finally:
+            self._observe('commit', start)
+
+        for watch in watches:
+            watch.refresh(commit_time)
+        return [_WriteResult(commit_time) for _ in writes]
+
+    def _listen(self, watch):
+        with self._lock:
+            self._watches.append(watch)
+        watch.refresh(self._last_time)
+        return watch
+
+    def _stop_listening(self, watch):
+        with self._lock:
+            if watch in self._watches:
+                self._watches.remove(watch)
+
+
+# A collection's documents and the indexes over their fields
+class _Table:
+    def __init__(self):
+        self.documents = {}
+        # field -> value key -> document ids, for equality and in filters
+        self.values = {}
+        # field -> value key -> document ids, for array_contains filters
+        self.elements = {}
+
+    def put(self, document_id, stored):
+        self.remove(document_id)
+        self.documents[document_id] = stored
+        for field, value in stored.data.items():
+            key = _index_key(value)
+            if key is not None:
+                self.values.setdefault(field, {}).setdefault(key, set()).add(document_id)
+            if isinstance(value, list):
+                for element in value:
+                    key = _index_key(element)
+                    if key is not None:
+                        self.elements.setdefault(field, {}).setdefault(key, set()).add(document_id)
+
+    def remove(self, document_id):
+        stored = self.documents.pop(document_id, None)
+        if stored is None:
+            return
+        for field, value in stored.data.items():
+            key = _index_key(value)
+            if key is not None:
+                self.values[field][key].discard(document_id)
+            if isinstance(value, list):
+                for element in value:
+                    key = _index_key(element)
+                    if key is not None:
+                        self.elements[field][key].discard(document_id)
+
+    # The ids of the documents that could match a query, narrowed down with the index of every filter that has one,
+    # and the filters the index couldn't answer that still have to be checked against each document
+    def candidates(self, filters):
+        matches = []
+        remaining = []
+        for field, operator, value in filters:
+            if operator == '==' and _index_key(value) is not None:
+                matches.append(self.values.get(field, {}).get(_index_key(value), set()))
+            elif operator == 'array_contains' and _index_key(value) is not None:
+                matches.append(self.elements.get(field, {}).get(_index_key(value), set()))
+            elif operator == 'in' and all(_index_key(item) is not None for item in value):
+                index = self.values.get(field, {})
+                matches.append(set().union(*[index.get(_index_key(item), ()) for item in value]))
+            else:
+                remaining.append((field, operator, value))
+        if not matches:
+            return set(self.documents), remaining
+        matches.sort(key=len)
+        return matches[0].intersection(*matches[1:]), remaining
+
+
+class _StoredDocument:
+    def __init__(self, data, create_time, update_time):
+        self.data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.row_keys = {}
+
+    # The key this document sorts on in a query with the given orders. A stored document is replaced rather than
+    # changed, so the key for each order is only worked out once
+    def sort_keys(self, orders, document_id):
+        try:
+            return self.row_keys[orders]
+        except KeyError:
+            keys = self.row_keys[orders] = _row_keys(orders, document_id, self.data)
+            return keys
+
+
+class _Precondition:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+    def check(self, reference, stored):
+        if self.exists is not None and self.exists != (stored is not None):
+            raise exceptions.FailedPrecondition(f"{reference.path} exists is not {self.exists}")
+        if self.last_update_time is not None and (stored is None or stored.update_time != self.last_update_time):
+            raise exceptions.FailedPrecondition(f"{reference.path} has been changed since it was read")
+
+
+class _WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class MemorySnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, read_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = read_time
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class MemoryDocument:
+    def __init__(self, client, collection_id, document_id=None):
+        self._client = client
+        self._collection_id = collection_id
+        self.id = document_id or uuid.uuid4().hex[:20]
+
+    @property
+    def path(self):
+        return f"{self._collection_id}/{self.id}"
+
+    @property
+    def parent(self):
+        return MemoryCollection(self._client, self._collection_id)
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryDocument) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    async def get(self, field_paths=None, transaction=None):
+        await self._client._round_trip()
+        start = time.perf_counter()
+        snapshot = self._read(field_paths, transaction)
+        self._client._observe('batch_get_documents', start)
+        return snapshot
+
+    async def set(self, document_data, merge=False):
+        await self._client._round_trip()
+        return self._client._commit([_Write('set', self, document_data, merge=merge)])[0]
+
+    async def create(self, document_data):
+        await self._client._round_trip()
+        return self._client._commit([_Write('create', self, document_data)])[0]
+
+    async def update(self, field_updates, option=None):
+        await self._client._round_trip()
+        return self._client._commit([_Write('update', self, field_updates, option=option)])[0]
+
+    async def delete(self, option=None):
+        await self._client._round_trip()
+        return self._client._commit([_Write('delete', self, None, option=option)])[0].update_time
+
+    def on_snapshot(self, callback):
+        return self._client._listen(_Watch(self._client, self._collection_id, callback, document=self))
+
+    def _read(self, field_paths=None, transaction=None):
+        client = self._client
+        with client._lock:
+            stored = client._table(self._collection_id).documents.get(self.id)
+            client.reads += 1
+            if transaction is not None:
+                transaction._record_read(self, stored)
+            return _snapshot(self, stored, field_paths, client._last_time)
+
+
+class MemoryQuery:
+    def __init__(self, client, collection_id, filters=(), orders=(), limit=None, start_after=None, fields=None):
+        self._client = client
+        self._collection_id = collection_id
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        settings = {
+            'filters': self._filters, 'orders': self._orders, 'limit': self._limit,
+            'start_after': self._start_after, 'fields': self._fields
+        }
+        settings.update(changes)
+        return MemoryQuery(self._client, self._collection_id, **settings)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, _normalize(value)),))
+
+    def order_by(self, field_path, direction=firestore.Query.ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def count(self, alias=None):
+        return _MemoryCount(self, alias)
+
+    async def get(self, transaction=None):
+        await self._client._round_trip()
+        start = time.perf_counter()
+        snapshots = self._run(transaction)
+        self._client._observe('run_query', start)
+        return snapshots
+
+    async def stream(self, transaction=None):
+        for snapshot in await self.get(transaction):
+            yield snapshot
+
+    def on_snapshot(self, callback):
+        return self._client._listen(_Watch(self._client, self._collection_id, callback, query=self))
+
+    # The fields the results are sorted on. A range filter sorts on its field first, the same as firestore does, and
+    # the document id always comes last
+    def _sort_fields(self):
+        orders = list(self._orders)
+        for field, operator, _ in self._filters:
+            if operator in _RANGE_OPERATORS and field not in [order[0] for order in orders]:
+                orders.insert(0, (field, firestore.Query.ASCENDING))
+                break
+        if '__name__' not in [order[0] for order in orders]:
+            orders.append(('__name__', orders[-1][1] if orders else firestore.Query.ASCENDING))
+        return orders
+
+    def _matching(self):
+        table = self._client._table(self._collection_id)
+        orders = tuple(self._sort_fields())
+        candidates, remaining = table.candidates(self._filters)
+        rows = []
+        for document_id in candidates:
+            stored = table.documents[document_id]
+            if remaining and not all(_matches(_get_field(stored.data, field), operator, value)
+                                     for field, operator, value in remaining):
+                continue
+            keys = stored.sort_keys(orders, document_id)
+            # firestore leaves out documents that don't have a field the query is ordered by
+            if keys is None:
+                continue
+            rows.append((keys, document_id, stored))
+
+        if self._start_after is not None:
+            cursor = self._cursor_keys(orders)
+            rows = [row for row in rows if row[0] > cursor]
+        # the keys end with the document id so no two are equal and the rows never compare past them
+        if self._limit is not None:
+            return heapq.nsmallest(self._limit, rows)
+        return sorted(rows)
+
+    def _cursor_keys(self, orders):
+        cursor = self._start_after
+        if isinstance(cursor, MemorySnapshot):
+            data, document_id = cursor._data or {}, cursor.id
+        else:
+            data, document_id = cursor, cursor.get('__name__')
+        return _row_keys(orders, document_id, data)
+
+    def _run(self, transaction=None):
+        client = self._client
+        with client._lock:
+            rows = self._matching()
+            client.reads += max(len(rows), 1)
+            snapshots = []
+            for _, document_id, stored in rows:
+                reference = MemoryDocument(client, self._collection_id, document_id)
+                if transaction is not None:
+                    transaction._record_read(reference, stored)
+                snapshots.append(_snapshot(reference, stored, self._fields, client._last_time))
+            return snapshots
+
+
+class MemoryCollection(MemoryQuery):
+    def __init__(self, client, collection_id):
+        super().__init__(client, collection_id)
+        self.id = collection_id
+
+    def document(self, document_id=None):
+        return MemoryDocument(self._client, self._collection_id, document_id)
+
+    async def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        result = await reference.create(document_data)
+        return result.update_time, reference
+
+
+class _MemoryCount:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias or 'field_1'
+
+    async def get(self, transaction=None):
+        client = self._query._client
+        await client._round_trip()
+        start = time.perf_counter()
+        with client._lock:
+            total = len(self._query._matching())
+            # firestore charges one read per batch of up to 1000 index entries counted
+            client.reads += total // 1000 + 1
+        client._observe('run_aggregation_query', start)
+        return [[AggregationResult(alias=self._alias, value=total, read_time=client._last_time)]]
+
+
+# One write waiting in a batch or transaction
+class _Write:
+    def __init__(self, operation, reference, data, merge=False, option=None):
+        self.operation = operation
+        self.reference = reference
+        self.data = data
+        self.merge = merge
+        self.option = option
+
+    def check(self, stored):
+        if self.operation == 'create' and stored is not None:
+            raise exceptions.AlreadyExists(f"{self.reference.path} already exists")
+        if self.operation == 'update' and stored is None:
+            raise exceptions.NotFound(f"{self.reference.path} does not exist")
+        if self.option is not None:
+            self.option.check(self.reference, stored)
+
+    def apply(self, table, commit_time):
+        document_id = self.reference.id
+        stored = table.documents.get(document_id)
+        if self.operation == 'delete':
+            table.remove(document_id)
+            return
+
+        if self.operation == 'update' or (self.operation == 'set' and self.merge and stored is not None):
+            data = copy.deepcopy(stored.data) if stored is not None else {}
+        else:
+            data = {}
+        for field, value in self.data.items():
+            if self.operation == 'update':
+                _set_field(data, field.split('.'), value, commit_time)
+            else:
+                _set_field(data, [field], value, commit_time)
+
+        create_time = stored.create_time if stored is not None else commit_time
+        table.put(document_id, _StoredDocument(data, create_time, commit_time))
+
+
+class MemoryWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(_Write('set', reference, document_data, merge=merge))
+
+    def create(self, reference, document_data):
+        self._writes.append(_Write('create', reference, document_data))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(_Write('update', reference, field_updates, option=option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(_Write('delete', reference, None, option=option))
+
+    async def commit(self):
+        writes, self._writes = self._writes, []
+        await self._client._round_trip()
+        return self._client._commit(writes)
+
+
+# Reads inside a transaction remember the version of each document they saw. The commit fails with Aborted if any of
+# them has changed since, and run_transaction starts the function again, which is how firestore transactions behave
+class MemoryTransaction(MemoryWriteBatch):
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._reads = {}
+
+    def _record_read(self, reference, stored):
+        self._reads.setdefault(reference, stored.update_time if stored is not None else None)
+
+    async def run_transaction(self, function, *args, **kwargs):
+        for attempt in range(self._max_attempts):
+            self._writes = []
+            self._reads = {}
+            result = await function(self, *args, **kwargs)
+            writes, self._writes = self._writes, []
+            await self._client._round_trip()
+            try:
+                self._client._commit(writes, self._reads)
+                return result
+            except exceptions.Aborted:
+                if attempt == self._max_attempts - 1:
+                    raise
+
+
+# Decorator used in place of firestore.async_transactional so a transactional function works with either backend
+def transactional(function):
+    firestore_function = firestore.async_transactional(function)
+
+    @functools.wraps(function)
+    async def run(transaction, *args, **kwargs):
+        if isinstance(transaction, MemoryTransaction):
+            return await transaction.run_transaction(function, *args, **kwargs)
+        return await firestore_function(transaction, *args, **kwargs)
+    return run
+
+
+# A listener on a document or a query. Every commit that touches the collection re-runs it and calls the callback
+# with what changed, in the same (snapshots, changes, read_time) form as the firestore listeners
+class _Watch:
+    def __init__(self, client, collection_id, callback, document=None, query=None):
+        self._client = client
+        self.collection_id = collection_id
+        self._callback = callback
+        self._document = document
+        self._query = query
+        self._last = None
+
+    def unsubscribe(self):
+        self._client._stop_listening(self)
+
+    def refresh(self, read_time):
+        with self._client._lock:
+            if self._document is not None:
+                stored = self._client._table(self.collection_id).documents.get(self._document.id)
+                rows = [(self._document.id, stored)]
+            else:
+                rows = [(document_id, stored) for _, document_id, stored in self._query._matching()]
+            versions = {document_id: stored.update_time if stored else None for document_id, stored in rows}
+            if versions == self._last:
+                return
+            previous, self._last = self._last, versions
+            snapshots = [
+                _snapshot(MemoryDocument(self._client, self.collection_id, document_id), stored, None, read_time)
+                for document_id, stored in rows
+            ]
+
+        if self._document is not None:
+            changes = []
+        else:
+            changes = _changes(previous or {}, versions, snapshots, self._client, self.collection_id, read_time)
+        self._callback(snapshots, changes, read_time)
+
+
+def _changes(previous, versions, snapshots, client, collection_id, read_time):
+    changes = []
+    old_order = list(previous)
+    for new_index, snapshot in enumerate(snapshots):
+        if snapshot.id not in previous:
+            changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, new_index))
+        elif previous[snapshot.id] != versions[snapshot.id]:
+            changes.append(DocumentChange(ChangeType.MODIFIED, snapshot, old_order.index(snapshot.id), new_index))
+    for old_index, document_id in enumerate(old_order):
+        if document_id not in versions:
+            removed = _snapshot(MemoryDocument(client, collection_id, document_id), None, None, read_time)
+            changes.append(DocumentChange(ChangeType.REMOVED, removed, old_index, -1))
+    return changes
+
+
+def _snapshot(reference, stored, field_paths, read_time):
+    if stored is None:
+        return MemorySnapshot(reference, None, read_time=read_time)
+    data = stored.data
+    if field_paths is not None:
+        data = {field: data[field] for field in field_paths if field in data}
+    return MemorySnapshot(reference, copy.deepcopy(data), stored.create_time, stored.update_time, read_time)
+
+
+def _get_field(data, field_path):
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+# Set a field, applying it if it is one of the transforms firestore supports
+def _set_field(data, parts, value, commit_time):
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    field = parts[-1]
+    current = data.get(field, _MISSING)
+
+    if value is transforms.DELETE_FIELD:
+        data.pop(field, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        data[field] = commit_time
+    elif isinstance(value, transforms.Increment):
+        data[field] = (current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0) \
+            + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        items = list(current) if isinstance(current, list) else []
+        for item in _normalize(list(value.values)):
+            if item not in items:
+                items.append(item)
+        data[field] = items
+    elif isinstance(value, transforms.ArrayRemove):
+        removed = _normalize(list(value.values))
+        data[field] = [item for item in current if item not in removed] if isinstance(current, list) else []
+    else:
+        data[field] = _normalize(value)
+
+
+# Copy a value the way firestore would store it. Datetimes without a timezone are taken to be UTC, the same as the
+# firestore client does
+def _normalize(value):
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, datetime.datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return copy.deepcopy(value)
+
+
+# Values of different types sort in the same order as in firestore: null, booleans, numbers, timestamps, strings,
+# bytes, references, arrays and then maps
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime.datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, MemoryDocument):
+        return 6
+    if isinstance(value, list):
+        return 8
+    if isinstance(value, dict):
+        return 9
+    return 7
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 0:
+        return (rank, 0)
+    if rank == 6:
+        return (rank, value.path)
+    if rank == 8:
+        return (rank, [_sort_key(item) for item in value])
+    if rank == 9:
+        return (rank, sorted((key, _sort_key(item)) for key, item in value.items()))
+    return (rank, value)
+
+
+# The key a value is indexed under, or None for values that aren't indexed (arrays and maps)
+def _index_key(value):
+    if isinstance(value, (list, dict)):
+        return None
+    return _sort_key(value)
+
+
+# The key a query result is sorted on, a tuple with one entry per order. None if the document doesn't have one of the
+# fields
+def _row_keys(orders, document_id, data):
+    keys = []
+    for field, direction in orders:
+        value = document_id if field == '__name__' else _get_field(data, field)
+        if value is _MISSING:
+            return None
+        key = _sort_key(value)
+        keys.append(_Descending(key) if direction == firestore.Query.DESCENDING else key)
+    return tuple(keys)
+
+
+# Wraps a sort key so it sorts in the opposite order
+class _Descending:
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __gt__(self, other):
+        return other.key > self.key
+
+
+def _matches(value, operator, target):
+    if value is _MISSING:
+        return False
+    if operator == '==':
+        return _sort_key(value) == _sort_key(target)
+    if operator == '!=':
+        return value is not None and _sort_key(value) != _sort_key(target)
+    if operator in _RANGE_OPERATORS:
+        if _type_rank(value) != _type_rank(target):
+            return False
+        key, target_key = _sort_key(value), _sort_key(target)
+        return {'<': key < target_key, '<=': key <= target_key, '>': key > target_key, '>=': key >= target_key}[operator]
+    if operator == 'in':
+        return any(_sort_key(value) == _sort_key(item) for item in target)
+    if operator == 'not-in':
+        return value is not None and all(_sort_key(value) != _sort_key(item) for item in target)
+    if operator == 'array_contains':
+        return isinstance(value, list) and any(_sort_key(item) == _sort_key(target) for item in value)
+    if operator == 'array_contains_any':
+        return isinstance(value, list) and any(_sort_key(item) == _sort_key(other) for item in value for other in target)
+    raise ValueError(f"Unsupported operator {operator}")
@@ -0,0 +1,259 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from a cached token check up to a very slow page
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The firestore API methods that each cost one round trip to the server. The ones that stream their results back are
+# timed until the stream has been read to the end
+FIRESTORE_OPERATIONS = [
+    'get_document', 'list_documents', 'update_document', 'delete_document', 'batch_get_documents',
+    'begin_transaction', 'commit', 'rollback', 'run_query', 'run_aggregation_query', 'batch_write'
+]
+FIRESTORE_STREAMING_OPERATIONS = {'batch_get_documents', 'run_query', 'run_aggregation_query'}
+
+# The timings of the request being handled. The middleware sets a fresh RequestTimings for each request and anything
+# that runs for it, including tasks started with asyncio.gather, adds to the same one
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# A histogram with a fixed set of buckets, kept per combination of label values. Observing a value is a bisect and a
+# few additions under a lock so it is cheap enough to do on every request
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # one count per bucket, one for values above the last bucket, then the sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label_values: list(counts) for label_values, counts in self._series.items()}
+        for label_values, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _label_text(self.labels, label_values, [('le', _number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# A counter or gauge whose values are read when the metrics are rendered, for numbers another object already keeps
+# such as the board cache hit counts. `collect` returns a list of (label values, value)
+class Collected:
+    def __init__(self, name, documentation, metric_type, labels, collect):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.labels = tuple(labels)
+        self._collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for label_values, value in self._collect():
+            lines.append(f"{self.name}{_label_text(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+# A counter kept per combination of label values
+class Counter(Collected):
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, "counter", labels, self._values)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._counts[label_values] = self._counts.get(label_values, 0) + amount
+
+    def _values(self):
+        with self._lock:
+            return sorted(self._counts.items())
+
+
+# The metrics of the app. Every metric name gets the prefix, render() returns them all in the prometheus text format
+class Metrics:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._metrics = []
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(f"{self.prefix}_{name}", documentation, labels, buckets))
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(f"{self.prefix}_{name}", documentation, labels))
+
+    def collected(self, name, documentation, metric_type, labels, collect):
+        return self._add(Collected(f"{self.prefix}_{name}", documentation, metric_type, labels, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+# How long each part of one request took, for the Server-Timing header. The same phase can be added many times, for
+# example once per firestore operation, and the durations are summed. Operations that ran at the same time are each
+# counted in full, so a phase can add up to more than the request took
+class RequestTimings:
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        total, count = self.phases.get(phase, (0.0, 0))
+        self.phases[phase] = (total + seconds, count + 1)
+
+    def header(self, total):
+        entries = []
+        for phase, (seconds, count) in self.phases.items():
+            entries.append(f'{phase};dur={seconds * 1000:.1f};desc="{count}x"' if count > 1
+                           else f"{phase};dur={seconds * 1000:.1f}")
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# Record a duration in a histogram and in the timings of the current request, if there is one
+def record(histogram, phase, seconds, *label_values):
+    histogram.observe(seconds, *label_values)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+# Time the block inside a with statement and record it
+@contextmanager
+def timed(histogram, phase, *label_values):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(histogram, phase, time.perf_counter() - start, *label_values)
+
+
+# ASGI middleware that times every request into `histogram`, labelled with the method, the route's path template and
+# the status code. Requests that didn't match a route are labelled "unmatched" so random urls can't create new
+# series. With server_timing set, the Server-Timing header lists where the time went so it shows up in the browser's
+# developer tools
+class MetricsMiddleware:
+    def __init__(self, app, histogram, server_timing=False):
+        self.app = app
+        self.histogram = histogram
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        reset_token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if self.server_timing:
+                    header = timings.header(time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(reset_token)
+            self.histogram.observe(time.perf_counter() - start, scope["method"], route_label(scope), str(status[0]))
+
+
+# The path template of the route that handled a request. FastAPI puts the route in the scope once it has matched,
+# mounted apps such as the static files only leave the path they are mounted on
+def route_label(scope):
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    return scope.get("root_path") or "unmatched"
+
+
+# Wraps a stream returned by the firestore API so it is timed until it has been read to the end
+class _TimedStream:
+    def __init__(self, stream, on_done):
+        self._stream = stream
+        self._on_done = on_done
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for item in self._stream:
+                yield item
+        finally:
+            self._on_done()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+# Time every RPC the async firestore client makes and pass it to observe(operation, seconds). The generated API
+# client is what AsyncClient sends all of its requests through, so wrapping its methods catches every call wherever
+# it is made. This changes the class, so it affects every AsyncClient in the process and should only be done once
+def instrument_firestore(observe):
+    from google.cloud.firestore_v1.services.firestore.async_client import FirestoreAsyncClient
+
+    for operation in FIRESTORE_OPERATIONS:
+        setattr(FirestoreAsyncClient, operation, _timed_operation(operation, getattr(FirestoreAsyncClient, operation),
+                                                                  observe))
+
+
+def _timed_operation(operation, original, observe):
+    async def call(client, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = await original(client, *args, **kwargs)
+        except Exception:
+            observe(operation, time.perf_counter() - start)
+            raise
+        if operation in FIRESTORE_STREAMING_OPERATIONS:
+            return _TimedStream(result, lambda: observe(operation, time.perf_counter() - start))
+        observe(operation, time.perf_counter() - start)
+        return result
+    return call
@@ -0,0 +1,97 @@
+# Summarises the profiles the app writes to PROFILE_DIR (see RequestProfiler in profiling.py), one route at a time:
+#     python profile_summary.py profiles                      the functions that take the most time on each route
+#     python profile_summary.py profiles --route GET_board    only the routes whose file name contains GET_board
+#     python profile_summary.py profiles --flamegraph graphs  one collapsed stack file per route in graphs/
+#
+# Files from every worker are added together by route. The files written with --flamegraph can be given straight to
+# flamegraph.pl or opened in speedscope. pstats profiles record calls rather than stacks, so they are summarised as a
+# table only.
+import argparse
+import glob
+import io
+import os
+import pstats
+from collections import Counter, defaultdict
+
+
+# The route a profile file belongs to: the name without the process id or timestamp the profiler adds
+def route_of(path):
+    return os.path.basename(path).rsplit("-", 1)[0]
+
+
+def read_collapsed(paths):
+    stacks = Counter()
+    for path in paths:
+        with open(path) as collapsed:
+            for line in collapsed:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+    return stacks
+
+
+# Print the functions with the most samples for one route. Self counts the samples where the function was the one
+# running, total counts the samples where it was anywhere on the stack
+def summarise_collapsed(route, stacks, top):
+    samples = sum(stacks.values())
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+
+    print(f"{route}: {samples} samples")
+    print(f"  {'self':>7} {'total':>7}  function")
+    for frame, count in self_counts.most_common(top):
+        print(f"  {count / samples:>7.1%} {total_counts[frame] / samples:>7.1%}  {frame}")
+    print()
+
+
+def summarise_pstats(route, paths, top):
+    output = io.StringIO()
+    stats = pstats.Stats(*paths, stream=output)
+    stats.sort_stats("cumulative").print_stats(top)
+    print(f"{route}: {len(paths)} requests")
+    print(output.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise the request profiles written by the app")
+    parser.add_argument("directory", help="the PROFILE_DIR the app wrote its profiles to")
+    parser.add_argument("--route", help="only summarise routes whose file name contains this")
+    parser.add_argument("--top", type=int, default=25, help="functions to show per route")
+    parser.add_argument("--flamegraph", help="write the merged collapsed stacks of each route to this directory")
+    args = parser.parse_args()
+
+    collapsed = defaultdict(list)
+    for path in glob.glob(os.path.join(args.directory, "*.collapsed")):
+        collapsed[route_of(path)].append(path)
+    profiles = defaultdict(list)
+    for path in glob.glob(os.path.join(args.directory, "*.pstats")):
+        profiles[route_of(path)].append(path)
+
+    if args.flamegraph:
+        os.makedirs(args.flamegraph, exist_ok=True)
+
+    for route in sorted(collapsed):
+        if args.route and args.route not in route:
+            continue
+        stacks = read_collapsed(collapsed[route])
+        if not stacks:
+            continue
+        summarise_collapsed(route, stacks, args.top)
+        if args.flamegraph:
+            with open(os.path.join(args.flamegraph, f"{route}.collapsed"), "w") as output:
+                for stack, count in stacks.most_common():
+                    output.write(f"{stack} {count}\n")
+
+    for route in sorted(profiles):
+        if args.route and args.route not in route:
+            continue
+        summarise_pstats(route, profiles[route], args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import asyncio
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+
+from starlette.routing import compile_path
+
+from metrics import route_label
+
+# The most distinct stacks kept for one route. Stacks seen after that are counted under a single "(other)" entry so a
+# long profiling session can't use up memory
+MAX_STACKS_PER_ROUTE = 20000
+
+# Frames from these files are the event loop itself rather than the code it runs, stacks are cut where they start
+_LOOP_FILES = (os.path.dirname(asyncio.__file__),)
+
+
+# The profile of one request. Samples of its stacks are added by the sampler thread, or a cProfile.Profile records
+# every call in pstats mode
+class RequestProfile:
+    def __init__(self, mode, task):
+        self.mode = mode
+        self.task = task
+        self.finished = False
+        self.stacks = Counter()
+        self.profile = cProfile.Profile() if mode == 'pstats' else None
+
+
+# Profiles a share of the requests to find where the CPU time goes. It is off unless a mode is set, and then only the
+# requests picked by `rate` (a fraction), `route` (a path template such as /board/{board_id}) or the X-Profile header
+# are profiled. Everything can be changed while the app runs with configure().
+#
+# In 'collapsed' mode a thread samples the event loop's stack every `interval` seconds while a profiled request is in
+# flight, and the samples are added up per route into collapsed stacks (one "outer;inner;innermost count" line per
+# stack), the input flame graph tools take. A sample is only counted when the loop is running code for a profiled
+# request, including tasks the request started with asyncio.gather, so other requests on the same worker don't get
+# mixed in. Work sent to the thread pool isn't sampled.
+#
+# In 'pstats' mode each profiled request is run under cProfile and saved as a .pstats file. cProfile records every
+# call on the thread, so only one request is profiled at a time and the other requests the loop runs in between end
+# up in its profile too. It has much more overhead than sampling and is meant for a few requests at a time.
+class RequestProfiler:
+    def __init__(self, directory, mode='off', rate=0.0, route=None, header_token=None, interval=0.005):
+        self.directory = directory
+        self.header_token = header_token
+        self.interval = interval
+        self.mode = 'off'
+        self.rate = 0.0
+        self.route = None
+        self._route_regex = None
+        self._stacks = {}
+        self._task_profiles = weakref.WeakKeyDictionary()
+        self._active = {}
+        self._loop = None
+        self._loop_thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pstats_running = False
+        self.requests_profiled = 0
+        self.samples = 0
+        self.configure(mode, rate, route)
+
+    # Change what is profiled. Stacks collected so far are kept until dump() or reset()
+    def configure(self, mode=None, rate=None, route=None):
+        if mode is not None:
+            if mode not in ('off', 'collapsed', 'pstats'):
+                raise ValueError(f"Unknown profiling mode {mode}")
+            self.mode = mode
+        if rate is not None:
+            self.rate = min(max(float(rate), 0.0), 1.0)
+        if route is not None:
+            self.route = route or None
+            self._route_regex = compile_path(route)[0] if route else None
+
+    def settings(self):
+        return {
+            'mode': self.mode,
+            'rate': self.rate,
+            'route': self.route,
+            'interval': self.interval,
+            'requests_profiled': self.requests_profiled,
+            'samples': self.samples,
+            'routes': sorted(self._stacks)
+        }
+
+    # Decide whether to profile a request. The middleware checks the mode before calling this, so a request costs a
+    # single comparison when profiling is off. The header is compared in constant time, like PROFILING_TOKEN
+    def wants(self, scope):
+        if self.mode == 'pstats' and self._pstats_running:
+            return False
+        if self.header_token and hmac.compare_digest(dict(scope['headers']).get(b'x-profile', b''),
+                                                     self.header_token.encode()):
+            return True
+        if self._route_regex is not None and self._route_regex.match(scope['path']):
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+    def start(self, task):
+        profile = RequestProfile(self.mode, task)
+        if profile.mode == 'pstats':
+            self._pstats_running = True
+            profile.profile.enable()
+            return profile
+
+        self._install_task_factory(asyncio.get_running_loop())
+        with self._lock:
+            self._task_profiles[task] = profile
+            self._active[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return profile
+
+    def finish(self, profile, scope):
+        label = f"{scope['method']} {route_label(scope)}"
+        self.requests_profiled += 1
+        if profile.mode == 'pstats':
+            profile.profile.disable()
+            self._pstats_running = False
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"{_file_name(label)}-{time.time_ns()}.pstats"
+            profile.profile.dump_stats(os.path.join(self.directory, name))
+            return
+
+        with self._lock:
+            profile.finished = True
+            self._task_profiles.pop(profile.task, None)
+            self._active.pop(id(profile), None)
+            if not self._active:
+                self._wake.clear()
+            stacks = self._stacks.setdefault(label, Counter())
+            for stack, count in profile.stacks.items():
+                if stack not in stacks and len(stacks) >= MAX_STACKS_PER_ROUTE:
+                    stack = "(other)"
+                stacks[stack] += count
+
+    # Write the stacks collected for each route to a .collapsed file in the directory, replacing the file from the
+    # last dump, and return the paths written. The file names end with the process id so the workers of one server
+    # can share a directory, profile_summary.py adds their files together
+    def dump(self):
+        with self._lock:
+            stacks = {label: Counter(counts) for label, counts in self._stacks.items()}
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for label, counts in stacks.items():
+            path = os.path.join(self.directory, f"{_file_name(label)}-{os.getpid()}.collapsed")
+            with open(path, "w") as output:
+                for stack, count in counts.most_common():
+                    output.write(f"{stack} {count}\n")
+            paths.append(path)
+        return paths
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+        self.samples = 0
+
+    # Tasks started while a profiled request is running belong to that request. The factory is installed the first
+    # time a request is profiled and keeps using whatever factory the loop had before
+    def _install_task_factory(self, loop):
+        if self._loop is loop:
+            return
+        previous = loop.get_task_factory()
+        task_profiles = self._task_profiles
+
+        def task_factory(loop, coroutine, **kwargs):
+            task = previous(loop, coroutine, **kwargs) if previous else asyncio.Task(coroutine, loop=loop, **kwargs)
+            parent = asyncio.current_task(loop)
+            if parent is not None:
+                profile = task_profiles.get(parent)
+                if profile is not None:
+                    task_profiles[task] = profile
+            return task
+
+        loop.set_task_factory(task_factory)
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+
+    # Run by the sampler thread. It sleeps while no profiled request is in flight
+    def _sample_loop(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            task = asyncio.current_task(self._loop)
+            if task is None:
+                continue
+            profile = self._task_profiles.get(task)
+            frame = sys._current_frames().get(self._loop_thread)
+            if profile is None or frame is None:
+                continue
+            stack = _collapse(frame)
+            with self._lock:
+                if not profile.finished:
+                    profile.stacks[stack] += 1
+                    self.samples += 1
+
+
+# The stack of a frame as "outermost;...;innermost", leaving out the event loop's own frames
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(_LOOP_FILES):
+            break
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _file_name(label):
+    return re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'root'
+
+
+# ASGI middleware that hands the requests the profiler picks to it
+class ProfilingMiddleware:
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if self.profiler.mode == 'off' or scope["type"] != "http" or not self.profiler.wants(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(asyncio.current_task())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.finish(profile, scope)
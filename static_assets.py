@@ -0,0 +1,171 @@
+# Builds the static files the app serves. Run it as part of a deploy to build them ahead of time:
+#     python static_assets.py                  build static/ into build/static
+#     python static_assets.py static out       build static/ into out/
+# The app also builds them when it starts, so running this is only needed to hand the files to something else such as
+# a CDN. Files that are already up to date are left alone.
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from compression import COMPRESSIBLE_TYPES, accepted_encodings, brotli
+
+# A content hashed file gets a new name whenever it changes, so browsers can keep it for a year without asking again
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# A file under its own name can change with any deploy, so browsers check it every time they use it
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# The compressed versions written next to each file, in the order they are preferred when serving
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+# Copies the files under `source` into `output` twice, under their own name and under a name with a hash of their
+# content (styles.css and styles.3f2a9c1b7d4e.css), with .br and .gz compressed versions next to the text files. The
+# .br files need the brotli package. manifest.json maps each name to its hashed name and url() turns a name into the
+# url of the hashed file for the templates. Every file is written under a temporary name and moved into place, so
+# workers starting at the same time can build into the same directory. Hashed files from earlier builds are kept so
+# pages that still link to them keep working
+class StaticAssets:
+    def __init__(self, source, output, url_prefix="/static"):
+        self.source = source
+        self.output = output
+        self.url_prefix = url_prefix
+        self.manifest = {}
+        self.hashed_names = set()
+        self._version = None
+
+    def build(self):
+        manifest = {}
+        for directory, directories, names in os.walk(self.source):
+            directories[:] = sorted(name for name in directories if not name.startswith("."))
+            for name in sorted(names):
+                if name.startswith("."):
+                    continue
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, self.source).replace(os.sep, "/")
+                with open(path, "rb") as source_file:
+                    data = source_file.read()
+                stem, extension = os.path.splitext(relative)
+                hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+                for target in (relative, hashed):
+                    _write_with_variants(os.path.join(self.output, target), data)
+                manifest[relative] = hashed
+
+        _write_if_changed(os.path.join(self.output, "manifest.json"),
+                          json.dumps(manifest, indent=2, sort_keys=True).encode())
+        self.manifest = manifest
+        self.hashed_names = set(manifest.values())
+        self._version = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:16]
+        return manifest
+
+    # Build the files if this process hasn't yet. The app builds them when it starts, this covers anything that
+    # serves it without running its startup
+    def ensure_built(self):
+        if self._version is None:
+            self.build()
+
+    # A hash of the manifest, it changes whenever one of the files does
+    @property
+    def version(self):
+        self.ensure_built()
+        return self._version
+
+    # The url of the hashed copy of a file, or of the file itself if it isn't in the manifest
+    def url(self, path):
+        self.ensure_built()
+        return f"{self.url_prefix}/{self.manifest.get(path, path)}"
+
+
+def _compressible(path):
+    media_type = mimetypes.guess_type(path)[0]
+    return media_type in COMPRESSIBLE_TYPES
+
+
+# Write a file and its compressed versions. A compressed version that wouldn't be smaller, or can't be made without
+# brotli, is removed so a stale one from an earlier build is never served
+def _write_with_variants(path, data):
+    _write_if_changed(path, data)
+    variants = {}
+    if _compressible(path):
+        variants[".gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=11)
+    for _, suffix in PRECOMPRESSED:
+        compressed = variants.get(suffix)
+        if compressed is not None and len(compressed) < len(data):
+            _write_if_changed(path + suffix, compressed)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _write_if_changed(path, data):
+    if os.path.exists(path):
+        with open(path, "rb") as existing:
+            if existing.read() == data:
+                return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as output:
+        output.write(data)
+    os.replace(temporary, path)
+
+
+# Serves a directory built by StaticAssets. The .br or .gz version of a file is sent when the browser takes it, with
+# the Content-Type of the original. Hashed files are sent with IMMUTABLE_CACHE_CONTROL, anything else has to be
+# revalidated
+class PrecompressedStaticFiles(StaticFiles):
+    def __init__(self, *args, assets, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.assets = assets
+
+    async def get_response(self, path, scope):
+        self.assets.ensure_built()
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        relative = self.get_path(scope).replace(os.sep, "/")
+
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if relative in self.assets.hashed_names
+            else REVALIDATE_CACHE_CONTROL
+        }
+        send_path = full_path
+        if _compressible(full_path):
+            headers["Vary"] = "Accept-Encoding"
+            for encoding, suffix in PRECOMPRESSED:
+                if encoding in accepted and os.path.isfile(full_path + suffix):
+                    send_path = full_path + suffix
+                    stat_result = os.stat(send_path)
+                    headers["Content-Encoding"] = encoding
+                    break
+
+        response = FileResponse(send_path, status_code=status_code, headers=headers, stat_result=stat_result,
+                                media_type=mimetypes.guess_type(full_path)[0])
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the content hashed and precompressed static files")
+    parser.add_argument("source", nargs="?", default="static", help="the directory of static files")
+    parser.add_argument("output", nargs="?", default=os.path.join("build", "static"),
+                        help="the directory to build them into")
+    args = parser.parse_args()
+
+    manifest = StaticAssets(args.source, args.output).build()
+    for name, hashed in sorted(manifest.items()):
+        print(f"{name} -> {hashed}")
+
+
+if __name__ == "__main__":
+    main()
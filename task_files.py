@@ -0,0 +1,240 @@
+import codecs
+import csv
+import io
+import json
+from collections import deque
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# The formats tasks can be exported and imported in, with the content type each is sent with
+FILE_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+# The columns of an export, in order. An import only reads title, due_date and assigned_to, so an exported file can
+# be imported into another board as it is
+EXPORT_COLUMNS = ['id', 'title', 'due_date', 'assigned_to', 'completed', 'completion_date', 'created_by', 'created_at']
+
+# The columns an imported CSV file has to have
+REQUIRED_COLUMNS = ('title', 'due_date')
+
+# The longest row an import accepts, in characters. A longer one is reported as an error and skipped without being
+# held in memory
+MAX_ROW_LENGTH = 64 * 1024
+
+
+# The format of an uploaded file from the format asked for, the file's content type or its name, or None
+def upload_format(requested=None, content_type=None, filename=None):
+    if requested:
+        return requested if requested in FILE_FORMATS else None
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    for name, format_type in FILE_FORMATS.items():
+        if media_type == format_type.split(';')[0] or (filename or '').lower().endswith(f'.{name}'):
+            return name
+    if media_type in ('application/jsonl', 'application/x-jsonlines') or (filename or '').lower().endswith('.jsonl'):
+        return 'ndjson'
+    return None
+
+
+# Turn exported rows into the text of the file, a page at a time. The CSV header is only written with the first page
+def encode_rows(rows, file_format, header=False):
+    if file_format == 'ndjson':
+        return ''.join(json.dumps(row) + '\n' for row in rows)
+    output = io.StringIO()
+    writer = csv.DictWriter(output, EXPORT_COLUMNS)
+    if header:
+        writer.writeheader()
+    for row in rows:
+        writer.writerow({column: _csv_value(value) for column, value in row.items()})
+    return output.getvalue()
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+# Raised when a form upload isn't a well formed multipart body
+class UploadError(ValueError):
+    pass
+
+
+# Find the 'file' field of a multipart form body and read it as the body arrives, instead of waiting for starlette to
+# spool the whole upload first, so rows are imported while the rest of the file is still being sent. Returns the
+# field's content type, its filename and an async iterator of its bytes, or None for all three if the form has no file.
+# The other fields are skipped. Raises UploadError, straight away or while the file is read, if the body is malformed
+async def multipart_file(chunks, content_type):
+    _, options = parse_options_header(content_type)
+    if not options.get(b'boundary'):
+        raise UploadError("The form has no boundary")
+    events = deque()
+    part = {}
+
+    def on_part_begin():
+        part.update(headers={}, name=b'', value=b'', file=False)
+
+    def on_header_field(data, start, end):
+        part['name'] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part['value'] += data[start:end]
+
+    def on_header_end():
+        part['headers'][part['name'].lower()] = part['value']
+        part['name'] = part['value'] = b''
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part['headers'].get(b'content-disposition', b''))
+        part['file'] = disposition.get(b'name') == b'file' and b'filename' in disposition
+        if part['file']:
+            file_type = part['headers'].get(b'content-type', b'').decode('latin-1')
+            events.append(('file', file_type, disposition[b'filename'].decode('utf-8', errors='replace')))
+
+    def on_part_data(data, start, end):
+        if part['file']:
+            events.append(('data', data[start:end]))
+
+    def on_part_end():
+        if part['file']:
+            events.append(('end',))
+
+    parser = MultipartParser(options[b'boundary'], {
+        'on_part_begin': on_part_begin, 'on_header_field': on_header_field, 'on_header_value': on_header_value,
+        'on_header_end': on_header_end, 'on_headers_finished': on_headers_finished, 'on_part_data': on_part_data,
+        'on_part_end': on_part_end
+    })
+
+    async def parsed():
+        try:
+            async for chunk in chunks:
+                parser.write(chunk)
+                while events:
+                    yield events.popleft()
+            parser.finalize()
+        except MultipartParseError as err:
+            raise UploadError(str(err)) from err
+        while events:
+            yield events.popleft()
+
+    stream = parsed()
+    async for event in stream:
+        if event[0] == 'file':
+            break
+    else:
+        return None, None, None
+
+    async def file_chunks():
+        async for next_event in stream:
+            if next_event[0] != 'data':
+                return
+            yield next_event[1]
+
+    return event[1], event[2], file_chunks()
+
+
+# Split the chunks of an uploaded file into lines as they arrive, so a file of any size is read in constant memory.
+# Yields (line number, line), with the line set to None if it was longer than MAX_ROW_LENGTH. A byte order mark at
+# the start is dropped and bytes that aren't UTF-8 are replaced
+async def upload_lines(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    too_long = False
+    number = 0
+
+    def take(text):
+        nonlocal pending, too_long, number
+        start = 0
+        while True:
+            end = text.find('\n', start)
+            if end < 0:
+                break
+            line = None if too_long else (pending + text[start:end]).rstrip('\r')
+            if line is not None and len(line) > MAX_ROW_LENGTH:
+                line = None
+            pending, too_long = '', False
+            number += 1
+            yield number, line
+            start = end + 1
+        if not too_long:
+            pending += text[start:]
+            if len(pending) > MAX_ROW_LENGTH:
+                pending, too_long = '', True
+
+    async for chunk in chunks:
+        for line in take(decoder.decode(chunk)):
+            yield line
+    for line in take(decoder.decode(b'', final=True)):
+        yield line
+    if pending or too_long:
+        yield number + 1, (None if too_long else pending)
+
+
+# The rows of an NDJSON file. Yields (line number, fields, error) where fields is the row's object and error is None,
+# or fields is None and error says what is wrong with the line. Blank lines are skipped
+async def ndjson_rows(lines):
+    async for number, line in lines:
+        if line is None:
+            yield number, None, 'row_too_long'
+            continue
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            yield number, None, 'invalid_json'
+            continue
+        if not isinstance(fields, dict):
+            yield number, None, 'invalid_row'
+            continue
+        yield number, fields, None
+
+
+# The rows of a CSV file with a header row, in the same form as ndjson_rows. A quoted value can run over several
+# lines, the row number is the line it starts on. If the header is missing a required column that is reported on
+# line 1 as 'missing_columns' and nothing else is read
+async def csv_rows(lines):
+    columns = None
+    record = None
+    first = 0
+    async for number, line in lines:
+        if line is None:
+            yield (first if record is not None else number), None, 'row_too_long'
+            record = None
+            continue
+        if record is None:
+            if not line.strip():
+                continue
+            record, first = line, number
+        else:
+            record += '\n' + line
+        # a record is complete once its quotes are balanced, until then the line break is part of a value
+        if record.count('"') % 2:
+            if len(record) > MAX_ROW_LENGTH:
+                yield first, None, 'row_too_long'
+                record = None
+            continue
+
+        try:
+            values = next(csv.reader([record]))
+        except csv.Error:
+            values = None
+        record = None
+        if columns is None:
+            columns = [column.strip().lower() for column in values or []]
+            if not all(column in columns for column in REQUIRED_COLUMNS):
+                yield first, None, 'missing_columns'
+                return
+            continue
+        if values is None or len(values) > len(columns):
+            yield first, None, 'invalid_row'
+            continue
+        yield first, dict(zip(columns, values)), None
+
+    if record is not None:
+        # the file ended inside a quoted value
+        yield first, None, 'invalid_row'
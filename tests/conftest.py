@@ -0,0 +1,125 @@
+# Shared setup for the tests. The app runs on the in-memory store (see memory_store.py) with a locally generated
+# signing key, so the tests need no google credentials, emulator or network access. main.py reads its settings when it
+# is imported, so the environment is set before anything imports it
+import asyncio
+import os
+import sys
+import tempfile
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+for name in ("FIRESTORE_EMULATOR_HOST", "GOOGLE_CLOUD_PROJECT", "GOOGLE_APPLICATION_CREDENTIALS"):
+    os.environ.pop(name, None)
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["STATIC_BUILD_DIR"] = os.path.join(tempfile.mkdtemp(), "static")
+
+from common import TokenSigner
+
+signer = TokenSigner(tempfile.mkdtemp())
+os.environ["FIREBASE_CERTS_FILE"] = signer.certs_file
+
+
+# The series served on /metrics, as {'name{labels}': value}. Checks that every line is a comment or a sample
+def scrape_metrics(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    series = {}
+    for line in response.text.splitlines():
+        if line.startswith('# '):
+            assert line.split()[1] in ('HELP', 'TYPE')
+            continue
+        name, _, value = line.rpartition(' ')
+        assert name and value
+        series[name] = float(value)
+    return series
+
+
+# The app module, with every document from earlier tests gone
+@pytest.fixture
+def app_module():
+    os.chdir(ROOT)
+    import main
+    main.firestore_db.clear()
+    main.board_cache.close()
+    main.board_cache._entries.clear()
+    return main
+
+
+# Returns a test client signed in as the given user
+@pytest.fixture
+def signed_in(app_module):
+    from starlette.testclient import TestClient
+
+    def client(user_id):
+        test_client = TestClient(app_module.app)
+        test_client.cookies.set("token", signer.token(user_id))
+        return test_client
+    return client
+
+
+# Returns a function that creates a board through the app with the given number of members, named member-0 and so
+# on, and returns the creator's client and the board id
+@pytest.fixture
+def make_board(app_module, signed_in):
+    def make(members=0, name='Board'):
+        creator = signed_in('creator')
+        creator.get('/')
+        creator.post('/create-board', data={'board_name': name}, follow_redirects=False)
+        user = asyncio.run(app_module.firestore_db.collection('users').document('creator').get())
+        board_id = user.get('created_boards')[-1]
+        for i in range(members):
+            signed_in(f'member-{i}').get('/')
+            creator.post('/add-user-to-board', data={'board_id': board_id, 'user_email': f'member-{i}@bench.local'},
+                         follow_redirects=False)
+        return creator, board_id
+    return make
+
+
+# What the app read from the in-memory store: the round trips it made, by the name of the firestore RPC each stands
+# for, and how many times each document was read, by its path
+class StoreReads:
+    def __init__(self):
+        self.rpcs = Counter()
+        self.documents = Counter()
+
+    def reset(self):
+        self.rpcs.clear()
+        self.documents.clear()
+
+
+@pytest.fixture
+def store_reads(app_module, monkeypatch):
+    import memory_store
+
+    reads = StoreReads()
+    client = app_module.firestore_db.get()
+    observer = client.observer
+
+    def observe(operation, seconds):
+        reads.rpcs[operation] += 1
+        if observer is not None:
+            observer(operation, seconds)
+
+    read_document = memory_store.MemoryDocument._read
+    run_query = memory_store.MemoryQuery._run
+
+    def counted_read(document, *args, **kwargs):
+        reads.documents[document.path] += 1
+        return read_document(document, *args, **kwargs)
+
+    def counted_query(query, *args, **kwargs):
+        snapshots = run_query(query, *args, **kwargs)
+        for snapshot in snapshots:
+            reads.documents[snapshot.reference.path] += 1
+        return snapshots
+
+    monkeypatch.setattr(client, "observer", observe)
+    monkeypatch.setattr(memory_store.MemoryDocument, "_read", counted_read)
+    monkeypatch.setattr(memory_store.MemoryQuery, "_run", counted_query)
+    return reads
@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+
+from admission import Limiter, Overloaded
+from conftest import scrape_metrics
+
+
+def test_callers_past_the_queue_size_are_turned_away():
+    async def scenario():
+        limiter = Limiter(1, queue_size=1)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert (limiter.active, limiter.waiting) == (1, 1)
+
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        assert shed.value.reason == 'queue_full'
+
+        limiter.release()
+        await waiting
+        assert (limiter.active, limiter.waiting, limiter.admitted) == (1, 0, 2)
+        limiter.release()
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.active == 0
+    assert limiter.shed == {'queue_full': 1, 'deadline': 0}
+
+
+def test_callers_are_turned_away_once_they_have_waited_the_timeout():
+    async def scenario():
+        limiter = Limiter(1, timeout=0.05)
+        await limiter.acquire()
+        start = time.perf_counter()
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        waited = time.perf_counter() - start
+        assert shed.value.reason == 'deadline'
+        assert (limiter.active, limiter.waiting) == (1, 0)
+
+        # the slot still goes to the next caller in line
+        limiter.release()
+        await limiter.acquire()
+        return limiter, waited
+
+    limiter, waited = asyncio.run(scenario())
+    assert waited >= 0.05
+    assert limiter.shed == {'queue_full': 0, 'deadline': 1}
+
+
+def test_callers_that_would_wait_past_the_timeout_are_turned_away_at_once():
+    async def scenario():
+        limiter = Limiter(2, timeout=1)
+        assert limiter.expected_wait() == 0.0
+        await limiter.acquire()
+        limiter.release(held=1.5)
+        assert limiter.service_time == 1.5
+
+        # the next caller waits for a slot held 1.5s with two slots free at a time
+        await limiter.acquire()
+        await limiter.acquire()
+        assert limiter.expected_wait() == 0.75
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.expected_wait() == 1.5
+
+        start = time.perf_counter()
+        with pytest.raises(Overloaded) as shed:
+            await limiter.acquire()
+        assert shed.value.reason == 'deadline'
+        assert time.perf_counter() - start < 0.5
+
+        limiter.release(held=0.5)
+        await waiting
+        assert limiter.service_time == pytest.approx(1.3)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.shed == {'queue_full': 0, 'deadline': 1}
+
+
+def test_shed_request_gets_a_503_with_retry_after(app_module, make_board, monkeypatch):
+    creator, board_id = make_board()
+    limiters = [Limiter(1, queue_size=0), Limiter(1, queue_size=0)]
+    monkeypatch.setitem(app_module.route_queues, '/board/{board_id}', limiters[0])
+    monkeypatch.setitem(app_module.route_queues, '/api/v1/boards/{board_id}/tasks', limiters[1])
+    shed_series = 'taskmanager_admission_shed_total{route="/board/{board_id}",reason="queue_full"}'
+    timed_series = 'taskmanager_request_duration_seconds_count{method="GET",route="/board/{board_id}",status="503"}'
+    before = scrape_metrics(creator)
+
+    assert creator.get(f'/board/{board_id}').status_code == 200
+    for limiter in limiters:
+        asyncio.run(limiter.acquire())
+    page = creator.get(f'/board/{board_id}')
+    api = creator.post(f'/api/v1/boards/{board_id}/tasks', json={'tasks': []})
+    for limiter in limiters:
+        limiter.release()
+
+    assert (page.status_code, page.headers['retry-after']) == (503, str(app_module.RETRY_AFTER_SECONDS))
+    assert 'The server is busy' in page.text
+    assert (api.status_code, api.headers['retry-after']) == (503, str(app_module.RETRY_AFTER_SECONDS))
+    assert api.json() == {'error': 'overloaded', 'reason': 'queue_full'}
+
+    after = scrape_metrics(creator)
+    assert after[shed_series] == before[shed_series] + 1
+    assert after['taskmanager_admission_shed_total{route="/api/v1/boards/{board_id}/tasks",reason="queue_full"}'] == 1
+    assert after['taskmanager_admission_in_flight{route="/board/{board_id}"}'] == 0
+    # the 503 is timed under the route it was meant for
+    assert after[timed_series] == before.get(timed_series, 0) + 1
+    assert creator.get(f'/board/{board_id}').status_code == 200
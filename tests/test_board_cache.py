@@ -0,0 +1,87 @@
+import asyncio
+
+from board_cache import BoardCache
+from memory_store import MemoryClient
+
+
+# A board cache over an in-memory store whose loads wait to return until the test lets them, so loads and writes can
+# be interleaved in any order
+class HeldLoads:
+    def __init__(self, listen=False):
+        self.db = MemoryClient()
+        self.releases = []
+        self.cache = BoardCache(self.load, subscribe=self.subscribe if listen else None, ttl=60)
+
+    async def load(self, board_id):
+        snapshot = await self.db.collection('boards').document(board_id).get()
+        release = asyncio.Event()
+        self.releases.append(release)
+        await release.wait()
+        return snapshot
+
+    def subscribe(self, board_id, on_change):
+        def on_snapshot(snapshots, changes, read_time):
+            on_change(board_id, snapshots[0] if snapshots else None)
+        return self.db.collection('boards').document(board_id).on_snapshot(on_snapshot).unsubscribe
+
+    async def write(self, members):
+        await self.db.collection('boards').document('board').set({'members': members})
+
+    # Start a get and wait until it has read the board, or has been answered from the cache
+    async def start_get(self):
+        started = len(self.releases)
+        task = asyncio.ensure_future(self.cache.get('board'))
+        while len(self.releases) == started and not task.done():
+            await asyncio.sleep(0)
+        return task
+
+    async def finish(self, task):
+        if not task.done():
+            self.releases[-1].set()
+        return await task
+
+
+def test_slow_load_does_not_replace_newer_copy():
+    async def scenario():
+        loads = HeldLoads()
+        await loads.write(['alice'])
+        slow = await loads.start_get()
+        await loads.write(['alice', 'bob'])
+        fast = await loads.start_get()
+        assert (await loads.finish(fast)).to_dict()['members'] == ['alice', 'bob']
+
+        loads.releases[0].set()
+        assert (await slow).to_dict()['members'] == ['alice', 'bob']
+        assert (await loads.cache.get('board')).to_dict()['members'] == ['alice', 'bob']
+    asyncio.run(scenario())
+
+
+def test_load_older_than_listener_update_is_not_cached():
+    async def scenario():
+        loads = HeldLoads(listen=True)
+        await loads.write(['alice'])
+        await loads.finish(await loads.start_get())
+        assert loads.cache.stats()['listeners'] == 1
+
+        # a load that read the board before a change, which the listener reported while the board wasn't cached
+        loads.cache.invalidate('board')
+        slow = await loads.start_get()
+        await loads.write(['alice', 'bob'])
+        assert (await loads.finish(slow)).to_dict()['members'] == ['alice']
+
+        again = await loads.start_get()
+        assert (await loads.finish(again)).to_dict()['members'] == ['alice', 'bob']
+        assert (await loads.cache.get('board')).to_dict()['members'] == ['alice', 'bob']
+        assert loads.cache.stats()['misses'] == 3
+    asyncio.run(scenario())
+
+
+def test_listener_keeps_cached_board_current():
+    async def scenario():
+        loads = HeldLoads(listen=True)
+        await loads.write(['alice'])
+        await loads.finish(await loads.start_get())
+        await loads.write(['alice', 'carol'])
+        assert (await loads.cache.get('board')).to_dict()['members'] == ['alice', 'carol']
+        assert loads.cache.stats()['misses'] == 1
+    asyncio.run(scenario())
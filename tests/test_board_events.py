@@ -0,0 +1,65 @@
+import asyncio
+
+
+def test_bulk_change_is_one_event(app_module, make_board):
+    creator, board_id = make_board(3)
+    events = []
+    unsubscribe = app_module.listen_to_board_events(board_id, events.append)
+    try:
+        response = creator.post(f'/api/v1/boards/{board_id}/tasks', json={'tasks': [
+            {'title': f'task {i}', 'due_date': '2030-01-01', 'assigned_to': f'member-{i % 3}'} for i in range(200)
+        ]})
+        assert response.status_code == 200
+    finally:
+        unsubscribe()
+
+    task_events = [event for event in events if event['type'] == 'tasks']
+    assert sum(len(event['changes']) for event in task_events) == 200
+    assert len(task_events) < 10
+
+
+def test_members_are_read_once_per_event(app_module, make_board):
+    creator, board_id = make_board(5)
+    creator.post(f'/api/v1/boards/{board_id}/tasks', json={'tasks': [
+        {'title': f'task {i}', 'due_date': '2030-01-01', 'assigned_to': 'member-1'} for i in range(50)
+    ]})
+    db = app_module.firestore_db
+    tasks = asyncio.run(db.collection('tasks').where('board_id', '==', board_id).get())
+    changes = [{'change': 'modified', 'task_id': task.id, 'task': task.to_dict()} for task in tasks]
+
+    async def reads_for(batch):
+        await app_module.board_cache.get(board_id)
+        before = db.stats()['reads']
+        event = await app_module.prepare_board_event(board_id, {'type': 'tasks', 'changes': batch})
+        return db.stats()['reads'] - before, event
+
+    one_reads, _ = asyncio.run(reads_for(changes[:1]))
+    all_reads, event = asyncio.run(reads_for(changes))
+    assert all_reads == one_reads == 6
+    assert [task['id'] for task in event['data']['tasks']] == [task.id for task in tasks]
+    assert all(f'id="task-{task.id}"' in event['data']['html'] for task in tasks)
+    assert all(task['unassigned'] is False for task in event['data']['tasks'])
+
+
+def test_failed_subscribe_leaves_no_channel():
+    from board_events import BoardEventHub
+
+    attempts = []
+
+    def subscribe(board_id, on_event):
+        attempts.append(board_id)
+        if len(attempts) == 1:
+            raise RuntimeError("listener failed")
+        on_event({'type': 'reload'})
+        return lambda: None
+
+    async def scenario():
+        hub = BoardEventHub(subscribe)
+        try:
+            await hub.listen('board').__anext__()
+        except RuntimeError:
+            pass
+        assert hub.stats()['boards'] == 0
+        assert await hub.listen('board').__anext__() == {'type': 'reload'}
+        assert attempts == ['board', 'board']
+    asyncio.run(scenario())
@@ -0,0 +1,143 @@
+import asyncio
+
+
+def new_tasks(*titles, assigned_to=None):
+    return {'tasks': [{'title': title, 'due_date': '2030-01-01', 'assigned_to': assigned_to} for title in titles]}
+
+
+def create(client, board_id, body):
+    response = client.post(f'/api/v1/boards/{board_id}/tasks', json=body)
+    assert response.status_code == 200
+    return response.json()['results']
+
+
+def counters(app_module, board_id):
+    db = app_module.firestore_db
+    board = asyncio.run(db.collection('boards').document(board_id).get()).to_dict()
+    tasks = asyncio.run(db.collection('tasks').where('board_id', '==', board_id).get())
+    completed = sum(1 for task in tasks if task.get('completed'))
+    assert (board['active_tasks'], board['completed_tasks']) == (len(tasks) - completed, completed)
+    return board['active_tasks'], board['completed_tasks']
+
+
+def test_create_reports_a_result_per_task(app_module, make_board):
+    creator, board_id = make_board(1)
+    create(creator, board_id, new_tasks('Existing'))
+
+    results = create(creator, board_id, {'tasks': [
+        {'title': 'First', 'due_date': '2030-01-01', 'assigned_to': 'member-0'},
+        {'title': ' first ', 'due_date': '2030-01-01'},
+        {'title': 'EXISTING', 'due_date': '2030-01-01'},
+        {'title': 'Stranger', 'due_date': '2030-01-01', 'assigned_to': 'stranger'},
+        {'title': 'Someday', 'due_date': 'someday'},
+        {'title': '  ', 'due_date': '2030-01-01'}
+    ]})
+    assert results[0]['status'] == 'created'
+    assert [result.get('error') for result in results[1:]] == [
+        'duplicate_task', 'duplicate_task', 'assignee_not_a_member', 'invalid_due_date', 'title_required'
+    ]
+    assert [result['index'] for result in results] == list(range(6))
+    assert counters(app_module, board_id) == (2, 0)
+
+
+def test_update_complete_and_delete_report_missing_and_repeated_tasks(app_module, make_board):
+    creator, board_id = make_board()
+    first, second = (result['id'] for result in create(creator, board_id, new_tasks('One', 'Two')))
+    _, other_board = make_board(name='Other')
+    other = create(creator, other_board, new_tasks('Elsewhere'))[0]['id']
+
+    response = creator.patch(f'/api/v1/boards/{board_id}/tasks', json={'tasks': [
+        {'id': first, 'title': 'two'}, {'id': second, 'assigned_to': 'stranger'}, {'id': other, 'title': 'Moved'}
+    ]})
+    assert [result['error'] for result in response.json()['results']] == [
+        'duplicate_task', 'assignee_not_a_member', 'task_not_found'
+    ]
+
+    response = creator.post(f'/api/v1/boards/{board_id}/tasks/complete', json={'task_ids': [first, first, 'nope']})
+    assert [result.get('error', result.get('status')) for result in response.json()['results']] == [
+        'completed', 'repeated_task', 'task_not_found'
+    ]
+    response = creator.post(f'/api/v1/boards/{board_id}/tasks/delete', json={'task_ids': [second, other]})
+    assert [result.get('error', result.get('status')) for result in response.json()['results']] == [
+        'deleted', 'task_not_found'
+    ]
+    assert counters(app_module, board_id) == (0, 1)
+    assert counters(app_module, other_board) == (1, 0)
+
+
+def test_requests_over_the_limit_are_refused(app_module, make_board, monkeypatch):
+    creator, board_id = make_board()
+    monkeypatch.setattr(app_module, 'BULK_TASK_LIMIT', 3)
+
+    response = creator.post(f'/api/v1/boards/{board_id}/tasks', json=new_tasks('a', 'b', 'c', 'd'))
+    assert response.status_code == 413
+    assert response.json() == {'error': 'too_many_tasks', 'limit': 3}
+    for path in ('/tasks/complete', '/tasks/delete'):
+        response = creator.post(f'/api/v1/boards/{board_id}{path}', json={'task_ids': ['a', 'b', 'c', 'd']})
+        assert response.status_code == 413
+    assert creator.patch(f'/api/v1/boards/{board_id}/tasks',
+                         json={'tasks': [{'id': task_id} for task_id in 'abcd']}).status_code == 413
+    assert counters(app_module, board_id) == (0, 0)
+
+
+def test_counters_follow_bulk_changes_across_batches(app_module, make_board, monkeypatch):
+    creator, board_id = make_board()
+    monkeypatch.setattr(app_module, 'BATCH_WRITE_LIMIT', 7)
+
+    task_ids = [result['id'] for result in create(creator, board_id, new_tasks(*(f'task {i}' for i in range(20))))]
+    assert counters(app_module, board_id) == (20, 0)
+
+    creator.post(f'/api/v1/boards/{board_id}/tasks/complete', json={'task_ids': task_ids[:8]})
+    assert counters(app_module, board_id) == (12, 8)
+    creator.post(f'/api/v1/boards/{board_id}/tasks/complete', json={'task_ids': task_ids[:2], 'completed': False})
+    assert counters(app_module, board_id) == (14, 6)
+    creator.post(f'/api/v1/boards/{board_id}/tasks/delete', json={'task_ids': task_ids[4:12]})
+    assert counters(app_module, board_id) == (10, 2)
+    assert creator.get(f'/api/v1/boards/{board_id}/summary').json()['total_tasks'] == 12
+
+
+def test_complete_retries_tasks_changed_after_they_were_read(app_module, make_board, monkeypatch):
+    creator, board_id = make_board()
+    task_ids = [result['id'] for result in create(creator, board_id, new_tasks('a', 'b', 'c'))]
+    board_ref = app_module.firestore_db.collection('boards').document(board_id)
+
+    # someone else completes the second task between the route reading the tasks and committing its batch
+    read_board_tasks = app_module.read_board_tasks
+
+    async def overtaken_read(*args):
+        tasks = await read_board_tasks(*args)
+        task_ref = app_module.firestore_db.collection('tasks').document(task_ids[1])
+        await app_module.toggle_task_in_transaction(app_module.firestore_db.transaction(), task_ref, board_ref, True)
+        return tasks
+    monkeypatch.setattr(app_module, 'read_board_tasks', overtaken_read)
+
+    retried = []
+    toggle = app_module.toggle_task_in_transaction
+
+    async def counted_toggle(transaction, task_ref, *args):
+        retried.append(task_ref.id)
+        return await toggle(transaction, task_ref, *args)
+    monkeypatch.setattr(app_module, 'toggle_task_in_transaction', counted_toggle)
+
+    response = creator.post(f'/api/v1/boards/{board_id}/tasks/complete', json={'task_ids': task_ids})
+    assert [result['status'] for result in response.json()['results']] == ['completed'] * 3
+    assert sorted(retried) == sorted([task_ids[1]] + task_ids)
+    assert counters(app_module, board_id) == (0, 3)
+
+
+def test_create_retries_when_a_title_is_taken_after_it_was_read(app_module, make_board, monkeypatch):
+    creator, board_id = make_board()
+    board_ref = app_module.firestore_db.collection('boards').document(board_id)
+
+    read_title_reservations = app_module.read_title_reservations
+
+    async def overtaken_read(reservation_ids):
+        result = await read_title_reservations(reservation_ids)
+        await app_module.add_task_in_transaction(app_module.firestore_db.transaction(), board_ref,
+                                                 app_module.new_task_data(board_id, 'B', '2030-01-01', None, 'creator'))
+        return result
+    monkeypatch.setattr(app_module, 'read_title_reservations', overtaken_read)
+
+    results = create(creator, board_id, new_tasks('A', 'b', 'C'))
+    assert [result.get('status', result.get('error')) for result in results] == ['created', 'duplicate_task', 'created']
+    assert counters(app_module, board_id) == (3, 0)
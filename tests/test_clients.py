@@ -0,0 +1,43 @@
+import asyncio
+import os
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+
+from clients import PooledAsyncClient, PooledGrpcAsyncIOTransport
+from conftest import ROOT
+
+
+def test_pooled_client_takes_its_channels_in_turn():
+    async def scenario():
+        client = PooledAsyncClient(project='pooled', credentials=AnonymousCredentials(), channels=3)
+        apis = [client._firestore_api for _ in range(7)]
+        channels = [api.transport.grpc_channel for api in apis]
+        await client.close()
+        return client, apis, channels
+
+    client, apis, channels = asyncio.run(scenario())
+    assert len({id(api) for api in apis[:3]}) == 3
+    assert apis[3:] == apis[:3] + apis[:1]
+    assert len({id(channel) for channel in channels}) == 3
+    assert all(isinstance(api.transport, PooledGrpcAsyncIOTransport) for api in apis)
+    assert client._apis == [] and client._firestore_api_internal is None
+
+
+def test_pooled_client_overrides_a_method_of_the_pinned_firestore_client():
+    # the override depends on private code of the version in requirements.txt
+    with open(os.path.join(ROOT, 'requirements.txt')) as requirements:
+        assert 'google-cloud-firestore==2.20.0' in requirements.read().split()
+    assert hasattr(firestore.AsyncClient, '_firestore_api_helper')
+    assert PooledAsyncClient._firestore_api_helper is not firestore.AsyncClient._firestore_api_helper
+
+
+def test_single_channel_is_reused():
+    async def scenario():
+        client = PooledAsyncClient(project='pooled', credentials=AnonymousCredentials())
+        apis = [client._firestore_api for _ in range(3)]
+        await client.close()
+        return apis
+
+    apis = asyncio.run(scenario())
+    assert apis[0] is apis[1] is apis[2]
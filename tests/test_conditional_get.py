@@ -0,0 +1,131 @@
+import asyncio
+import gzip
+
+import pytest
+
+import compression
+
+# The routes that change what a page shows, each sent by the creator of a board with a member and a task
+MUTATIONS = {
+    'toggle task': lambda board: ('/toggle-task', {'board_id': board['id'], 'task_id': board['task_id']}),
+    'edit task': lambda board: ('/edit-task', {
+        'board_id': board['id'], 'task_id': board['task_id'], 'title': 'renamed', 'due_date': '2030-01-02'
+    }),
+    'rename board': lambda board: ('/rename-board', {'board_id': board['id'], 'new_name': 'Renamed'}),
+    'create board': lambda board: ('/create-board', {'board_name': 'Another'})
+}
+
+
+@pytest.fixture
+def board(app_module, make_board):
+    creator, board_id = make_board(members=1)
+    response = creator.post(f'/api/v1/boards/{board_id}/tasks', json={'tasks': [
+        {'title': f'task {i}', 'due_date': '2030-01-01', 'assigned_to': 'member-0'} for i in range(30)
+    ]})
+    return {'id': board_id, 'task_id': response.json()['results'][0]['id'], 'creator': creator}
+
+
+def revalidate(client, path, etag):
+    return client.get(path, headers={'if-none-match': etag})
+
+
+@pytest.mark.parametrize('page', ['dashboard', 'board'])
+def test_unchanged_page_is_not_modified(board, page):
+    path = '/' if page == 'dashboard' else f"/board/{board['id']}"
+    first = board['creator'].get(path)
+    assert first.status_code == 200
+    etag = first.headers['etag']
+
+    repeat = revalidate(board['creator'], path, etag)
+    assert (repeat.status_code, repeat.headers['etag'], repeat.content) == (304, etag, b'')
+    assert repeat.headers['cache-control'] == 'private, no-cache'
+    assert revalidate(board['creator'], path, f'"other", {etag}').status_code == 304
+
+
+# Every mutation changes at least one of the two pages. The bulk API changes the board but not the dashboard
+@pytest.mark.parametrize('mutation', list(MUTATIONS) + ['bulk create'])
+def test_changes_give_the_page_a_new_etag(board, mutation):
+    creator = board['creator']
+    paths = {'dashboard': '/', 'board': f"/board/{board['id']}"}
+    etags = {page: creator.get(path).headers['etag'] for page, path in paths.items()}
+
+    if mutation == 'bulk create':
+        creator.post(f"/api/v1/boards/{board['id']}/tasks",
+                     json={'tasks': [{'title': 'bulk', 'due_date': '2030-01-01'}]})
+    else:
+        path, data = MUTATIONS[mutation](board)
+        creator.post(path, data=data, follow_redirects=False)
+
+    changed = {page for page, path in paths.items() if revalidate(creator, path, etags[page]).status_code == 200}
+    expected = {
+        'toggle task': {'board'}, 'edit task': {'board'}, 'bulk create': {'board'},
+        'rename board': {'board', 'dashboard'}, 'create board': {'dashboard'}
+    }
+    assert changed == expected[mutation]
+    for page in changed:
+        response = revalidate(creator, paths[page], etags[page])
+        assert response.headers['etag'] != etags[page]
+
+
+def test_pages_are_compressed_for_clients_that_take_gzip(board):
+    creator = board['creator']
+    path = f"/board/{board['id']}"
+
+    identity = creator.get(path, headers={'accept-encoding': 'identity'})
+    assert 'content-encoding' not in identity.headers
+    assert identity.headers['vary'] == 'Accept-Encoding'
+
+    compressed = creator.get(path, headers={'accept-encoding': 'gzip'})
+    assert compressed.headers['content-encoding'] == 'gzip'
+    assert compressed.headers['vary'] == 'Accept-Encoding'
+    assert compressed.headers['etag'] == identity.headers['etag']
+    assert int(compressed.headers['content-length']) < len(identity.content)
+    assert compressed.text == identity.text
+
+    # a 304 has no body so it is sent as it is, and the ETag matches whichever encoding the page was fetched in
+    repeat = creator.get(path, headers={'accept-encoding': 'gzip', 'if-none-match': compressed.headers['etag']})
+    assert repeat.status_code == 304
+    assert 'content-encoding' not in repeat.headers
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip, deflate', 'gzip'),
+    ('GZIP;q=0.5', 'gzip'),
+    ('gzip;q=0, deflate', None),
+    ('identity', None),
+    ('', None),
+    ('br, gzip', 'br' if compression.brotli is not None else 'gzip')
+])
+def test_choose_encoding(accept_encoding, expected):
+    assert compression.choose_encoding(accept_encoding) == expected
+
+
+def test_small_and_binary_responses_are_not_compressed():
+    async def run(headers, body):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async def inner(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': body})
+
+        scope = {'type': 'http', 'headers': [(b'accept-encoding', b'gzip')]}
+        await compression.CompressionMiddleware(inner, minimum_size=100)(scope, receive, send)
+        return dict(messages[0]['headers']), messages[1]['body']
+
+    text = [(b'content-type', b'text/plain'), (b'etag', b'"abc"')]
+    headers, body = asyncio.run(run(text, b'x' * 1000))
+    assert headers[b'content-encoding'] == b'gzip' and headers[b'vary'] == b'Accept-Encoding'
+    assert headers[b'etag'] == b'W/"abc"'
+    assert gzip.decompress(body) == b'x' * 1000
+
+    headers, body = asyncio.run(run(text, b'short'))
+    assert b'content-encoding' not in headers and body == b'short'
+
+    headers, body = asyncio.run(run([(b'content-type', b'image/png')], b'x' * 1000))
+    assert b'content-encoding' not in headers and b'vary' not in headers
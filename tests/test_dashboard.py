@@ -0,0 +1,22 @@
+import pytest
+
+
+# The dashboard reads the user and then every board in one batched read, so it makes the same round trips however
+# many boards the user is on. Each board is still a document read of its own, and none is read twice
+@pytest.mark.parametrize("boards", [1, 10, 100])
+def test_dashboard_round_trips_do_not_grow_with_boards(app_module, signed_in, store_reads, boards):
+    creator = signed_in('creator')
+    member = signed_in('member')
+    member.get('/')
+    creator.get('/')
+    for i in range(boards):
+        creator.post('/create-board', data={'board_name': f'Board {i}'}, follow_redirects=False)
+
+    store_reads.reset()
+    response = creator.get('/')
+    assert response.status_code == 200
+    assert 'Board 0' in response.text and f'Board {boards - 1}' in response.text
+
+    assert dict(store_reads.rpcs) == {'batch_get_documents': 2}
+    assert sum(store_reads.documents.values()) == boards + 1
+    assert max(store_reads.documents.values()) == 1
@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+
+import pytest
+
+import maintenance
+
+UTC = datetime.timezone.utc
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2030-01-01', datetime.datetime(2030, 1, 1, tzinfo=UTC)),
+    (' 2030-02-28\n', datetime.datetime(2030, 2, 28, tzinfo=UTC)),
+    ('2030-03-04T10:30:00', datetime.datetime(2030, 3, 4, tzinfo=UTC)),
+    (datetime.date(2030, 5, 6), datetime.datetime(2030, 5, 6, tzinfo=UTC)),
+    (datetime.datetime(2030, 7, 8, 9, tzinfo=UTC), datetime.datetime(2030, 7, 8, 9, tzinfo=UTC)),
+    ('2030-01-01garbage', None),
+    ('2030-01-01T99', None),
+    ('2030-02-30', None),
+    ('', None),
+    (None, None)
+])
+def test_parse_due_date(app_module, value, expected):
+    assert app_module.parse_due_date(value) == expected
+
+
+def test_my_tasks_pages_follow_the_due_date(app_module, make_board):
+    creator, board_id = make_board()
+    db = app_module.firestore_db
+    due_dates = [f'2030-01-{day:02}' for day in (5, 1, 4, 2, 3)]
+
+    async def seed():
+        for i, due_date in enumerate(due_dates):
+            await db.collection('tasks').document(f'task-{i}').set(
+                app_module.new_task_data(board_id, f'task {i}', due_date, 'creator', 'creator'))
+        await db.collection('tasks').document('other').set(
+            app_module.new_task_data(board_id, 'other', '2030-01-01', 'someone-else', 'creator'))
+    asyncio.run(seed())
+
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+        page = creator.get('/api/v1/my-tasks', params=params).json()
+        assert len(page['tasks']) <= 2
+        seen += [task['id'] for task in page['tasks']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == ['task-1', 'task-3', 'task-4', 'task-2', 'task-0']
+
+    # a cursor for a task that isn't assigned to the user starts from the beginning
+    page = creator.get('/api/v1/my-tasks', params={'limit': 2, 'cursor': 'other'}).json()
+    assert [task['id'] for task in page['tasks']] == ['task-1', 'task-3']
+
+
+def test_migrate_due_dates_converts_form_strings(app_module, make_board):
+    creator, board_id = make_board()
+    db = app_module.firestore_db
+    stored = datetime.datetime(2030, 1, 9, tzinfo=UTC)
+    due_dates = {'plain': '2030-01-02', 'padded': ' 2030-01-03 ', 'garbage': '2030-01-01garbage',
+                 'migrated': stored}
+
+    async def seed():
+        for task_id, due_date in due_dates.items():
+            await db.collection('tasks').document(task_id).set(
+                {**app_module.new_task_data(board_id, task_id, None, 'creator', 'creator'), 'due_date': due_date})
+    asyncio.run(seed())
+    asyncio.run(maintenance.migrate_due_dates())
+
+    migrated = {task_id: asyncio.run(db.collection('tasks').document(task_id).get()).get('due_date')
+                for task_id in due_dates}
+    assert migrated == {
+        'plain': datetime.datetime(2030, 1, 2, tzinfo=UTC),
+        'padded': datetime.datetime(2030, 1, 3, tzinfo=UTC),
+        'garbage': '2030-01-01garbage',
+        'migrated': stored
+    }
+    page = creator.get('/api/v1/my-tasks', params={'view': 'upcoming'}).json()
+    assert [task['id'] for task in page['tasks']] == ['plain', 'padded', 'migrated']
@@ -0,0 +1,72 @@
+import asyncio
+
+from starlette.testclient import TestClient
+
+import maintenance
+from conftest import signer
+
+
+def sign_in(app_module, user_id, email):
+    client = TestClient(app_module.app)
+    client.cookies.set("token", signer.token(user_id, email))
+    client.get('/')
+    return client
+
+
+def invite(creator, board_id, email):
+    creator.post('/add-user-to-board', data={'board_id': board_id, 'user_email': email}, follow_redirects=False)
+
+
+def board_members(app_module, board_id):
+    return asyncio.run(app_module.firestore_db.collection('boards').document(board_id).get()).get('members')
+
+
+def index_entry(app_module, email):
+    entry = asyncio.run(app_module.email_index_ref(email).get())
+    return entry.to_dict() if entry.exists else None
+
+
+def test_invite_ignores_case_and_whitespace(app_module, make_board):
+    creator, board_id = make_board()
+    sign_in(app_module, 'm1', 'M1@X')
+
+    assert index_entry(app_module, 'm1@x') == {'user_id': 'm1'}
+    invite(creator, board_id, ' m1@x ')
+    assert board_members(app_module, board_id) == ['creator', 'm1']
+
+
+def test_index_entry_follows_a_changed_email(app_module, make_board):
+    creator, board_id = make_board()
+    sign_in(app_module, 'm1', 'old@x')
+    sign_in(app_module, 'm1', 'New@x')
+
+    assert index_entry(app_module, 'old@x') is None
+    assert index_entry(app_module, 'new@x') == {'user_id': 'm1'}
+    user = asyncio.run(app_module.firestore_db.collection('users').document('m1').get())
+    assert user.get('email') == 'New@x'
+
+    invite(creator, board_id, 'old@x')
+    assert board_members(app_module, board_id) == ['creator']
+    invite(creator, board_id, 'new@X')
+    assert board_members(app_module, board_id) == ['creator', 'm1']
+
+
+def test_backfill_email_index_adds_legacy_users(app_module, make_board):
+    creator, board_id = make_board()
+    db = app_module.firestore_db
+
+    async def seed():
+        for i in range(3):
+            await db.collection('users').document(f'legacy-{i}').set({
+                'name': f'legacy-{i}', 'email': f'Legacy-{i}@x', 'created_boards': [], 'member_boards': []
+            })
+    asyncio.run(seed())
+    invite(creator, board_id, 'legacy-0@x')
+    assert board_members(app_module, board_id) == ['creator']
+
+    asyncio.run(maintenance.backfill_email_index())
+    for i in range(3):
+        assert index_entry(app_module, f'legacy-{i}@x') == {'user_id': f'legacy-{i}'}
+    assert index_entry(app_module, 'creator@bench.local') == {'user_id': 'creator'}
+    invite(creator, board_id, 'legacy-0@x')
+    assert board_members(app_module, board_id) == ['creator', 'legacy-0']
@@ -0,0 +1,39 @@
+import asyncio
+import datetime
+
+from conftest import signer
+
+
+def test_progress_counts_title_reservations(app_module, signed_in):
+    now = datetime.datetime.now()
+    job_ref = app_module.firestore_db.collection('jobs').document('job')
+    asyncio.run(job_ref.set({
+        'type': 'delete_board', 'board_id': 'board', 'board_name': 'Board', 'user_id': 'creator', 'state': 'running',
+        'total_tasks': 100, 'tasks_deleted': 100, 'titles_deleted': 20, 'error': None, 'started_at': now,
+        'updated_at': now, 'finished_at': None
+    }))
+
+    assert signed_in('creator').get('/api/v1/jobs/job').json()['progress'] == 0.6
+
+
+def test_force_delete_removes_tasks_titles_and_member_links(app_module, monkeypatch):
+    from force_delete import force_delete, seed
+
+    monkeypatch.setattr(app_module, 'BOARD_DELETE_PAGE_SIZE', 7)
+    monkeypatch.setattr(app_module, 'BATCH_WRITE_LIMIT', 3)
+    db = app_module.firestore_db
+
+    async def scenario():
+        board_id = await seed(app_module, 'creator', 30, 20)
+        job, _, _ = await force_delete(app_module, signer.token('creator'), board_id, 0.01)
+        tasks = await db.collection('tasks').where('board_id', '==', board_id).get()
+        titles = await db.collection('task_titles').where('board_id', '==', board_id).get()
+        members = await db.collection('users').where('member_boards', 'array_contains', board_id).get()
+        creator = await db.collection('users').document('creator').get()
+        board = await db.collection('boards').document(board_id).get()
+        return job, tasks, titles, members, creator.get('created_boards'), board.exists
+
+    job, tasks, titles, members, created_boards, board_exists = asyncio.run(scenario())
+    assert job['state'] == 'done' and job['progress'] == 1.0
+    assert (job['members_removed'], job['tasks_deleted'], job['titles_deleted']) == (20, 30, 30)
+    assert (tasks, titles, members, created_boards, board_exists) == ([], [], [], [], False)
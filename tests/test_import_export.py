@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+import httpx
+
+from conftest import signer
+
+
+def import_file(client, board_id, body, file_format):
+    response = client.post(f'/api/v1/boards/{board_id}/import', params={'format': file_format}, content=body)
+    assert response.status_code == 200
+    return response.json()
+
+
+def board_titles(app_module, board_id):
+    tasks = asyncio.run(app_module.firestore_db.collection('tasks').where('board_id', '==', board_id).get())
+    return sorted(task.get('title') for task in tasks)
+
+
+def test_csv_errors_are_reported_on_the_line_the_row_starts(app_module, make_board):
+    creator, board_id = make_board(members=1)
+    body = ('title,due_date,assigned_to\r\n'
+            '"Two\r\nlines",2030-01-01,member-0\r\n'
+            'No date,,\r\n'
+            '"Three\r\nlines\r\nhere",not a date,\r\n'
+            'Stranger,2030-01-02,someone-else\r\n'
+            'Two\r\n'
+            'First,2030-01-03,\r\n'
+            '" first ",2030-01-04,\r\n')
+
+    result = import_file(creator, board_id, body, 'csv')
+    assert (result['created'], result['failed']) == (2, 5)
+    assert result['errors'] == [
+        {'row': 4, 'error': 'due_date_required'},
+        {'row': 5, 'error': 'invalid_due_date'},
+        {'row': 8, 'error': 'assignee_not_a_member'},
+        {'row': 9, 'error': 'due_date_required'},
+        {'row': 11, 'error': 'duplicate_task'}
+    ]
+    assert board_titles(app_module, board_id) == ['First', 'Two\nlines']
+
+
+def test_ndjson_reports_invalid_rows_and_titles_already_on_the_board(app_module, make_board):
+    creator, board_id = make_board()
+    import_file(creator, board_id, json.dumps({'title': 'Existing', 'due_date': '2030-01-01'}) + '\n', 'ndjson')
+    rows = [
+        json.dumps({'title': 'New', 'due_date': '2030-01-01'}),
+        '{"title": "Broken", ',
+        '',
+        '["not", "an", "object"]',
+        json.dumps({'title': 'EXISTING', 'due_date': '2030-01-01'}),
+        json.dumps({'title': 7, 'due_date': '2030-01-01'}),
+        json.dumps({'title': 'new', 'due_date': '2030-01-02'})
+    ]
+
+    result = import_file(creator, board_id, '\n'.join(rows), 'ndjson')
+    assert (result['created'], result['failed']) == (1, 5)
+    assert result['errors'] == [
+        {'row': 2, 'error': 'invalid_json'},
+        {'row': 4, 'error': 'invalid_row'},
+        {'row': 5, 'error': 'duplicate_task'},
+        {'row': 6, 'error': 'title_required'},
+        {'row': 7, 'error': 'duplicate_task'}
+    ]
+    assert board_titles(app_module, board_id) == ['Existing', 'New']
+
+
+def test_export_imports_into_another_board(app_module, make_board):
+    creator, board_id = make_board(members=1)
+    tasks = [{'title': f'Task {i}', 'due_date': f'2030-01-{i + 1:02}', 'assigned_to': 'member-0' if i % 2 else None}
+             for i in range(5)]
+    tasks.append({'title': 'Quoted, "with"\nbreaks', 'due_date': '2030-02-01', 'assigned_to': None})
+    creator.post(f'/api/v1/boards/{board_id}/tasks', json={'tasks': tasks})
+
+    def exported(board, file_format):
+        response = creator.get(f'/api/v1/boards/{board}/export', params={'format': file_format})
+        assert response.status_code == 200
+        return response.text
+
+    def fields(board):
+        rows = [json.loads(line) for line in exported(board, 'ndjson').splitlines()]
+        return sorted((row['title'], row['due_date'], row['assigned_to']) for row in rows)
+
+    for file_format in ('csv', 'ndjson'):
+        creator.post('/create-board', data={'board_name': f'Copy {file_format}'}, follow_redirects=False)
+        user = asyncio.run(app_module.firestore_db.collection('users').document('creator').get())
+        copy_id = user.get('created_boards')[-1]
+
+        result = import_file(creator, copy_id, exported(board_id, file_format), file_format)
+        # member-0 isn't a member of the copy, so the tasks assigned to them are refused
+        assert (result['created'], result['failed']) == (4, 2)
+        assert [error['error'] for error in result['errors']] == ['assignee_not_a_member'] * 2
+        assert fields(copy_id) == [task for task in fields(board_id) if task[2] is None]
+
+
+def test_form_upload_is_imported_while_it_is_being_sent(app_module, make_board, monkeypatch):
+    monkeypatch.setattr(app_module, 'IMPORT_CHUNK_SIZE', 1)
+    creator, board_id = make_board()
+    db = app_module.firestore_db
+    boundary = 'import-boundary'
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="note"\r\n\r\nskipped\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="tasks.csv"\r\n'
+            'Content-Type: text/csv\r\n\r\n'
+            'title,due_date\r\nFirst,2030-01-01\r\nSecond,2030-01-02\r\n')
+    tail = f'Third,2030-01-03\r\n--{boundary}--\r\n'
+    created_before_the_end = []
+
+    async def body():
+        yield head.encode()
+        for _ in range(200):
+            if await db.collection('tasks').where('board_id', '==', board_id).get():
+                created_before_the_end.append(True)
+                break
+            await asyncio.sleep(0.01)
+        yield tail.encode()
+
+    async def upload():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test',
+                                     cookies={'token': signer.token('creator')}) as client:
+            return await client.post(f'/api/v1/boards/{board_id}/import', content=body(),
+                                     headers={'content-type': f'multipart/form-data; boundary={boundary}'})
+
+    response = asyncio.run(upload())
+    assert response.status_code == 200
+    assert response.json() == {'created': 3, 'failed': 0, 'errors': []}
+    assert created_before_the_end == [True]
+    assert board_titles(app_module, board_id) == ['First', 'Second', 'Third']
+
+
+def test_form_upload_needs_a_file(app_module, make_board):
+    creator, board_id = make_board()
+    url = f'/api/v1/boards/{board_id}/import'
+
+    assert creator.post(url, data={'note': 'no file'}, files={'other': ('x.csv', b'')}).json() == {
+        'error': 'file_required'}
+    response = creator.post(url, files={'file': ('tasks.csv', b'title,due_date\nOne,2030-01-01\n', 'text/csv')})
+    assert response.json() == {'created': 1, 'failed': 0, 'errors': []}
+    response = creator.post(url, content=b'--x\r\n', headers={'content-type': 'multipart/form-data'})
+    assert (response.status_code, response.json()) == (400, {'error': 'invalid_form'})
@@ -0,0 +1,36 @@
+import asyncio
+import datetime
+
+import maintenance
+
+
+def test_backfill_unassigned_fixes_legacy_flags(app_module, signed_in):
+    db = app_module.firestore_db
+    tasks = {
+        'cleared': {'assigned_to': None, 'unassigned': False},
+        'removed': {'assigned_to': 'former-member', 'unassigned': False},
+        'reassigned': {'assigned_to': 'creator', 'unassigned': True},
+        'assigned': {'assigned_to': 'creator', 'unassigned': False}
+    }
+
+    async def seed():
+        await db.collection('boards').document('board').set({
+            'name': 'Board', 'creator_id': 'creator', 'creator_email': 'creator@bench.local',
+            'created_at': datetime.datetime.now(), 'members': ['creator'], 'active_tasks': len(tasks),
+            'completed_tasks': 0, 'counters_initialized': True
+        })
+        await db.collection('users').document('creator').set({
+            'name': 'creator', 'email': 'creator@bench.local', 'created_boards': ['board'], 'member_boards': []
+        })
+        for task_id, assignment in tasks.items():
+            await db.collection('tasks').document(task_id).set({
+                **app_module.new_task_data('board', task_id, '2030-01-01', 'creator', 'creator'), **assignment
+            })
+    asyncio.run(seed())
+    asyncio.run(maintenance.backfill_unassigned())
+
+    flags = {task_id: asyncio.run(db.collection('tasks').document(task_id).get()).get('unassigned')
+             for task_id in tasks}
+    assert flags == {'cleared': True, 'removed': True, 'reassigned': False, 'assigned': False}
+    page = signed_in('creator').get('/board/board', params={'filter': 'unassigned'}).text
+    assert 'id="task-cleared"' in page and 'id="task-removed"' in page and 'id="task-assigned"' not in page
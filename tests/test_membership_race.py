@@ -0,0 +1,12 @@
+import asyncio
+
+from conftest import signer
+from membership_race import race
+
+
+# Parallel add and remove member requests must not lose or leave behind any membership entries. Every store
+# operation waits a little so the requests overlap the way they would on firestore
+def test_parallel_membership_changes_are_not_lost(app_module, monkeypatch):
+    monkeypatch.setattr(app_module.firestore_db.get(), 'latency', 0.002)
+    problems = asyncio.run(race(app_module, signer.token('race-creator'), users=60, concurrency=32))
+    assert problems == []
@@ -0,0 +1,63 @@
+import re
+
+from conftest import scrape_metrics, signer
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? (-?[0-9.e+-]+|\+Inf|NaN)$')
+
+
+def test_exposition_format(app_module, make_board):
+    creator, board_id = make_board()
+    creator.get(f'/board/{board_id}')
+    text = creator.get('/metrics').text
+
+    families = {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name = line.split()[2]
+            assert name not in families
+            families[name] = None
+        elif line.startswith('# TYPE '):
+            _, _, name, metric_type = line.split()
+            assert name in families and families[name] is None
+            assert metric_type in ('counter', 'gauge', 'histogram')
+            families[name] = metric_type
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            name = match.group(1)
+            family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in families else name
+            assert families.get(family), line
+    assert all(name.startswith('taskmanager_') for name in families)
+
+    # the buckets of a histogram add up to its count
+    series = scrape_metrics(creator)
+    labels = 'method="GET",route="/board/{board_id}",status="200"'
+    buckets = [value for name, value in series.items()
+               if name.startswith(f'taskmanager_request_duration_seconds_bucket{{{labels},le=')]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == series[f'taskmanager_request_duration_seconds_count{{{labels}}}']
+    assert f'taskmanager_request_duration_seconds_bucket{{{labels},le="+Inf"}}' in series
+
+
+def test_request_token_cache_and_admission_counters_move(app_module, make_board):
+    creator, board_id = make_board()
+    # a token the cache hasn't seen yet
+    creator.cookies.set('token', signer.token('creator', lifetime=1800))
+    before = scrape_metrics(creator)
+
+    assert creator.get(f'/board/{board_id}').status_code == 200
+    assert creator.get(f'/board/{board_id}').status_code == 200
+    after = scrape_metrics(creator)
+
+    def moved(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    assert moved('taskmanager_request_duration_seconds_count{method="GET",route="/board/{board_id}",status="200"}') == 2
+    assert moved('taskmanager_token_cache_lookups_total{result="miss"}') == 1
+    assert moved('taskmanager_token_cache_lookups_total{result="hit"}') == 1
+    assert moved('taskmanager_token_verification_seconds_count') == 2
+    assert moved('taskmanager_admission_admitted_total{route="/board/{board_id}"}') == 2
+    assert after['taskmanager_admission_in_flight{route="/board/{board_id}"}'] == 0
+    assert moved('taskmanager_firestore_operation_seconds_count{operation="run_query"}') >= 2
+    # the scrape itself is timed too
+    assert moved('taskmanager_request_duration_seconds_count{method="GET",route="/metrics",status="200"}') == 1
@@ -0,0 +1,13 @@
+from profiling import RequestProfiler
+
+
+def scope(header=None):
+    return {'path': '/', 'headers': [(b'x-profile', header)] if header is not None else []}
+
+
+def test_profile_header_must_match_token(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), mode='collapsed', header_token='secret')
+    assert profiler.wants(scope(b'secret'))
+    assert not profiler.wants(scope(b'secreT'))
+    assert not profiler.wants(scope(b'\xff\xfe'))
+    assert not profiler.wants(scope())
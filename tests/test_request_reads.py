@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+JSON = {'Accept': 'application/json'}
+
+# The round trips each route makes on a board with a member and 30 tasks, with the board already in the board cache.
+# The token, user and board are resolved once per request (see RequestContext), so no route reads any document more
+# than once
+ROUTES = {
+    'dashboard': ({'batch_get_documents': 2}, lambda board: ('get', '/', {})),
+    'board': ({'batch_get_documents': 1, 'run_query': 1}, lambda board: ('get', f"/board/{board['id']}", {})),
+    'next task page': ({'batch_get_documents': 2, 'run_query': 1},
+                       lambda board: ('get', f"/board/{board['id']}/tasks?cursor={board['task_id']}", {})),
+    # the member has every task on the board, the names of the boards are read in one batch
+    'my tasks': ({'run_query': 1, 'batch_get_documents': 1}, lambda board: ('get', '/my-tasks', {})),
+    'profile': ({'batch_get_documents': 1}, lambda board: ('get', '/profile', {})),
+    'add task': ({'batch_get_documents': 1, 'commit': 1}, lambda board: ('post', '/add-task', {
+        'board_id': board['id'], 'title': 'new task', 'due_date': '2030-01-01'
+    })),
+    'toggle task': ({'batch_get_documents': 1, 'commit': 1}, lambda board: ('post', '/toggle-task', {
+        'board_id': board['id'], 'task_id': board['task_id']
+    })),
+    'edit task': ({'batch_get_documents': 3, 'commit': 1}, lambda board: ('post', '/edit-task', {
+        'board_id': board['id'], 'task_id': board['task_id'], 'title': 'renamed', 'due_date': '2030-01-02'
+    })),
+    'delete task': ({'batch_get_documents': 2, 'commit': 1}, lambda board: ('post', '/delete-task', {
+        'board_id': board['id'], 'task_id': board['task_id']
+    })),
+}
+
+
+@pytest.fixture
+def board(app_module, signed_in):
+    creator = signed_in('creator')
+    member = signed_in('member')
+    member.get('/')
+    creator.get('/')
+    creator.post('/create-board', data={'board_name': 'Reads'}, follow_redirects=False)
+    user = asyncio.run(app_module.firestore_db.collection('users').document('creator').get())
+    board_id = user.get('created_boards')[0]
+    creator.post('/add-user-to-board', data={'board_id': board_id, 'user_email': 'member@bench.local'},
+                 follow_redirects=False)
+    response = creator.post(f'/api/v1/boards/{board_id}/tasks', json={'tasks': [
+        {'title': f'task {i}', 'due_date': '2030-01-01', 'assigned_to': 'member'} for i in range(30)
+    ]})
+    return {'id': board_id, 'task_id': response.json()['results'][0]['id'], 'creator': creator, 'member': member}
+
+
+@pytest.mark.parametrize("route", list(ROUTES))
+def test_route_reads_each_document_once(board, store_reads, route):
+    expected, build = ROUTES[route]
+    method, path, form = build(board)
+    # the board is viewed first so every route starts with the board cache in the same state
+    board['creator'].get(f"/board/{board['id']}")
+
+    client = board['member'] if route == 'my tasks' else board['creator']
+    store_reads.reset()
+    if method == 'get':
+        response = client.get(path)
+    else:
+        response = client.post(path, data=form, headers=JSON)
+    assert response.status_code == 200
+
+    assert dict(store_reads.rpcs) == expected
+    assert store_reads.documents
+    assert max(store_reads.documents.values()) == 1
@@ -0,0 +1,53 @@
+import asyncio
+import re
+
+import httpx
+
+from conftest import signer
+from repeat_load import ASSET_PATTERN, BrowserCache, load
+from routes import seed
+
+
+def max_age(cache_control):
+    return int(re.search(r'max-age=(\d+)', cache_control).group(1))
+
+
+def test_hashed_assets_are_immutable(app_module, signed_in):
+    client = signed_in('creator')
+    manifest = app_module.static_assets.manifest or app_module.static_assets.build()
+    assert manifest
+    for name, hashed in manifest.items():
+        response = client.get(f'/static/{hashed}')
+        assert response.status_code == 200
+        assert 'immutable' in response.headers['cache-control']
+        assert max_age(response.headers['cache-control']) >= 365 * 24 * 3600
+
+        assert client.get(f'/static/{name}').headers['cache-control'] == 'no-cache'
+
+
+def test_repeat_load_fetches_no_static_files(app_module):
+    async def scenario():
+        state = await seed(app_module, 'static', 10, 2, 0)
+        pages = ['/', f"/board/{state['board_id']}"]
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test',
+                                     cookies={'token': signer.token(state['creator_id'])}) as client:
+            cache = BrowserCache()
+            loads = []
+            for _ in range(2):
+                totals = {'page_requests': 0, 'page_not_modified': 0, 'page_from_cache': 0, 'static_requests': 0,
+                          'static_not_modified': 0, 'static_from_cache': 0, 'bytes': 0}
+                for path in pages:
+                    await load(client, cache, path, totals)
+                loads.append(totals)
+            assets = set()
+            for path in pages:
+                assets.update(ASSET_PATTERN.findall((await client.get(path)).text))
+        return loads, assets
+
+    (first, repeat), assets = asyncio.run(scenario())
+    hashed = {f'/static/{name}' for name in app_module.static_assets.hashed_names}
+    assert assets and assets <= hashed
+    assert first['static_requests'] == len(assets)
+    assert repeat['static_requests'] == 0
+    assert repeat['static_from_cache'] >= len(assets)
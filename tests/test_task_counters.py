@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+
+import httpx
+
+from conftest import signer
+
+
+# A board from before the task counters existed, with `active` open and `completed` finished tasks
+def legacy_board(app_module, active, completed):
+    db = app_module.firestore_db
+
+    async def write():
+        board_ref = db.collection('boards').document('legacy')
+        await board_ref.set({'name': 'Legacy', 'creator_id': 'creator', 'creator_email': 'creator@bench.local',
+                             'created_at': datetime.datetime.now(), 'members': ['creator']})
+        await db.collection('users').document('creator').set({
+            'name': 'creator', 'email': 'creator@bench.local', 'created_boards': ['legacy'], 'member_boards': []
+        })
+        for i in range(active + completed):
+            await db.collection('tasks').document().set({'title': f'task {i}', 'board_id': 'legacy',
+                                                         'completed': i >= active, 'assigned_to': None})
+        return board_ref
+    return asyncio.run(write())
+
+
+def board_data(board_ref):
+    return asyncio.run(board_ref.get()).to_dict()
+
+
+def test_reads_count_legacy_board_without_writing(app_module, signed_in):
+    board_ref = legacy_board(app_module, 3, 2)
+    before = asyncio.run(board_ref.get()).update_time
+
+    response = signed_in('creator').get('/api/v1/boards/legacy/summary')
+    assert response.json() == {'board_id': 'legacy', 'active_tasks': 3, 'completed_tasks': 2, 'total_tasks': 5}
+    assert asyncio.run(board_ref.get()).update_time == before
+
+
+def test_recount_counts_again_when_a_task_changes_meanwhile(app_module, monkeypatch):
+    board_ref = legacy_board(app_module, 3, 2)
+    db = app_module.firestore_db
+    count_board_tasks = app_module.count_board_tasks
+    counts = []
+
+    # The first count is overtaken by a new task, committed with its increment the way the routes do
+    async def overtaken_count(board_id):
+        result = await count_board_tasks(board_id)
+        if not counts:
+            batch = db.batch()
+            batch.set(db.collection('tasks').document(), {'title': 'new', 'board_id': 'legacy', 'completed': False})
+            batch.update(board_ref, {'active_tasks': app_module.firestore.Increment(1)})
+            await batch.commit()
+        counts.append(result)
+        return result
+    monkeypatch.setattr(app_module, 'count_board_tasks', overtaken_count)
+
+    assert asyncio.run(app_module.recount_board_tasks('legacy')) == {'active_tasks': 4, 'completed_tasks': 2}
+    assert len(counts) == 2
+    data = board_data(board_ref)
+    assert (data['active_tasks'], data['completed_tasks'], data['counters_initialized']) == (4, 2, True)
+
+
+def test_parallel_first_changes_to_legacy_board_keep_counters_right(app_module, signed_in, monkeypatch):
+    board_ref = legacy_board(app_module, 3, 2)
+    signed_in('creator').get('/')
+    monkeypatch.setattr(app_module.firestore_db.get(), 'latency', 0.002)
+
+    async def add_tasks():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test',
+                                     cookies={'token': signer.token('creator')}) as client:
+            return await asyncio.gather(*(client.post('/api/v1/boards/legacy/tasks', json={'tasks': [
+                {'title': f'added {i}', 'due_date': '2030-01-01', 'assigned_to': 'creator'}
+            ]}) for i in range(10)))
+
+    assert all(response.status_code == 200 for response in asyncio.run(add_tasks()))
+    data = board_data(board_ref)
+    assert (data['active_tasks'], data['completed_tasks'], data['counters_initialized']) == (13, 2, True)
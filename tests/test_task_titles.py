@@ -0,0 +1,95 @@
+import asyncio
+import datetime
+
+import httpx
+
+import maintenance
+from conftest import signer
+
+JSON = {'accept': 'application/json'}
+
+
+def add(client, board_id, title):
+    return client.post('/add-task', data={'board_id': board_id, 'title': title, 'due_date': '2030-01-01'},
+                       headers=JSON)
+
+
+def edit(client, board_id, task_id, title):
+    return client.post('/edit-task', data={'board_id': board_id, 'task_id': task_id, 'title': title,
+                                           'due_date': '2030-01-01'}, headers=JSON)
+
+
+def board_titles(app_module, board_id):
+    tasks = asyncio.run(app_module.firestore_db.collection('tasks').where('board_id', '==', board_id).get())
+    return sorted(task.get('title') for task in tasks)
+
+
+def reservation(app_module, board_id, title):
+    return asyncio.run(app_module.title_reservation_ref(board_id, title).get())
+
+
+def test_concurrent_adds_of_the_same_title_create_one_task(app_module, make_board, monkeypatch):
+    creator, board_id = make_board()
+    monkeypatch.setattr(app_module.firestore_db.get(), 'latency', 0.002)
+
+    async def add_both():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', headers=JSON,
+                                     cookies={'token': signer.token('creator')}) as client:
+            return await asyncio.gather(*(
+                client.post('/add-task', data={'board_id': board_id, 'title': title, 'due_date': '2030-01-01'})
+                for title in ('Buy milk', 'buy  MILK')
+            ))
+
+    responses = asyncio.run(add_both())
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    assert len(board_titles(app_module, board_id)) == 1
+    task_id = next(response.json()['task_id'] for response in responses if response.status_code == 200)
+    assert reservation(app_module, board_id, ' BUY milk ').get('task_id') == task_id
+
+
+def test_rename_to_an_existing_title_is_rejected(app_module, make_board):
+    creator, board_id = make_board()
+    add(creator, board_id, 'Write report')
+    task_id = add(creator, board_id, 'Send invoice').json()['task_id']
+
+    response = edit(creator, board_id, task_id, '  write REPORT')
+    assert response.status_code == 409
+    assert response.json() == {'error': 'duplicate_task'}
+    assert board_titles(app_module, board_id) == ['Send invoice', 'Write report']
+    assert reservation(app_module, board_id, 'Send invoice').get('task_id') == task_id
+
+
+def test_edit_and_delete_release_the_old_title(app_module, make_board):
+    creator, board_id = make_board()
+    task_id = add(creator, board_id, 'Plan trip').json()['task_id']
+
+    assert edit(creator, board_id, task_id, 'Book hotel').status_code == 200
+    assert not reservation(app_module, board_id, 'Plan trip').exists
+    assert add(creator, board_id, 'plan trip').status_code == 200
+
+    response = creator.post('/delete-task', data={'board_id': board_id, 'task_id': task_id}, headers=JSON)
+    assert response.status_code == 200
+    assert not reservation(app_module, board_id, 'Book hotel').exists
+    assert add(creator, board_id, 'Book hotel').status_code == 200
+    assert board_titles(app_module, board_id) == ['Book hotel', 'plan trip']
+
+
+def test_backfill_title_index_reserves_legacy_titles(app_module, make_board):
+    creator, board_id = make_board()
+    db = app_module.firestore_db
+    created = datetime.datetime(2024, 1, 1)
+
+    async def seed():
+        for i, title in enumerate(['Old task', 'old  TASK', 'Other task']):
+            task_data = app_module.new_task_data(board_id, title, '2030-01-01', None, 'creator')
+            task_data['created_at'] = created + datetime.timedelta(minutes=i)
+            await db.collection('tasks').document(f'legacy-{i}').set(task_data)
+    asyncio.run(seed())
+    assert not reservation(app_module, board_id, 'Old task').exists
+
+    asyncio.run(maintenance.backfill_title_index())
+    assert reservation(app_module, board_id, 'Old task').get('task_id') == 'legacy-0'
+    assert reservation(app_module, board_id, 'Other task').get('task_id') == 'legacy-2'
+    assert add(creator, board_id, 'OLD TASK').status_code == 409
+    assert add(creator, board_id, 'other task').status_code == 409
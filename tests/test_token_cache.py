@@ -0,0 +1,98 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import signer
+from token_cache import CertificateStore, VerifiedTokenCache, load_certs_file
+
+
+# Stands in for google.auth's transport request, returning the signer's certificates with the given headers
+class CertsRequest:
+    def __init__(self, certs, headers=None):
+        self.certs = certs
+        self.headers = headers or {}
+        self.calls = 0
+
+    def __call__(self, url, method="GET"):
+        self.calls += 1
+        return SimpleNamespace(status=200, headers=self.headers, data=json.dumps(self.certs).encode("utf-8"))
+
+
+def make_cache(max_size=10000, clock=time.time):
+    return VerifiedTokenCache(CertificateStore(certs=load_certs_file(signer.certs_file)), max_size=max_size,
+                              clock=clock)
+
+
+def test_counts_hits_and_misses():
+    cache = make_cache()
+    token = signer.token('alice')
+
+    assert cache.verify(token)['user_id'] == 'alice'
+    assert cache.verify(token)['user_id'] == 'alice'
+    cache.verify(signer.token('bob'))
+
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'evictions': 0, 'size': 2}
+
+
+def test_entries_are_dropped_when_the_token_expires():
+    now = [time.time()]
+    cache = make_cache(clock=lambda: now[0])
+    token = signer.token('alice', lifetime=60)
+    cache.verify(token)
+
+    now[0] += 59
+    cache.verify(token)
+    assert cache.stats()['hits'] == 1
+
+    now[0] += 2
+    cache.verify(signer.token('bob'))
+    assert cache.stats()['size'] == 1
+    cache.verify(token)
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'evictions': 0, 'size': 2}
+
+
+def test_least_recently_used_token_is_evicted():
+    cache = make_cache(max_size=2)
+    tokens = {user_id: signer.token(user_id) for user_id in ('a', 'b', 'c')}
+    cache.verify(tokens['a'])
+    cache.verify(tokens['b'])
+    cache.verify(tokens['a'])
+    cache.verify(tokens['c'])
+
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2}
+    cache.verify(tokens['a'])
+    assert cache.stats()['hits'] == 2
+    cache.verify(tokens['b'])
+    assert cache.stats()['misses'] == 4
+
+
+def test_unknown_key_id_requests_a_refresh(monkeypatch):
+    certs = load_certs_file(signer.certs_file)
+    store = CertificateStore(request=CertsRequest({'rotated-key': certs['bench-key']}))
+    refreshes = []
+    monkeypatch.setattr(store, 'request_refresh', lambda: refreshes.append(True))
+    monkeypatch.setattr(store, '_start_refresher', lambda: None)
+    cache = VerifiedTokenCache(store)
+
+    with pytest.raises(ValueError):
+        cache.verify(signer.token('alice'))
+    assert refreshes == [True]
+    assert cache.stats()['size'] == 0
+
+
+def test_certificates_are_kept_for_the_cache_control_max_age(monkeypatch):
+    certs = load_certs_file(signer.certs_file)
+    request = CertsRequest(certs, {'cache-control': 'public, max-age=1200, must-revalidate'})
+    store = CertificateStore(request=request, refresh_margin=300)
+    monkeypatch.setattr(store, '_start_refresher', lambda: None)
+
+    assert store.get_certs() == certs
+    assert store.get_certs() == certs
+    assert request.calls == 1
+    assert 895 <= store._seconds_until_refresh() <= 900
+
+    request.headers = {}
+    store.refresh()
+    assert 3295 <= store._seconds_until_refresh() <= 3300
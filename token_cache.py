@@ -0,0 +1,178 @@
+import hashlib
+import heapq
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from google.auth import jwt
+
+logger = logging.getLogger(__name__)
+
+# This is the endpoint that publishes the certificates firebase uses to sign ID tokens. It is the same
+# URL that google.oauth2.id_token.verify_firebase_token fetches on every call
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+# Used to pull the max-age value out of the Cache-Control header of the certificate response
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+# Function that loads a key set from a local JSON file of {key_id: PEM certificate}. This lets us verify
+# tokens that were signed locally (for offline testing and benchmarking) without talking to Google
+def load_certs_file(path):
+    with open(path) as certs_file:
+        return json.load(certs_file)
+
+
+# Holds the public certificates used to verify firebase ID tokens. Certificates are fetched from Google and
+# kept until the max-age given in the Cache-Control header runs out. A background thread refreshes them a
+# little before they expire so that a request never has to wait on an HTTP call, except for the very first
+# one if nothing has been loaded yet. If a key set is passed in then it is used as is and nothing is fetched.
+class CertificateStore:
+    def __init__(self, request=None, certs=None, certs_url=FIREBASE_CERTS_URL, refresh_margin=300,
+                 default_max_age=3600, retry_interval=30):
+        self._request = request
+        self._certs_url = certs_url
+        self._refresh_margin = refresh_margin
+        self._default_max_age = default_max_age
+        self._retry_interval = retry_interval
+        self._static = certs is not None
+        self._certs = dict(certs) if certs is not None else None
+        self._expires_at = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # Return the current key set. The first call fetches the certificates and starts the refresh thread
+    def get_certs(self):
+        if self._certs is None:
+            with self._lock:
+                if self._certs is None:
+                    self.refresh()
+        self._start_refresher()
+        return self._certs
+
+    # Ask the refresh thread to fetch new certificates straight away. This is called when a token is signed
+    # with a key id that we don't know about, which usually means google has rotated its keys
+    def request_refresh(self):
+        if not self._static:
+            self._start_refresher()
+            self._wake.set()
+
+    # Fetch the certificates and work out how long we are allowed to keep them for
+    def refresh(self):
+        if self._request is None:
+            # imported here as it brings in the requests library, which isn't needed when the certificates are local
+            from google.auth.transport import requests
+            self._request = requests.Request()
+        response = self._request(self._certs_url, method="GET")
+        if response.status != 200:
+            raise ValueError(f"Could not fetch certificates at {self._certs_url}")
+
+        max_age = self._default_max_age
+        match = MAX_AGE_PATTERN.search(response.headers.get("cache-control", ""))
+        if match:
+            max_age = int(match.group(1))
+
+        self._certs = json.loads(response.data.decode("utf-8"))
+        self._expires_at = time.time() + max_age
+
+    # Seconds until the refresh thread should fetch the certificates again
+    def _seconds_until_refresh(self):
+        if self._expires_at is None:
+            return 0
+        return max(self._expires_at - self._refresh_margin - time.time(), 0)
+
+    def _start_refresher(self):
+        if self._static or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name="firebase-cert-refresh", daemon=True)
+                self._thread.start()
+
+    # Loop run by the background thread. If a fetch fails we keep the old certificates and try again shortly
+    def _refresh_loop(self):
+        while True:
+            self._wake.wait(self._seconds_until_refresh())
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as err:
+                logger.warning(f"Certificate refresh error: {str(err)}")
+                self._wake.wait(self._retry_interval)
+
+
+# A bounded in-memory cache of tokens that have already been verified. Entries are keyed by a hash of the
+# token (so the raw token is never stored) and are dropped as soon as the token's exp claim passes. When the
+# cache is full the least recently used token is evicted.
+class VerifiedTokenCache:
+    def __init__(self, cert_store, max_size=10000, audience=None, clock_skew_in_seconds=0, clock=time.time):
+        self._cert_store = cert_store
+        self._max_size = max_size
+        self._audience = audience
+        self._clock_skew = clock_skew_in_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._expiry_heap = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Verify a token and return its claims. Raises ValueError if the token is not valid, the same as
+    # google.oauth2.id_token.verify_firebase_token does
+    def verify(self, id_token):
+        key = hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+        now = self._clock()
+
+        with self._lock:
+            self._remove_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            self.misses += 1
+
+        claims = self._decode(id_token)
+
+        with self._lock:
+            self._entries[key] = (claims['exp'], claims)
+            heapq.heappush(self._expiry_heap, (claims['exp'], key))
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return dict(claims)
+
+    # Check the signature and claims of a token that is not in the cache
+    def _decode(self, id_token):
+        try:
+            return jwt.decode(id_token, certs=self._cert_store.get_certs(), audience=self._audience,
+                              clock_skew_in_seconds=self._clock_skew)
+        except ValueError as err:
+            if "Certificate for key id" in str(err):
+                self._cert_store.request_refresh()
+            raise
+
+    # Drop every entry whose token has expired. The heap may hold keys that were already evicted so we only
+    # delete an entry if its expiry matches the one on the heap
+    def _remove_expired(self, now):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            exp, key = heapq.heappop(self._expiry_heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == exp:
+                del self._entries[key]
+
+    # Counters so we can see how well the cache is doing
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries)
+            }